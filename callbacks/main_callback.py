@@ -130,6 +130,21 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.pop('broadcast_outstanding_interest', None)
         context.user_data.pop('broadcast_date_str', None)
         context.user_data.pop('broadcast_weekday_str', None)
+    elif data.startswith("customer_page_"):
+        # 客户贡献报告翻页（管理员功能）
+        if not is_admin:
+            await query.answer("❌ 此功能仅限管理员使用", show_alert=True)
+            return
+        try:
+            customer, page, start_date, end_date = data[len(
+                "customer_page_"):].split("|")
+            from handlers.command_handlers import build_customer_contribution_report
+            report, reply_markup = await build_customer_contribution_report(
+                customer, start_date or None, end_date or None, page=int(page))
+            await query.edit_message_text(report, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"客户贡献报告翻页失败: {e}", exc_info=True)
+            await query.message.reply_text(f"❌ 查询失败: {str(e)}")
     else:
         logger.warning(f"Unhandled callback data: {data}")
         await query.message.reply_text(f"⚠️ 未知的操作: {data}")
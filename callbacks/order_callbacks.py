@@ -107,7 +107,7 @@ async def handle_order_action_callback(update: Update, context: ContextTypes.DEF
 
         # 执行归属变更（单个订单）
         orders = [order]
-        success_count, fail_count = await change_orders_attribution(
+        success_count, fail_count, _ = await change_orders_attribution(
             update, context, orders, new_group_id
         )
 
@@ -383,10 +383,9 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
 
         await query.answer()
         date = get_daily_period_date()
-        records = await db_operations.get_income_records(date, date)
         from handlers.income_handlers import generate_income_report
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, date, date, f"今日收入明细 ({date})", page=1
+            date, date, f"今日收入明细 ({date})", page=1, context=context
         )
 
         keyboard = []
@@ -432,10 +431,10 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
         start_date = now.replace(day=1).strftime("%Y-%m-%d")
         end_date = get_daily_period_date()
 
-        records = await db_operations.get_income_records(start_date, end_date)
         from handlers.income_handlers import generate_income_report
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, start_date, end_date, f"本月收入明细 ({start_date} 至 {end_date})", page=1
+            start_date, end_date, f"本月收入明细 ({start_date} 至 {end_date})", page=1,
+            context=context
         )
 
         keyboard = []
@@ -702,23 +701,6 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
         else:
             start_date = end_date = get_daily_period_date()
 
-        # 查询记录
-        # 如果 final_group 是 'NULL_SPECIAL'，需要特殊处理（查询 group_id IS NULL）
-        if final_group == 'NULL_SPECIAL':
-            # 查询所有记录，然后过滤出 group_id 为 NULL 的
-            all_records = await db_operations.get_income_records(
-                start_date, end_date,
-                type=final_type,
-                group_id=None  # 先不过滤 group_id
-            )
-            records = [r for r in all_records if r.get('group_id') is None]
-        else:
-            records = await db_operations.get_income_records(
-                start_date, end_date,
-                type=final_type,
-                group_id=final_group
-            )
-
         from handlers.income_handlers import generate_income_report
         INCOME_TYPES = {"completed": "订单完成", "breach_end": "违约完成",
                         "interest": "利息收入", "principal_reduction": "本金减少"}
@@ -739,8 +721,11 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
             title += f" ({start_date} 至 {end_date})"
         title += f"\n类型: {type_name} | 归属ID: {group_name}"
 
+        # 'NULL_SPECIAL' 表示只查询全局收入（group_id IS NULL）
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, start_date, end_date, title, page=1, income_type=final_type
+            start_date, end_date, title, page=1, income_type=final_type,
+            group_id=None if final_group == 'NULL_SPECIAL' else final_group,
+            global_only=final_group == 'NULL_SPECIAL', context=context
         )
 
         keyboard = []
@@ -801,26 +786,11 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
         # 处理 group_id
         if group_key == 'all':
             final_group = None  # 不过滤
-        elif group_key == 'NULL':
+        elif group_key in ('NULL', 'NULL_SPECIAL'):
             final_group = 'NULL_SPECIAL'  # 特殊标记
         else:
             final_group = group_key
 
-        # 查询记录
-        if final_group == 'NULL_SPECIAL':
-            all_records = await db_operations.get_income_records(
-                start_date, end_date,
-                type=final_type,
-                group_id=None
-            )
-            records = [r for r in all_records if r.get('group_id') is None]
-        else:
-            records = await db_operations.get_income_records(
-                start_date, end_date,
-                type=final_type,
-                group_id=final_group
-            )
-
         from handlers.income_handlers import generate_income_report
         INCOME_TYPES = {"completed": "订单完成", "breach_end": "违约完成",
                         "interest": "利息收入", "principal_reduction": "本金减少"}
@@ -842,7 +812,9 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
         title += f"\n类型: {type_name} | 归属ID: {group_name}"
 
         report, has_more_pages, total_pages, current_type = await generate_income_report(
-            records, start_date, end_date, title, page=page, income_type=final_type
+            start_date, end_date, title, page=page, income_type=final_type,
+            group_id=None if final_group == 'NULL_SPECIAL' else final_group,
+            global_only=final_group == 'NULL_SPECIAL', context=context
         )
 
         keyboard = []
@@ -879,13 +851,12 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer()
         income_type = data.replace("income_type_", "")
         date = get_daily_period_date()
-        records = await db_operations.get_income_records(date, date, type=income_type)
-
         from handlers.income_handlers import generate_income_report
         type_name = {"completed": "订单完成", "breach_end": "违约完成",
                      "interest": "利息收入", "principal_reduction": "本金减少"}.get(income_type, income_type)
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, date, date, f"今日{type_name}收入 ({date})", page=1, income_type=income_type
+            date, date, f"今日{type_name}收入 ({date})", page=1, income_type=income_type,
+            context=context
         )
 
         keyboard = []
@@ -978,9 +949,6 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
                               '' or income_type is None) else income_type
         callback_type = 'None' if query_type is None else income_type  # 用于回调数据，保持一致性
 
-        # 获取记录
-        records = await db_operations.get_income_records(start_date, end_date, type=query_type)
-
         from handlers.income_handlers import generate_income_report, INCOME_TYPES
         type_name = INCOME_TYPES.get(
             query_type, query_type) if query_type else "全部"
@@ -992,7 +960,7 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
             title = f"{type_name}收入 ({start_date} 至 {end_date})"
 
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, start_date, end_date, title, page=page, income_type=query_type
+            start_date, end_date, title, page=page, income_type=query_type, context=context
         )
 
         # 构建分页按钮
@@ -1077,8 +1045,8 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
             return
 
         # 执行归属变更
-        from handlers.attribution_handlers import change_orders_attribution
-        success_count, fail_count = await change_orders_attribution(
+        from handlers.attribution_handlers import change_orders_attribution, format_attribution_moves
+        success_count, fail_count, moved = await change_orders_attribution(
             update, context, orders, new_group_id
         )
 
@@ -1087,6 +1055,8 @@ async def handle_report_callback(update: Update, context: ContextTypes.DEFAULT_T
             f"成功: {success_count} 个订单\n"
             f"失败: {fail_count} 个订单"
         )
+        if moved:
+            result_msg += f"\n\n{format_attribution_moves(moved, new_group_id)}"
 
         await query.edit_message_text(result_msg)
         await query.answer("✅ 归属变更完成")
@@ -3,6 +3,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import db_operations
+from records import SEARCH_ORDER_COLUMNS
 from utils.message_helpers import display_search_results_helper
 
 logger = logging.getLogger(__name__)
@@ -206,8 +207,8 @@ async def handle_search_callback(update: Update, context: ContextTypes.DEFAULT_T
 
         # 执行归属变更
         try:
-            from handlers.attribution_handlers import change_orders_attribution
-            success_count, fail_count = await change_orders_attribution(
+            from handlers.attribution_handlers import change_orders_attribution, format_attribution_moves
+            success_count, fail_count, moved = await change_orders_attribution(
                 update, context, orders, new_group_id
             )
 
@@ -217,6 +218,8 @@ async def handle_search_callback(update: Update, context: ContextTypes.DEFAULT_T
                 f"失败: {fail_count} 个订单\n\n"
                 f"新归属ID: {new_group_id}"
             )
+            if moved:
+                result_msg += f"\n\n{format_attribution_moves(moved, new_group_id)}"
 
             await query.edit_message_text(result_msg)
             await query.answer("✅ 归属变更完成")
@@ -238,6 +241,7 @@ async def handle_search_callback(update: Update, context: ContextTypes.DEFAULT_T
         elif data.startswith("search_do_group_"):
             criteria['weekday_group'] = data[16:]
 
-        orders = await db_operations.search_orders_advanced(criteria)
+        orders = await db_operations.search_orders_advanced(
+            criteria, columns=SEARCH_ORDER_COLUMNS)
         await display_search_results_helper(update, context, orders)
         return
@@ -0,0 +1,61 @@
+"""pytest 公共夹具：为每个测试准备独立的临时数据库"""
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).parent.absolute()
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """把 db_operations / init_db 指向一个新建的临时数据库
+
+    连接池、执行引擎和各缓存都换成新实例，测试结束后停止写线程并关闭连接，
+    不会读写仓库里的 loan_bot.db。返回 db_operations 模块。
+    """
+    import db_operations
+    import init_db
+
+    db_path = str(tmp_path / 'loan_bot.db')
+    monkeypatch.setattr(init_db, 'DB_NAME', db_path)
+    monkeypatch.setattr(db_operations, 'DB_NAME', db_path)
+    pool = db_operations.ConnectionPool(db_operations.DB_POOL_MAX_CONNECTIONS)
+    engine = db_operations.DatabaseEngine(
+        db_operations.DB_READER_THREADS, db_operations.DB_WRITE_QUEUE_MAX,
+        db_operations.DB_GROUP_COMMIT_MAX)
+    monkeypatch.setattr(db_operations, '_pool', pool)
+    monkeypatch.setattr(db_operations, '_engine', engine)
+    monkeypatch.setattr(db_operations, '_financial_cache', db_operations.FinancialDataCache())
+    monkeypatch.setattr(db_operations, '_order_cache',
+                        db_operations.ActiveOrderCache(db_operations._ORDER_CACHE_SIZE))
+    monkeypatch.setattr(db_operations, '_access_cache', db_operations.AccessCache())
+
+    init_db.init_database()
+    try:
+        yield db_operations
+    finally:
+        engine.shutdown()
+        pool.close()
+
+
+@pytest.fixture
+def stats_snapshot(temp_db):
+    """返回一个协程函数：读取某日期、某归属ID相关的全部统计值，用于比较操作前后的状态"""
+    db = temp_db
+
+    def pick(row: dict, fields) -> dict:
+        return {field: row.get(field) or 0 for field in fields}
+
+    async def snapshot(date: str, group_id: str) -> dict:
+        return {
+            'financial': pick(await db.get_financial_data(), db.STATS_FIELDS),
+            'grouped': pick(await db.get_grouped_data(group_id), db.STATS_FIELDS),
+            'daily': pick(await db.get_daily_data(date), db.DAILY_STATS_FIELDS),
+            'daily_group': pick(await db.get_daily_data(date, group_id), db.DAILY_STATS_FIELDS),
+            'income_rollup': await db.get_income_rollup(date, group_by=('type',)),
+        }
+
+    return snapshot
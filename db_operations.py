@@ -1,47 +1,530 @@
 import sqlite3
 import os
 import asyncio
+import base64
 import json
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import pytz
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Callable, Dict, List, Set, Tuple, Any, Sequence
 from functools import wraps
+from records import OrderRecord, IncomeRecord, ExpenseRecord
+from constants import WEEKDAY_GROUP
 
 # 数据库文件路径
 DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_NAME = os.path.join(DATA_DIR, 'loan_bot.db')
 
-
-def get_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+# 连接池配置（可通过环境变量调整）
+# 池内最多保留的连接数（每个工作线程一条），超出时临时连接用完即关闭
+DB_POOL_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX_CONNECTIONS', '16'))
+# 数据库被锁时的等待时间（毫秒）
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+# 每个连接的页缓存大小（KB）
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+# 内存映射大小（字节），0 表示关闭
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+# 只读查询线程数
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', '4'))
+# 写入队列上限，队列满时提交写入的协程需要等待
+DB_WRITE_QUEUE_MAX = int(os.getenv('DB_WRITE_QUEUE_MAX', '1000'))
+# 一次组提交最多合并的写事务数
+DB_GROUP_COMMIT_MAX = int(os.getenv('DB_GROUP_COMMIT_MAX', '32'))
+
+
+def _open_connection() -> sqlite3.Connection:
+    """打开一个新连接并设置性能相关的PRAGMA"""
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False,
+                           timeout=DB_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    # 负数表示以KB为单位
+    conn.execute(f'PRAGMA cache_size={-DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
 
-def db_transaction(func):
-    """数据库事务装饰器"""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        loop = asyncio.get_running_loop()
+def get_connection():
+    """获取一个独立的数据库连接（调用方负责关闭，供脚本等非装饰器场景使用）"""
+    return _open_connection()
 
-        def sync_work():
-            conn = get_connection()
-            cursor = conn.cursor()
+
+class ConnectionPool:
+    """按线程复用的SQLite连接池
+
+    每个工作线程第一次访问数据库时建立连接并保留下来，之后同一线程的
+    所有查询和事务都复用这条连接，避免反复建立连接和预热页缓存。
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.opened = 0
+        self.reused = 0
+        self.overflow = 0
+
+    @contextmanager
+    def connection(self):
+        """获取当前线程的连接（池已满或已关闭时使用临时连接）"""
+        thread_id = threading.get_ident()
+        conn = self._connections.get(thread_id)
+        if conn is not None:
+            self.reused += 1
+            yield conn
+            return
+
+        conn = _open_connection()
+        with self._lock:
+            pooled = not self._closed and len(
+                self._connections) < self.max_connections
+            if pooled:
+                self._connections[thread_id] = conn
+                self.opened += 1
+            else:
+                self.overflow += 1
+        try:
+            yield conn
+        finally:
+            if not pooled:
+                conn.close()
+
+    def close(self):
+        """关闭池内所有连接，之后的访问将使用临时连接"""
+        with self._lock:
+            self._closed = True
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
             try:
-                result = func(conn, cursor, *args, **kwargs)
-                if result is not False:
-                    conn.commit()
-                return result
-            except Exception as e:
-                conn.rollback()
-                print(f"Database error in {func.__name__}: {e}")
-                return False
-            finally:
                 conn.close()
+            except sqlite3.Error as e:
+                print(f"关闭数据库连接时出错: {e}")
+
+    def stats(self) -> Dict:
+        """获取连接池统计信息"""
+        return {
+            'size': len(self._connections),
+            'max_connections': self.max_connections,
+            'opened': self.opened,
+            'reused': self.reused,
+            'overflow': self.overflow,
+            'closed': self._closed
+        }
+
+
+_pool = ConnectionPool(DB_POOL_MAX_CONNECTIONS)
+
+
+def close_connection_pool():
+    """停止数据库执行引擎并关闭连接池（在机器人停止时调用）"""
+    _engine.shutdown()
+    _pool.close()
+
+
+def get_pool_stats() -> Dict:
+    """获取连接池统计信息"""
+    return _pool.stats()
+
+
+class _WriteJob:
+    __slots__ = ('func', 'args', 'kwargs', 'loop', 'future', 'enqueued_at')
+
+    def __init__(self, func, args, kwargs, loop, future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.loop = loop
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+def _set_future_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class DatabaseEngine:
+    """数据库执行引擎：单写线程 + 只读线程池
+
+    所有写事务进入同一个队列，由唯一的写线程按顺序执行，进程内不再
+    争抢SQLite的写锁。写线程每次取出队列中已排队的多个事务，放在同一个
+    BEGIN IMMEDIATE ... COMMIT 中执行（组提交），每个事务使用独立的
+    SAVEPOINT，返回 False 或抛出异常时只回滚它自己。所有事务在提交
+    之后才向调用方返回结果。
+
+    只读查询在固定大小的线程池中执行，不再占用默认线程池。
+    """
+
+    def __init__(self, reader_threads: int, queue_max: int, group_commit_max: int):
+        self.reader_threads = reader_threads
+        self.group_commit_max = group_commit_max
+        self._queue: 'queue.Queue[Optional[_WriteJob]]' = queue.Queue(maxsize=queue_max)
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self.writes = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.max_queue_depth = 0
+        self.backpressure_waits = 0
+        self.write_wait_ms = 0.0
+        self.write_exec_ms = 0.0
+        self.reads = 0
+        self.reads_in_flight = 0
+        self.max_reads_in_flight = 0
+
+    def _ensure_started(self):
+        if self._writer is not None and self._readers is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run_writer, name='db-writer', daemon=True)
+                self._writer.start()
+            if self._readers is None:
+                self._readers = ThreadPoolExecutor(
+                    max_workers=self.reader_threads, thread_name_prefix='db-reader')
+
+    async def run_read(self, work):
+        """在只读线程池中执行查询"""
+        self._ensure_started()
+        with self._lock:
+            self.reads += 1
+            self.reads_in_flight += 1
+            self.max_reads_in_flight = max(
+                self.max_reads_in_flight, self.reads_in_flight)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._readers, work)
+        finally:
+            with self._lock:
+                self.reads_in_flight -= 1
+
+    async def submit_write(self, func, args, kwargs):
+        """将写事务放入队列，等待其提交后的结果"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        job = _WriteJob(func, args, kwargs, loop, loop.create_future())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # 背压：队列满时在线程中阻塞等待，不阻塞事件循环
+            with self._lock:
+                self.backpressure_waits += 1
+            await loop.run_in_executor(None, self._queue.put, job)
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return await job.future
+
+    def _run_writer(self):
+        conn = _open_connection()
+        # 由写线程显式控制事务边界
+        conn.isolation_level = None
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                stopping = False
+                while len(batch) < self.group_commit_max:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                self._run_batch(conn, batch)
+                if stopping:
+                    break
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: List[_WriteJob]):
+        started = time.monotonic()
+        results = []
+        _reset_tx_state()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for job in batch:
+                results.append(self._run_job(conn, job))
+            conn.execute('COMMIT')
+        except Exception as e:
+            print(f"Database group commit failed ({len(batch)} transactions): {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            results = [False] * len(batch)
+        finally:
+            # 提交或回滚之后再失效，保证之后的读取看到已提交的数据
+            _flush_tx_invalidations()
+
+        finished = time.monotonic()
+        with self._lock:
+            self.writes += len(batch)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+            self.write_exec_ms += (finished - started) * 1000
+            self.write_wait_ms += sum(
+                (started - job.enqueued_at) * 1000 for job in batch)
+        for job, result in zip(batch, results):
+            try:
+                job.loop.call_soon_threadsafe(
+                    _set_future_result, job.future, result)
+            except RuntimeError:
+                # 调用方的事件循环已关闭
+                pass
+
+    @staticmethod
+    def _run_job(conn: sqlite3.Connection, job: _WriteJob):
+        conn.execute('SAVEPOINT write_job')
+        cursor = conn.cursor()
+        try:
+            result = job.func(conn, cursor, *job.args, **job.kwargs)
+        except sqlite3.OperationalError as e:
+            if not conn.in_transaction:
+                # 事务已被 SQLite 中止，整批回滚
+                raise
+            print(f"Database error in {job.func.__name__}: {e}")
+            result = False
+        except Exception as e:
+            print(f"Database error in {job.func.__name__}: {e}")
+            result = False
+        finally:
+            cursor.close()
+        if result is False:
+            conn.execute('ROLLBACK TO write_job')
+        conn.execute('RELEASE write_job')
+        return result
+
+    def shutdown(self):
+        """处理完已排队的写事务后停止写线程和只读线程池"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+            readers, self._readers = self._readers, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        if readers is not None:
+            readers.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        """获取执行引擎统计信息（队列深度等背压指标）"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max': self._queue.maxsize,
+            'max_queue_depth': self.max_queue_depth,
+            'backpressure_waits': self.backpressure_waits,
+            'writes': self.writes,
+            'batches': self.batches,
+            'avg_batch': self.writes / self.batches if self.batches else 0.0,
+            'max_batch': self.max_batch,
+            'avg_write_wait_ms': self.write_wait_ms / self.writes if self.writes else 0.0,
+            'avg_batch_exec_ms': self.write_exec_ms / self.batches if self.batches else 0.0,
+            'reads': self.reads,
+            'reads_in_flight': self.reads_in_flight,
+            'max_reads_in_flight': self.max_reads_in_flight,
+            'reader_threads': self.reader_threads
+        }
+
+
+_engine = DatabaseEngine(DB_READER_THREADS, DB_WRITE_QUEUE_MAX, DB_GROUP_COMMIT_MAX)
+
+
+def get_engine_stats() -> Dict:
+    """获取数据库执行引擎统计信息"""
+    return _engine.stats()
+
+
+class FinancialDataCache:
+    """全局财务数据（financial_data 最新一行）的进程内缓存
+
+    写入 financial_data 的事务结束后使缓存失效并递增版本号。
+    读取方在查询前记下版本号，只有版本号未变时才写回缓存，
+    避免并发写入期间把旧数据放回缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict] = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> Optional[Dict]:
+        """返回缓存数据的副本，未缓存时返回 None"""
+        with self._lock:
+            if self._snapshot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(self._snapshot)
+
+    def store(self, data: Dict, version: int):
+        """写回缓存（查询期间发生过写入则放弃）"""
+        with self._lock:
+            if version == self.version:
+                self._snapshot = dict(data)
+
+    def invalidate(self):
+        """使缓存失效并递增版本号"""
+        with self._lock:
+            self._snapshot = None
+            self.version += 1
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        return {
+            'cached': self._snapshot is not None,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
 
-        return await loop.run_in_executor(None, sync_work)
+_financial_cache = FinancialDataCache()
+
+# 记录当前线程的事务修改了哪些缓存数据，事务结束后据此使缓存失效
+_tx_state = threading.local()
+
+
+def _mark_financial_data_dirty():
+    """标记当前事务修改了 financial_data"""
+    _tx_state.financial_dirty = True
+
+
+def invalidate_financial_data_cache():
+    """使财务数据缓存失效（其他进程或脚本直接修改数据库后调用）"""
+    _financial_cache.invalidate()
+
+
+def get_financial_data_version() -> int:
+    """获取财务数据版本号（每次写入 financial_data 后递增）"""
+    return _financial_cache.version
+
+
+def get_financial_cache_stats() -> Dict:
+    """获取财务数据缓存统计信息"""
+    return _financial_cache.stats()
+
+
+class ActiveOrderCache:
+    """按 chat_id 缓存进行中的订单（LRU，容量有限）
+
+    “该群没有进行中的订单”同样会被缓存。修改 orders 的事务结束后
+    使相关 chat_id 失效；无法确定 chat_id 的修改（如按 order_id 删除）
+    会清空整个缓存。版本号的用法与 FinancialDataCache 相同。
+    """
+
+    def __init__(self, max_size: int):
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[int, Optional[OrderRecord]]' = OrderedDict()
+        self.max_size = max_size
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id: int) -> Tuple[bool, Optional[OrderRecord]]:
+        """返回 (是否命中, 订单副本)"""
+        with self._lock:
+            if chat_id not in self._entries:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            order = self._entries[chat_id]
+            return True, (order.clone() if order is not None else None)
+
+    def store(self, chat_id: int, order: Optional[OrderRecord], version: int):
+        """写回缓存（查询期间发生过写入则放弃）"""
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[chat_id] = order.clone() if order is not None else None
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, chat_ids: Optional[Set[int]] = None):
+        """使指定 chat_id（为 None 时全部）失效并递增版本号"""
+        with self._lock:
+            if chat_ids is None:
+                self._entries.clear()
+            else:
+                for chat_id in chat_ids:
+                    self._entries.pop(chat_id, None)
+            self.version += 1
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+_ORDER_CACHE_SIZE = 2048
+_order_cache = ActiveOrderCache(_ORDER_CACHE_SIZE)
+
+
+def _mark_orders_dirty(chat_id: Optional[int] = None):
+    """标记当前事务修改了 orders（chat_id 为 None 表示无法确定，清空缓存）"""
+    if chat_id is None:
+        _tx_state.all_orders_dirty = True
+    else:
+        _tx_state.dirty_chat_ids.add(chat_id)
+
+
+def invalidate_order_cache(chat_id: Optional[int] = None):
+    """使进行中订单缓存失效（chat_id 为 None 时清空）"""
+    _order_cache.invalidate(None if chat_id is None else {chat_id})
+
+
+def get_order_cache_stats() -> Dict:
+    """获取进行中订单缓存统计信息"""
+    return _order_cache.stats()
+
+
+def _reset_tx_state():
+    _tx_state.financial_dirty = False
+    _tx_state.all_orders_dirty = False
+    _tx_state.dirty_chat_ids = set()
+
+
+def _flush_tx_invalidations():
+    """事务结束后使被修改数据的缓存失效"""
+    if _tx_state.financial_dirty:
+        _financial_cache.invalidate()
+    if _tx_state.all_orders_dirty:
+        _order_cache.invalidate()
+    elif _tx_state.dirty_chat_ids:
+        _order_cache.invalidate(_tx_state.dirty_chat_ids)
+    _reset_tx_state()
+
+
+def db_transaction(func):
+    """数据库事务装饰器（交给写线程执行，返回 False 或出错时回滚）"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await _engine.submit_write(func, args, kwargs)
     return wrapper
 
 
@@ -49,28 +532,40 @@ def db_query(func):
     """数据库查询装饰器"""
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        loop = asyncio.get_running_loop()
-
         def sync_work():
-            conn = get_connection()
-            cursor = conn.cursor()
-            try:
-                return func(conn, cursor, *args, **kwargs)
-            except Exception as e:
-                print(f"Database query error in {func.__name__}: {e}")
-                raise e
-            finally:
-                conn.close()
-
-        return await loop.run_in_executor(None, sync_work)
+            with _pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    return func(conn, cursor, *args, **kwargs)
+                except Exception as e:
+                    print(f"Database query error in {func.__name__}: {e}")
+                    raise e
+                finally:
+                    cursor.close()
+                    # 连接会被复用，不能留下未结束的事务
+                    if conn.in_transaction:
+                        conn.rollback()
+
+        return await _engine.run_read(sync_work)
     return wrapper
 
+# 启动时检查查询计划，渲染 f-string SQL 用到的局部变量示例值（见 utils/db_helpers.audit_query_plans）
+QUERY_PLAN_SAMPLES = {
+    # 订单、收入明细、收入汇总最常见的条件是按日期范围查询
+    'where_clause': 'date >= ? AND date <= ?',
+    'placeholders': '?, ?',
+    'type_placeholders': '?, ?',
+    'columns': None,
+    'select_dims': '',
+    'group_clause': '',
+}
+
 # ========== 订单操作 ==========
 
 
-@db_transaction
-def create_order(conn, cursor, order_data: Dict) -> bool:
-    """创建新订单"""
+def _insert_order(cursor, order_data: Dict) -> bool:
+    """在当前事务中插入订单，订单重复（唯一约束冲突）时返回 False"""
+    _mark_orders_dirty(order_data['chat_id'])
     try:
         cursor.execute('''
         INSERT INTO orders (
@@ -93,26 +588,68 @@ def create_order(conn, cursor, order_data: Dict) -> bool:
         return False
 
 
+@db_transaction
+def create_order(conn, cursor, order_data: Dict) -> bool:
+    """创建新订单"""
+    return _insert_order(cursor, order_data)
+
+
+@db_transaction
+def create_order_with_stats(conn, cursor, order_data: Dict,
+                            global_deltas: Dict[str, float],
+                            daily_deltas: Dict[Tuple[str, Optional[str]], Dict[str, float]],
+                            grouped_deltas: Dict[str, Dict[str, float]],
+                            operation: Optional[Dict] = None) -> Optional[Dict]:
+    """在一个事务中创建订单：订单、统计数据和操作历史
+
+    订单重复（唯一约束冲突）时不做任何修改，返回 None。
+
+    参数:
+        operation: record_operation 的参数（不需要记录操作历史时为 None）
+
+    返回:
+        {'operation_id': 操作ID或None}
+    """
+    if not _insert_order(cursor, order_data):
+        return None
+    _apply_stats_deltas(cursor, global_deltas, daily_deltas, grouped_deltas)
+    operation_id = _insert_operation(cursor, **operation) if operation else None
+    return {'operation_id': operation_id}
+
+
+async def get_order_by_chat_id(chat_id: int) -> Optional[OrderRecord]:
+    """根据chat_id获取进行中的订单（优先读取缓存）"""
+    hit, order = _order_cache.get(chat_id)
+    if hit:
+        return order
+
+    version = _order_cache.version
+    order = await _load_order_by_chat_id(chat_id)
+    _order_cache.store(chat_id, order, version)
+    return order
+
+
 @db_query
-def get_order_by_chat_id(conn, cursor, chat_id: int) -> Optional[Dict]:
-    """根据chat_id获取订单"""
+def _load_order_by_chat_id(conn, cursor, chat_id: int) -> Optional[OrderRecord]:
+    """从数据库读取chat_id对应的进行中订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('SELECT * FROM orders WHERE chat_id = ? AND state NOT IN (?, ?)',
                    (chat_id, 'end', 'breach_end'))
-    row = cursor.fetchone()
-    return dict(row) if row else None
+    return cursor.fetchone()
 
 
 @db_query
-def get_order_by_order_id(conn, cursor, order_id: str) -> Optional[Dict]:
+def get_order_by_order_id(conn, cursor, order_id: str) -> Optional[OrderRecord]:
     """根据order_id获取订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,))
-    row = cursor.fetchone()
-    return dict(row) if row else None
+    return cursor.fetchone()
 
 
 @db_transaction
 def update_order_amount(conn, cursor, chat_id: int, new_amount: float) -> bool:
     """更新订单金额"""
+    _mark_orders_dirty(chat_id)
     cursor.execute('''
     UPDATE orders 
     SET amount = ?, updated_at = CURRENT_TIMESTAMP
@@ -124,6 +661,7 @@ def update_order_amount(conn, cursor, chat_id: int, new_amount: float) -> bool:
 @db_transaction
 def update_order_state(conn, cursor, chat_id: int, new_state: str) -> bool:
     """更新订单状态"""
+    _mark_orders_dirty(chat_id)
     cursor.execute('''
     UPDATE orders 
     SET state = ?, updated_at = CURRENT_TIMESTAMP
@@ -132,9 +670,49 @@ def update_order_state(conn, cursor, chat_id: int, new_state: str) -> bool:
     return cursor.rowcount > 0
 
 
+@db_transaction
+def apply_order_transition(conn, cursor, chat_id: int, from_state: str, to_state: str,
+                           global_deltas: Dict[str, float],
+                           daily_deltas: Dict[Tuple[str, Optional[str]], Dict[str, float]],
+                           grouped_deltas: Dict[str, Dict[str, float]],
+                           income: Optional[Dict] = None,
+                           operation: Optional[Dict] = None) -> Optional[Dict]:
+    """在一个事务中完成订单状态变更：订单状态、收入明细、统计数据和操作历史
+
+    订单当前状态不是 from_state（已被其他操作修改）时不做任何修改，返回 None。
+
+    参数:
+        income: record_income 的参数（不需要记录收入时为 None）
+        operation: record_operation 的参数（不需要记录操作历史时为 None）
+
+    返回:
+        {'income_id': 收入明细ID或None, 'operation_id': 操作ID或None}
+    """
+    cursor.execute('''
+    UPDATE orders
+    SET state = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE chat_id = ? AND state = ?
+    ''', (to_state, chat_id, from_state))
+    if cursor.rowcount == 0:
+        return None
+    _mark_orders_dirty(chat_id)
+
+    income_id = _insert_income(cursor, **income) if income else None
+    _apply_stats_deltas(cursor, global_deltas, daily_deltas, grouped_deltas)
+    operation_id = None
+    if operation:
+        if income_id is not None:
+            # 撤销时据此删除对应的收入明细
+            operation = dict(operation, operation_data=dict(
+                operation['operation_data'], income_record_id=income_id))
+        operation_id = _insert_operation(cursor, **operation)
+    return {'income_id': income_id, 'operation_id': operation_id}
+
+
 @db_transaction
 def update_order_group_id(conn, cursor, chat_id: int, new_group_id: str) -> bool:
     """更新订单归属ID"""
+    _mark_orders_dirty(chat_id)
     cursor.execute('''
     UPDATE orders 
     SET group_id = ?, updated_at = CURRENT_TIMESTAMP
@@ -143,9 +721,92 @@ def update_order_group_id(conn, cursor, chat_id: int, new_group_id: str) -> bool
     return cursor.rowcount > 0
 
 
+@db_transaction
+def change_orders_group_id(conn, cursor, chat_ids: List[int], new_group_id: str,
+                           stats_date: str) -> Dict:
+    """批量修改订单归属并迁移统计数据（同一事务，要么全部生效，要么全部回滚）
+
+    订单状态和金额以事务内读到的数据为准：有效订单（normal/overdue）迁移
+    全局/分组的有效统计，违约订单（breach）同时迁移 stats_date 当天的日结统计，
+    已完成/违约完成的订单只改归属ID。
+
+    返回:
+        {'updated': 更新的订单行数（同一群组可能有多条历史订单）, 'missing': 未找到的chat_id列表,
+         'moved': {旧归属ID: {'orders', 'valid_orders', 'valid_amount',
+                              'breach_orders', 'breach_amount'}}}
+    """
+    unique_ids = list(dict.fromkeys(chat_ids))
+    rows = []
+    for start in range(0, len(unique_ids), _IN_CLAUSE_BATCH_SIZE):
+        batch = unique_ids[start:start + _IN_CLAUSE_BATCH_SIZE]
+        placeholders = ','.join('?' * len(batch))
+        cursor.execute(f'''
+        SELECT chat_id, group_id, state, amount FROM orders
+        WHERE chat_id IN ({placeholders})
+        ''', batch)
+        rows.extend(cursor.fetchall())
+
+        cursor.execute(f'''
+        UPDATE orders
+        SET group_id = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE chat_id IN ({placeholders})
+        ''', [new_group_id, *batch])
+
+    found = {row['chat_id'] for row in rows}
+    moved = {}
+    daily_deltas = {}
+    grouped_deltas = {}
+
+    def add(bucket, field, value):
+        bucket[field] = bucket.get(field, 0) + value
+
+    for row in rows:
+        old_group_id = row['group_id']
+        state = row['state']
+        amount = row['amount'] or 0
+        summary = moved.setdefault(old_group_id, {
+            'orders': 0, 'valid_orders': 0, 'valid_amount': 0,
+            'breach_orders': 0, 'breach_amount': 0})
+        summary['orders'] += 1
+
+        if old_group_id == new_group_id:
+            continue
+        if state in ('normal', 'overdue'):
+            prefix = 'valid'
+        elif state == 'breach':
+            prefix = 'breach'
+        else:
+            continue
+
+        summary[f'{prefix}_orders'] += 1
+        summary[f'{prefix}_amount'] += amount
+        for group_id, sign in ((old_group_id, -1), (new_group_id, 1)):
+            grouped = grouped_deltas.setdefault(group_id, {})
+            add(grouped, f'{prefix}_orders', sign)
+            add(grouped, f'{prefix}_amount', sign * amount)
+            if prefix == 'breach':
+                # 违约统计按日结记录（与 update_all_stats 的规则一致），全局日结一增一减相互抵消
+                daily = daily_deltas.setdefault((stats_date, group_id), {})
+                add(daily, 'breach_orders', sign)
+                add(daily, 'breach_amount', sign * amount)
+
+    # 全局统计一增一减相互抵消，只保留非零增量
+    grouped_deltas = {g: {f: v for f, v in d.items() if v} for g, d in grouped_deltas.items()}
+    daily_deltas = {k: {f: v for f, v in d.items() if v} for k, d in daily_deltas.items()}
+    _apply_stats_deltas(cursor, {}, daily_deltas, grouped_deltas)
+    _mark_orders_dirty()
+
+    return {
+        'updated': len(rows),
+        'missing': [chat_id for chat_id in unique_ids if chat_id not in found],
+        'moved': moved,
+    }
+
+
 @db_transaction
 def update_order_weekday_group(conn, cursor, chat_id: int, new_weekday_group: str) -> bool:
     """更新订单星期分组"""
+    _mark_orders_dirty(chat_id)
     cursor.execute('''
     UPDATE orders 
     SET weekday_group = ?, updated_at = CURRENT_TIMESTAMP
@@ -154,9 +815,81 @@ def update_order_weekday_group(conn, cursor, chat_id: int, new_weekday_group: st
     return cursor.rowcount > 0
 
 
+def _parse_order_weekday_date(order_id: str, date_str: Optional[str]):
+    """确定订单星期分组所依据的日期：优先取订单号中的日期（A250101xx / 250101xx），其次取date字段"""
+    if order_id:
+        digits = order_id[1:7] if order_id.startswith('A') else order_id[:6]
+        if len(digits) == 6 and digits.isdigit():
+            try:
+                return datetime.strptime(f"20{digits}", "%Y%m%d").date()
+            except ValueError:
+                pass
+    if date_str:
+        try:
+            return datetime.strptime(date_str.split()[0], "%Y-%m-%d").date()
+        except ValueError:
+            pass
+    return None
+
+
+@db_query
+def _find_weekday_group_changes(conn, cursor) -> Tuple[List[Tuple[str, int, str]], int, int]:
+    """计算分组不一致的订单，返回 ([(正确分组, id, 当前分组)], 订单总数, 无法解析日期的订单数)"""
+    cursor.execute('SELECT id, order_id, date, weekday_group FROM orders')
+    rows = cursor.fetchall()
+
+    changes = []
+    skipped = 0
+    for row_id, order_id, date_str, weekday_group in rows:
+        order_date = _parse_order_weekday_date(order_id, date_str)
+        if order_date is None:
+            skipped += 1
+            continue
+        correct = WEEKDAY_GROUP[order_date.weekday()]
+        if correct != weekday_group:
+            changes.append((correct, row_id, weekday_group))
+    return changes, len(rows), skipped
+
+
+@db_transaction
+def _apply_weekday_group_changes(conn, cursor, changes: List[Tuple[str, int, str]]) -> int:
+    """写入分组修正（计算之后分组又被修改过的订单跳过），返回更新的订单数"""
+    _mark_orders_dirty()
+    cursor.executemany('''
+    UPDATE orders
+    SET weekday_group = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND weekday_group IS ?
+    ''', changes)
+    return cursor.rowcount
+
+
+async def repair_weekday_groups(dry_run: bool = False) -> Dict:
+    """批量修正所有订单的星期分组
+
+    在只读线程中一次查询取出全部订单，在Python中按日期计算正确分组，
+    只把分组不一致的订单交给写线程执行一次 executemany 更新，
+    读取全表期间不占用写线程。dry_run=True 时只统计不修改；写入失败返回 False。
+    """
+    changes, total, skipped = await _find_weekday_group_changes()
+    updated = len(changes)
+    if changes and not dry_run:
+        updated = await _apply_weekday_group_changes(changes)
+        if updated is False:
+            return False
+
+    return {
+        'total': total,
+        'updated': updated,
+        'unchanged': total - len(changes) - skipped,
+        'skipped': skipped,
+        'dry_run': dry_run,
+    }
+
+
 @db_transaction
 def delete_order_by_chat_id(conn, cursor, chat_id: int) -> bool:
     """删除订单（用于撤销订单创建）"""
+    _mark_orders_dirty(chat_id)
     cursor.execute('DELETE FROM orders WHERE chat_id = ?', (chat_id,))
     return cursor.rowcount > 0
 
@@ -164,6 +897,7 @@ def delete_order_by_chat_id(conn, cursor, chat_id: int) -> bool:
 @db_transaction
 def delete_order_by_order_id(conn, cursor, order_id: str) -> bool:
     """根据订单ID删除订单"""
+    _mark_orders_dirty()
     cursor.execute('DELETE FROM orders WHERE order_id = ?', (order_id,))
     return cursor.rowcount > 0
 
@@ -171,8 +905,9 @@ def delete_order_by_order_id(conn, cursor, order_id: str) -> bool:
 
 
 @db_query
-def search_orders_by_group_id(conn, cursor, group_id: str, state: Optional[str] = None) -> List[Dict]:
+def search_orders_by_group_id(conn, cursor, group_id: str, state: Optional[str] = None) -> List[OrderRecord]:
     """根据归属ID查找订单"""
+    cursor.row_factory = OrderRecord.row_factory
     if state:
         cursor.execute('SELECT * FROM orders WHERE group_id = ? AND state = ? ORDER BY date DESC',
                        (group_id, state))
@@ -180,137 +915,291 @@ def search_orders_by_group_id(conn, cursor, group_id: str, state: Optional[str]
         # 默认排除完成和违约完成的订单
         cursor.execute(
             "SELECT * FROM orders WHERE group_id = ? AND state NOT IN ('end', 'breach_end') ORDER BY date DESC", (group_id,))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def search_orders_by_date_range(conn, cursor, start_date: str, end_date: str) -> List[Dict]:
+def search_orders_by_date_range(conn, cursor, start_date: str, end_date: str) -> List[OrderRecord]:
     """根据日期范围查找订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('''
     SELECT * FROM orders 
     WHERE date >= ? AND date <= ?
     ORDER BY date DESC
     ''', (start_date, end_date))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def search_orders_by_customer(conn, cursor, customer: str) -> List[Dict]:
+def search_orders_by_customer(conn, cursor, customer: str) -> List[OrderRecord]:
     """根据客户类型查找订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute(
         'SELECT * FROM orders WHERE customer = ? ORDER BY date DESC', (customer.upper(),))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def search_orders_by_state(conn, cursor, state: str) -> List[Dict]:
+def search_orders_by_state(conn, cursor, state: str) -> List[OrderRecord]:
     """根据状态查找订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute(
         'SELECT * FROM orders WHERE state = ? ORDER BY date DESC', (state,))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def search_orders_all(conn, cursor) -> List[Dict]:
+def search_orders_all(conn, cursor) -> List[OrderRecord]:
     """查找所有订单"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('SELECT * FROM orders ORDER BY date DESC')
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
-@db_query
-def search_orders_advanced(conn, cursor, criteria: Dict) -> List[Dict]:
-    """
-    高级查找订单（支持混合条件）
-    """
-    query = "SELECT * FROM orders WHERE 1=1"
+def _build_order_criteria(criteria: Dict, all_states: bool) -> Tuple[str, List]:
+    """根据查找条件构建订单查询的 WHERE 子句和参数"""
+    conditions = []
     params = []
 
     if 'group_id' in criteria and criteria['group_id']:
-        query += " AND group_id = ?"
+        conditions.append("group_id = ?")
         params.append(criteria['group_id'])
 
     if 'state' in criteria and criteria['state']:
-        query += " AND state = ?"
+        conditions.append("state = ?")
         params.append(criteria['state'])
-    else:
+    elif not all_states:
         # 默认只查找有效订单（normal和overdue状态）
-        query += " AND state IN ('normal', 'overdue')"
+        conditions.append("state IN ('normal', 'overdue')")
 
     if 'customer' in criteria and criteria['customer']:
-        query += " AND customer = ?"
+        conditions.append("customer = ?")
         params.append(criteria['customer'])
 
     if 'order_id' in criteria and criteria['order_id']:
-        query += " AND order_id = ?"
+        conditions.append("order_id = ?")
         params.append(criteria['order_id'])
 
     if 'date_range' in criteria and criteria['date_range']:
         start_date, end_date = criteria['date_range']
-        query += " AND date >= ? AND date <= ?"
+        conditions.append("date >= ? AND date <= ?")
         params.extend([start_date, end_date])
 
     if 'weekday_group' in criteria and criteria['weekday_group']:
-        query += " AND weekday_group = ?"
+        conditions.append("weekday_group = ?")
         params.append(criteria['weekday_group'])
 
-    query += " ORDER BY date DESC"
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    return where_clause, params
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+
+@db_query
+def search_orders_advanced(conn, cursor, criteria: Dict,
+                           columns: Optional[Sequence[str]] = None) -> List[OrderRecord]:
+    """
+    高级查找订单（支持混合条件）
+
+    columns: 只查询这些列（为空时查询全部列）
+    """
+    cursor.row_factory = OrderRecord.row_factory
+    where_clause, params = _build_order_criteria(criteria, all_states=False)
+    cursor.execute(
+        f"SELECT {OrderRecord.select_list(columns)} FROM orders WHERE {where_clause} ORDER BY date DESC",
+        params)
+    return cursor.fetchall()
 
 
 @db_query
-def search_orders_advanced_all_states(conn, cursor, criteria: Dict) -> List[Dict]:
+def search_orders_advanced_all_states(conn, cursor, criteria: Dict,
+                                      columns: Optional[Sequence[str]] = None) -> List[OrderRecord]:
     """
     高级查找订单（支持混合条件，包含所有状态的订单）
     用于报表查找功能
+
+    columns: 只查询这些列（为空时查询全部列）
     """
-    query = "SELECT * FROM orders WHERE 1=1"
-    params = []
+    cursor.row_factory = OrderRecord.row_factory
+    where_clause, params = _build_order_criteria(criteria, all_states=True)
+    cursor.execute(
+        f"SELECT {OrderRecord.select_list(columns)} FROM orders WHERE {where_clause} ORDER BY date DESC",
+        params)
+    return cursor.fetchall()
 
-    if 'group_id' in criteria and criteria['group_id']:
-        query += " AND group_id = ?"
-        params.append(criteria['group_id'])
 
-    if 'state' in criteria and criteria['state']:
-        query += " AND state = ?"
-        params.append(criteria['state'])
+def encode_page_token(*values) -> str:
+    """把分页位置（排序键的值）编码为不透明的续页令牌"""
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
 
-    if 'customer' in criteria and criteria['customer']:
-        query += " AND customer = ?"
-        params.append(criteria['customer'])
 
-    if 'order_id' in criteria and criteria['order_id']:
-        query += " AND order_id = ?"
-        params.append(criteria['order_id'])
+def decode_page_token(token: str) -> List:
+    """解析续页令牌，令牌无效时抛出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页令牌: {token}") from e
 
-    if 'date_range' in criteria and criteria['date_range']:
-        start_date, end_date = criteria['date_range']
-        query += " AND date >= ? AND date <= ?"
-        params.extend([start_date, end_date])
 
-    if 'weekday_group' in criteria and criteria['weekday_group']:
-        query += " AND weekday_group = ?"
-        params.append(criteria['weekday_group'])
+@db_query
+def search_orders_page(conn, cursor, criteria: Dict, limit: int = 50,
+                       page_token: Optional[str] = None, all_states: bool = False) -> Dict:
+    """
+    分页查找订单（按日期倒序的键集分页）
 
-    query += " ORDER BY date DESC"
+    参数:
+        criteria: 查找条件（同 search_orders_advanced）
+        limit: 每页订单数
+        page_token: 上一页返回的 next_token，为空表示第一页
+        all_states: 是否包含所有状态的订单
 
-    cursor.execute(query, params)
+    返回:
+        {
+            'orders': 当前页订单,
+            'next_token': 下一页令牌（没有更多时为 None）,
+            'total_count': 匹配的订单总数,
+            'total_amount': 匹配的订单总金额
+        }
+    """
+    where_clause, params = _build_order_criteria(criteria, all_states)
+
+    cursor.execute(f'''
+    SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM orders WHERE {where_clause}
+    ''', params)
+    total_count, total_amount = cursor.fetchone()
+
+    page_params = list(params)
+    if page_token:
+        where_clause += " AND (date, id) < (?, ?)"
+        page_params.extend(decode_page_token(page_token))
+
+    # 多取一条用于判断是否还有下一页
+    cursor.row_factory = OrderRecord.row_factory
+    cursor.execute(f'''
+    SELECT * FROM orders WHERE {where_clause}
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    ''', page_params + [limit + 1])
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+
+    next_token = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_token = encode_page_token(rows[-1]['date'], rows[-1]['id'])
+
+    return {
+        'orders': rows,
+        'next_token': next_token,
+        'total_count': total_count,
+        'total_amount': total_amount
+    }
+
+# ========== 统计字段累加 ==========
+
+# financial_data / grouped_data 可累加的统计字段
+STATS_FIELDS = (
+    'valid_orders', 'valid_amount', 'liquid_funds',
+    'new_clients', 'new_clients_amount',
+    'old_clients', 'old_clients_amount',
+    'interest', 'completed_orders', 'completed_amount',
+    'breach_orders', 'breach_amount',
+    'breach_end_orders', 'breach_end_amount'
+)
+
+# daily_data 可累加的统计字段
+DAILY_STATS_FIELDS = (
+    'new_clients', 'new_clients_amount',
+    'old_clients', 'old_clients_amount',
+    'interest', 'completed_orders', 'completed_amount',
+    'breach_orders', 'breach_amount',
+    'breach_end_orders', 'breach_end_amount',
+    'liquid_flow', 'company_expenses', 'other_expenses'
+)
+
+# 各统计表的UPSERT定位方式：(键列, 键值表达式, 冲突目标)
+# financial_data 只使用最新一行，通过主键冲突更新；表为空时 id 为 NULL，自动插入新行
+_FINANCIAL_KEY = (('id',), ('(SELECT id FROM financial_data ORDER BY id DESC LIMIT 1)',), 'id')
+_GROUPED_KEY = (('group_id',), ('?',), 'group_id')
+# 全局日结行 group_id 为 NULL，依赖 init_db 中的表达式唯一索引 (date, IFNULL(group_id, ''))
+_DAILY_KEY = (('date', 'group_id'), ('?', '?'), "date, IFNULL(group_id, '')")
+
+
+def _upsert_increment(cursor, table: str, key: Tuple, key_params: Tuple,
+                      deltas: Dict[str, float], allowed_fields: Tuple[str, ...]):
+    """用单条 INSERT ... ON CONFLICT DO UPDATE 原子累加字段，返回更新后的字段值"""
+    for field in deltas:
+        if field not in allowed_fields:
+            raise ValueError(f"未知的统计字段: {field}")
+
+    key_columns, key_exprs, conflict_target = key
+    fields = list(deltas)
+    columns = ", ".join(list(key_columns) + [f'"{f}"' for f in fields])
+    values = ", ".join(list(key_exprs) + ["?"] * len(fields))
+    set_clause = ", ".join(f'"{f}" = "{f}" + excluded."{f}"' for f in fields)
+    returning = ", ".join(f'"{f}"' for f in fields)
+
+    cursor.execute(f'''
+    INSERT INTO {table} ({columns}) VALUES ({values})
+    ON CONFLICT({conflict_target}) DO UPDATE
+    SET {set_clause}, updated_at = CURRENT_TIMESTAMP
+    RETURNING {returning}
+    ''', list(key_params) + [deltas[f] for f in fields])
+    return cursor.fetchone()
+
+
+def _apply_stats_deltas(cursor, global_deltas: Dict[str, float],
+                        daily_deltas: Dict[Tuple[str, Optional[str]], Dict[str, float]],
+                        grouped_deltas: Dict[str, Dict[str, float]]):
+    """在当前事务中累加统计增量（不提交，供其他事务函数复用）
+
+    参数:
+        global_deltas: {字段: 增量}，作用于 financial_data
+        daily_deltas: {(日期, 归属ID或None): {字段: 增量}}，作用于 daily_data
+        grouped_deltas: {归属ID: {字段: 增量}}，作用于 grouped_data
+    """
+    if global_deltas:
+        _mark_financial_data_dirty()
+        _upsert_increment(cursor, 'financial_data', _FINANCIAL_KEY, (),
+                          global_deltas, STATS_FIELDS)
+
+    for (date, group_id), deltas in daily_deltas.items():
+        if deltas:
+            _upsert_increment(cursor, 'daily_data', _DAILY_KEY, (date, group_id),
+                              deltas, DAILY_STATS_FIELDS)
+
+    for group_id, deltas in grouped_deltas.items():
+        if deltas:
+            _upsert_increment(cursor, 'grouped_data', _GROUPED_KEY, (group_id,),
+                              deltas, STATS_FIELDS)
+
+
+@db_transaction
+def apply_stats_deltas(conn, cursor, global_deltas: Dict[str, float],
+                       daily_deltas: Dict[Tuple[str, Optional[str]], Dict[str, float]],
+                       grouped_deltas: Dict[str, Dict[str, float]]) -> bool:
+    """在一个事务中批量更新全局、日结和分组统计（一次连接、一次提交）"""
+    _apply_stats_deltas(cursor, global_deltas, daily_deltas, grouped_deltas)
+    return True
+
 
 # ========== 财务数据操作 ==========
 
 
+async def get_financial_data() -> Dict:
+    """获取全局财务数据（优先读取进程内缓存）"""
+    cached = _financial_cache.get()
+    if cached is not None:
+        return cached
+
+    version = _financial_cache.version
+    data = await _load_financial_data()
+    _financial_cache.store(data, version)
+    return data
+
+
 @db_query
-def get_financial_data(conn, cursor) -> Dict:
-    """获取全局财务数据"""
+def _load_financial_data(conn, cursor) -> Dict:
+    """从数据库读取全局财务数据"""
     cursor.execute('SELECT * FROM financial_data ORDER BY id DESC LIMIT 1')
     row = cursor.fetchone()
     if row:
@@ -334,33 +1223,12 @@ def get_financial_data(conn, cursor) -> Dict:
 
 
 @db_transaction
-def update_financial_data(conn, cursor, field: str, amount: float) -> bool:
-    """更新财务数据字段"""
-    cursor.execute('SELECT * FROM financial_data ORDER BY id DESC LIMIT 1')
-    row = cursor.fetchone()
-    if not row:
-        cursor.execute('''
-        INSERT INTO financial_data (
-            valid_orders, valid_amount, liquid_funds,
-            new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount
-        ) VALUES (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        ''')
-        current_value = 0
-    else:
-        row_dict = dict(row)
-        current_value = row_dict.get(field, 0)
-
-    new_value = current_value + amount
-    cursor.execute(f'''
-    UPDATE financial_data 
-    SET "{field}" = ?, updated_at = CURRENT_TIMESTAMP
-    WHERE id = (SELECT id FROM financial_data ORDER BY id DESC LIMIT 1)
-    ''', (new_value,))
-    return True
+def update_financial_data(conn, cursor, field: str, amount: float) -> float:
+    """更新财务数据字段（原子累加），返回更新后的值"""
+    _mark_financial_data_dirty()
+    row = _upsert_increment(cursor, 'financial_data', _FINANCIAL_KEY, (),
+                            {field: amount}, STATS_FIELDS)
+    return row[0]
 
 # ========== 分组数据操作 ==========
 
@@ -402,35 +1270,11 @@ def get_grouped_data(conn, cursor, group_id: Optional[str] = None) -> Dict:
 
 
 @db_transaction
-def update_grouped_data(conn, cursor, group_id: str, field: str, amount: float) -> bool:
-    """更新分组数据字段"""
-    cursor.execute(
-        'SELECT * FROM grouped_data WHERE group_id = ?', (group_id,))
-    row = cursor.fetchone()
-
-    if not row:
-        cursor.execute('''
-        INSERT INTO grouped_data (
-            group_id, valid_orders, valid_amount, liquid_funds,
-            new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount
-        ) VALUES (?, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        ''', (group_id,))
-        current_value = 0
-    else:
-        row_dict = dict(row)
-        current_value = row_dict.get(field, 0)
-
-    new_value = current_value + amount
-    cursor.execute(f'''
-    UPDATE grouped_data 
-    SET "{field}" = ?, updated_at = CURRENT_TIMESTAMP
-    WHERE group_id = ?
-    ''', (new_value, group_id))
-    return True
+def update_grouped_data(conn, cursor, group_id: str, field: str, amount: float) -> float:
+    """更新分组数据字段（原子累加，分组不存在时自动创建），返回更新后的值"""
+    row = _upsert_increment(cursor, 'grouped_data', _GROUPED_KEY, (group_id,),
+                            {field: amount}, STATS_FIELDS)
+    return row[0]
 
 
 @db_query
@@ -441,6 +1285,431 @@ def get_all_group_ids(conn, cursor) -> List[str]:
     rows = cursor.fetchall()
     return [row[0] for row in rows]
 
+# ========== 统计数据对账 ==========
+
+# 由订单表可以直接推算的统计字段：有效 = normal/overdue，违约 = 进入过违约的订单（breach/breach_end）
+RECONCILED_FIELDS = ('valid_orders', 'valid_amount', 'breach_orders', 'breach_amount')
+
+
+def _stats_diff(current: Dict, actual: Dict) -> Dict[str, Dict]:
+    """比较当前统计值与实际值，返回需要修正的字段 {字段: {'current', 'actual', 'diff'}}"""
+    diffs = {}
+    for field in RECONCILED_FIELDS:
+        current_value = current.get(field) or 0
+        actual_value = actual.get(field) or 0
+        diff = actual_value - current_value
+        tolerance = 0 if field.endswith('_orders') else 0.01
+        if abs(diff) > tolerance:
+            diffs[field] = {'current': current_value, 'actual': actual_value, 'diff': diff}
+    return diffs
+
+
+@db_query
+def _load_order_stats_diffs(conn, cursor) -> Tuple[Dict[str, Dict], Dict[str, Dict], int]:
+    """在只读连接上比较订单表与统计表，返回 (归属ID差异, 全局差异, 检查的归属ID数)"""
+    # 两条查询在同一个读事务中执行，看到同一时刻的数据
+    cursor.execute('BEGIN')
+    cursor.execute('''
+    WITH actual AS (
+        SELECT group_id,
+            COUNT(CASE WHEN state IN ('normal', 'overdue') THEN 1 END) AS valid_orders,
+            COALESCE(SUM(CASE WHEN state IN ('normal', 'overdue') THEN amount END), 0) AS valid_amount,
+            COUNT(CASE WHEN state IN ('breach', 'breach_end') THEN 1 END) AS breach_orders,
+            COALESCE(SUM(CASE WHEN state IN ('breach', 'breach_end') THEN amount END), 0) AS breach_amount
+        FROM orders
+        GROUP BY group_id
+    ),
+    all_groups AS (
+        SELECT group_id FROM actual
+        UNION
+        SELECT group_id FROM grouped_data
+    )
+    SELECT k.group_id,
+        IFNULL(a.valid_orders, 0) AS valid_orders,
+        IFNULL(a.valid_amount, 0) AS valid_amount,
+        IFNULL(a.breach_orders, 0) AS breach_orders,
+        IFNULL(a.breach_amount, 0) AS breach_amount,
+        IFNULL(g.valid_orders, 0) AS current_valid_orders,
+        IFNULL(g.valid_amount, 0) AS current_valid_amount,
+        IFNULL(g.breach_orders, 0) AS current_breach_orders,
+        IFNULL(g.breach_amount, 0) AS current_breach_amount
+    FROM all_groups k
+    LEFT JOIN actual a ON a.group_id = k.group_id
+    LEFT JOIN grouped_data g ON g.group_id = k.group_id
+    ORDER BY k.group_id
+    ''')
+    rows = cursor.fetchall()
+
+    group_diffs = {}
+    global_actual = dict.fromkeys(RECONCILED_FIELDS, 0)
+    for row in rows:
+        actual = {field: row[field] for field in RECONCILED_FIELDS}
+        for field in RECONCILED_FIELDS:
+            global_actual[field] += actual[field]
+        current = {field: row[f'current_{field}'] for field in RECONCILED_FIELDS}
+        diffs = _stats_diff(current, actual)
+        if diffs:
+            group_diffs[row['group_id']] = diffs
+
+    cursor.execute(
+        f"SELECT {', '.join(RECONCILED_FIELDS)} FROM financial_data ORDER BY id DESC LIMIT 1")
+    financial_row = cursor.fetchone()
+    global_diffs = _stats_diff(dict(financial_row) if financial_row else {}, global_actual)
+
+    return group_diffs, global_diffs, len(rows)
+
+
+async def reconcile_order_stats(dry_run: bool = False) -> Dict:
+    """
+    根据订单表对账分组统计（grouped_data）和全局统计（financial_data）
+
+    用一条 GROUP BY 查询算出每个归属ID的实际有效/违约订单数和金额，与统计表比较。
+    全表聚合在只读线程中执行，不占用写线程；非预览模式下只把修正量（差值）
+    作为增量在一个写事务中写入，对账期间提交的订单变更会同时改动订单和统计，
+    不影响差值的正确性。
+
+    参数:
+        dry_run: 只返回差异，不写入
+
+    返回:
+        {
+            'groups': {归属ID: {字段: {'current', 'actual', 'diff'}}}（只包含有差异的归属ID）,
+            'global': {字段: {'current', 'actual', 'diff'}},
+            'checked_groups': 检查的归属ID数,
+            'dry_run': 是否为预览
+        }
+        写入失败时返回 False
+    """
+    group_diffs, global_diffs, checked_groups = await _load_order_stats_diffs()
+
+    if not dry_run and (group_diffs or global_diffs):
+        grouped_deltas = {
+            group_id: {field: d['diff'] for field, d in diffs.items()}
+            for group_id, diffs in group_diffs.items()
+        }
+        global_deltas = {field: d['diff'] for field, d in global_diffs.items()}
+        if await apply_stats_deltas(global_deltas, {}, grouped_deltas) is False:
+            return False
+
+    return {
+        'groups': group_diffs,
+        'global': global_diffs,
+        'checked_groups': checked_groups,
+        'dry_run': dry_run
+    }
+
+# 由收入明细推算的统计字段：日结/全局统计字段 -> (收入类型, 取值)
+INCOME_RECONCILED_FIELDS = (
+    ('interest', 'interest', 'amount'),
+    ('completed_amount', 'completed', 'amount'),
+    ('completed_orders', 'completed', 'count'),
+    ('breach_end_amount', 'breach_end', 'amount'),
+    ('breach_end_orders', 'breach_end', 'count'),
+)
+
+
+@db_query
+def _load_income_stats_corrections(conn, cursor,
+                                   progress: Optional[Callable[[str], None]] = None
+                                   ) -> Tuple[List[Dict], Dict[str, Dict], Dict[str, float], int]:
+    """在只读连接上比较收入明细与统计表，返回 (日结修正, 全局差异, 收入明细合计, 检查的日结行数)"""
+    fields = [field for field, _, _ in INCOME_RECONCILED_FIELDS]
+    income_columns = ",\n            ".join(
+        f"COALESCE(SUM(CASE WHEN type = '{income_type}' THEN amount END), 0) AS {field}"
+        if value == 'amount' else
+        f"COUNT(CASE WHEN type = '{income_type}' THEN 1 END) AS {field}"
+        for field, income_type, value in INCOME_RECONCILED_FIELDS)
+    income_types = sorted({income_type for _, income_type, _ in INCOME_RECONCILED_FIELDS})
+    type_placeholders = ", ".join("?" * len(income_types))
+    # 每种收入类型的笔数：某类型在该日期/归属ID下没有明细时不修正对应字段
+    count_columns = [f"n_{income_type}" for income_type in income_types]
+    income_columns += "".join(
+        f",\n            COUNT(CASE WHEN type = '{income_type}' THEN 1 END) AS n_{income_type}"
+        for income_type in income_types)
+    carried = fields + count_columns
+
+    if progress:
+        progress("汇总收入明细")
+    # 两条查询在同一个读事务中执行，看到同一时刻的数据
+    cursor.execute('BEGIN')
+    cursor.execute(f'''
+    WITH income AS (
+        SELECT date, group_id,
+            {income_columns}
+        FROM income_records
+        WHERE type IN ({type_placeholders})
+        GROUP BY date, group_id
+    ),
+    expected AS (
+        SELECT date, group_id, {", ".join(carried)}
+        FROM income WHERE group_id IS NOT NULL
+        UNION ALL
+        SELECT date, NULL, {", ".join(f"SUM({c})" for c in carried)}
+        FROM income GROUP BY date
+    )
+    SELECT e.date, e.group_id, {", ".join(f"e.{c}" for c in count_columns)},
+        {", ".join(f"e.{f} AS {f}, IFNULL(d.{f}, 0) AS current_{f}" for f in fields)}
+    FROM expected e
+    LEFT JOIN daily_data d
+        ON d.date = e.date AND IFNULL(d.group_id, '') = IFNULL(e.group_id, '')
+    ORDER BY e.date, e.group_id
+    ''', income_types)
+    rows = cursor.fetchall()
+
+    if progress:
+        progress(f"比较 {len(rows)} 条日结数据")
+    daily_corrections = []
+    totals = dict.fromkeys(fields, 0)
+    for row in rows:
+        correction = {}
+        for field, income_type, _ in INCOME_RECONCILED_FIELDS:
+            if row['group_id'] is None:
+                totals[field] += row[field]
+            if not row[f'n_{income_type}']:
+                continue
+            diff = row[field] - row[f'current_{field}']
+            tolerance = 0 if field.endswith('_orders') else 0.01
+            if abs(diff) > tolerance:
+                correction[field] = diff
+        if correction:
+            daily_corrections.append(
+                dict(correction, date=row['date'], group_id=row['group_id']))
+
+    cursor.execute(
+        f"SELECT {', '.join(fields)} FROM financial_data ORDER BY id DESC LIMIT 1")
+    financial_row = cursor.fetchone()
+    current = dict(financial_row) if financial_row else {}
+    global_diffs = {}
+    for field in fields:
+        current_value = current.get(field) or 0
+        diff = totals[field] - current_value
+        tolerance = 0 if field.endswith('_orders') else 0.01
+        if abs(diff) > tolerance:
+            global_diffs[field] = {'current': current_value, 'actual': totals[field], 'diff': diff}
+
+    return daily_corrections, global_diffs, totals, len(rows)
+
+
+@db_transaction
+def _apply_income_stats_corrections(conn, cursor, daily_corrections: List[Dict],
+                                    global_deltas: Dict[str, float]) -> bool:
+    """在一个事务中把收入对账的修正量累加到日结统计和全局统计"""
+    fields = [field for field, _, _ in INCOME_RECONCILED_FIELDS]
+    set_clause = ", ".join(f"{f} = {f} + excluded.{f}" for f in fields)
+    cursor.executemany(f'''
+    INSERT INTO daily_data (date, group_id, {", ".join(fields)})
+    VALUES (?, ?, {", ".join("?" * len(fields))})
+    ON CONFLICT(date, IFNULL(group_id, '')) DO UPDATE
+    SET {set_clause}, updated_at = CURRENT_TIMESTAMP
+    ''', [
+        [c['date'], c['group_id']] + [c.get(f, 0) for f in fields]
+        for c in daily_corrections
+    ])
+    _apply_stats_deltas(cursor, global_deltas, {}, {})
+    return True
+
+
+async def reconcile_income_stats(dry_run: bool = False,
+                                 progress: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    根据收入明细对账日结统计（daily_data）和全局统计（financial_data）
+
+    一次聚合 income_records 得到每个 (日期, 归属ID) 的利息、完成、违约完成金额和笔数，
+    全局日结行为当日所有收入之和；与 daily_data 连接后得到修正集，
+    聚合在只读线程中执行，不占用写线程；非预览模式下只把修正量（差值）作为增量
+    用 executemany 在一个写事务中写入，对账期间新记的收入同时改动明细和统计，
+    不影响差值的正确性。
+
+    参数:
+        dry_run: 只返回差异，不写入
+        progress: 进度回调（可能在数据库线程中调用，参数为进度说明）
+
+    返回:
+        {
+            'daily': [{'date', 'group_id', 字段: 差值...}]（只包含有差异的行）,
+            'global': {字段: {'current', 'actual', 'diff'}},
+            'totals': {字段: 收入明细合计},
+            'checked_rows': 检查的日结行数,
+            'dry_run': 是否为预览
+        }
+        写入失败时返回 False
+    """
+    daily_corrections, global_diffs, totals, checked_rows = \
+        await _load_income_stats_corrections(progress)
+
+    if not dry_run and (daily_corrections or global_diffs):
+        if progress:
+            progress(f"写入 {len(daily_corrections)} 条日结修正")
+        global_deltas = {field: d['diff'] for field, d in global_diffs.items()}
+        if await _apply_income_stats_corrections(daily_corrections, global_deltas) is False:
+            return False
+
+    return {
+        'daily': daily_corrections,
+        'global': global_diffs,
+        'totals': totals,
+        'checked_rows': checked_rows,
+        'dry_run': dry_run
+    }
+
+# 一致性检查比较的字段：日结/全局统计字段 -> 收入类型
+CONSISTENCY_FIELDS = (
+    ('interest', 'interest'),
+    ('completed_amount', 'completed'),
+    ('breach_end_amount', 'breach_end'),
+)
+
+
+def _consistency_query(dates_sql: str) -> str:
+    """按日期汇总收入明细并连接全局日结行的查询，dates_sql 给出要核对的日期"""
+    income_types = [income_type for _, income_type in CONSISTENCY_FIELDS] + ['principal_reduction']
+    income_sums = ", ".join(
+        f"COALESCE(SUM(CASE WHEN type = '{income_type}' THEN amount END), 0) AS income_{income_type}"
+        for income_type in income_types)
+    daily_columns = ", ".join(
+        f"IFNULL(d.{field}, 0) AS daily_{field}" for field, _ in CONSISTENCY_FIELDS)
+    income_columns = ", ".join(
+        f"IFNULL(i.income_{income_type}, 0) AS income_{income_type}" for income_type in income_types)
+    return f'''
+    WITH dates AS ({dates_sql}),
+    income AS (
+        SELECT date, {income_sums}
+        FROM income_records
+        WHERE date IN (SELECT date FROM dates)
+        GROUP BY date
+    )
+    SELECT dates.date, {income_columns}, {daily_columns}
+    FROM dates
+    LEFT JOIN income i ON i.date = dates.date
+    LEFT JOIN daily_data d ON d.date = dates.date AND d.group_id IS NULL
+    ORDER BY dates.date
+    '''
+
+
+def _consistency_mismatch(row) -> Dict[str, Dict]:
+    """比较一个日期的收入明细与日结统计，返回不一致的字段"""
+    mismatch = {}
+    for field, income_type in CONSISTENCY_FIELDS:
+        income_value = row[f'income_{income_type}']
+        daily_value = row[f'daily_{field}']
+        if abs(daily_value - income_value) > 0.01:
+            mismatch[field] = {'daily': daily_value, 'income': income_value,
+                               'diff': daily_value - income_value}
+    return mismatch
+
+
+@db_query
+def _load_stats_consistency(conn, cursor, start_date: Optional[str],
+                            end_date: Optional[str]) -> Dict:
+    """在只读连接上核对收入明细与日结统计，返回核对结果和核对一致的日期（clean_dates）"""
+    dirty_only = start_date is None
+    if dirty_only:
+        dates_sql = "SELECT date FROM stats_dirty_dates"
+        params = []
+    else:
+        end_date = end_date or start_date
+        dates_sql = '''
+        SELECT date FROM daily_data WHERE group_id IS NULL AND date >= ? AND date <= ?
+        UNION
+        SELECT date FROM income_records WHERE date >= ? AND date <= ?
+        '''
+        params = [start_date, end_date, start_date, end_date]
+
+    # 所有查询在同一个读事务中执行，看到同一时刻的数据
+    cursor.execute('BEGIN')
+    cursor.execute(_consistency_query(dates_sql), params)
+    rows = cursor.fetchall()
+
+    mismatches = []
+    clean_dates = []
+    income_totals = dict.fromkeys([field for field, _ in CONSISTENCY_FIELDS] + ['principal_reduction'], 0.0)
+    daily_totals = dict.fromkeys([field for field, _ in CONSISTENCY_FIELDS], 0.0)
+    for row in rows:
+        income_totals['principal_reduction'] += row['income_principal_reduction']
+        for field, income_type in CONSISTENCY_FIELDS:
+            income_totals[field] += row[f'income_{income_type}']
+            daily_totals[field] += row[f'daily_{field}']
+        mismatch = _consistency_mismatch(row)
+        if mismatch:
+            mismatches.append(dict(mismatch, date=row['date']))
+        else:
+            clean_dates.append(row['date'])
+
+    # 全局统计与全部收入明细比较（读取收入汇总表）
+    cursor.execute('''
+    SELECT type, COALESCE(SUM(amount), 0) AS amount FROM income_rollup GROUP BY type
+    ''')
+    ledger = {row['type']: row['amount'] for row in cursor.fetchall()}
+    cursor.execute(
+        f"SELECT {', '.join(f for f, _ in CONSISTENCY_FIELDS)} FROM financial_data ORDER BY id DESC LIMIT 1")
+    financial_row = cursor.fetchone()
+    global_diffs = {}
+    for field, income_type in CONSISTENCY_FIELDS:
+        financial_value = (financial_row[field] if financial_row else 0) or 0
+        income_value = ledger.get(income_type, 0.0)
+        if abs(financial_value - income_value) > 0.01:
+            global_diffs[field] = {'financial': financial_value, 'income': income_value,
+                                   'diff': financial_value - income_value}
+
+    return {
+        'dirty_only': dirty_only,
+        'checked_dates': len(rows),
+        'mismatches': mismatches,
+        'income_totals': income_totals,
+        'daily_totals': daily_totals,
+        'global': global_diffs,
+        'clean_dates': clean_dates
+    }
+
+
+@db_transaction
+def _clear_consistent_dates(conn, cursor, dates: List[str]) -> int:
+    """从待核对表中清除仍然一致的日期，返回清除的日期数
+
+    核对在只读连接上完成，期间可能有新的写入，因此清除前在写事务中
+    重新核对这些日期（按日期的索引查询），刚变得不一致的日期保留。
+    """
+    cleared = 0
+    for start in range(0, len(dates), _IN_CLAUSE_BATCH_SIZE):
+        batch = dates[start:start + _IN_CLAUSE_BATCH_SIZE]
+        placeholders = ", ".join("?" * len(batch))
+        cursor.execute(_consistency_query(
+            f"SELECT date FROM stats_dirty_dates WHERE date IN ({placeholders})"), batch)
+        still_clean = [(row['date'],) for row in cursor.fetchall()
+                       if not _consistency_mismatch(row)]
+        if still_clean:
+            cursor.executemany('DELETE FROM stats_dirty_dates WHERE date = ?', still_clean)
+            cleared += len(still_clean)
+    return cleared
+
+
+async def check_stats_consistency(start_date: Optional[str] = None,
+                                  end_date: Optional[str] = None) -> Dict:
+    """
+    按日期核对收入明细与全局日结统计（group_id 为 NULL 的 daily_data 行）
+
+    未指定日期范围时只核对 stats_dirty_dates 中的待核对日期（上次核对后有写入的日期）。
+    每个日期的收入按类型在SQL中聚合后与日结行比较，核对一致的日期从待核对表中清除，
+    不一致的日期保留，下次继续核对。核对在只读线程中执行，
+    写线程只负责清除待核对日期，核对期间不阻塞其他写入。
+
+    返回:
+        {
+            'dirty_only': 是否只核对待核对日期,
+            'checked_dates': 核对的日期数,
+            'mismatches': [{'date', 字段: {'daily', 'income', 'diff'}}],
+            'income_totals': {字段: 收入明细合计, 'principal_reduction': ...}（核对日期范围内）,
+            'daily_totals': {字段: 日结统计合计},
+            'global': {字段: {'financial', 'income', 'diff'}}（financial_data 与全部收入明细比较）,
+            'cleared': 清除的待核对日期数
+        }
+    """
+    result = await _load_stats_consistency(start_date, end_date)
+    clean_dates = result.pop('clean_dates')
+    cleared = await _clear_consistent_dates(clean_dates) if clean_dates else 0
+    result['cleared'] = cleared or 0
+    return result
+
 # ========== 日结数据操作 ==========
 
 
@@ -478,119 +1747,187 @@ def get_daily_data(conn, cursor, date: str, group_id: Optional[str] = None) -> D
 
 
 @db_transaction
-def update_daily_data(conn, cursor, date: str, field: str, amount: float, group_id: Optional[str] = None) -> bool:
-    """更新日结数据字段"""
-    if group_id:
-        cursor.execute(
-            'SELECT * FROM daily_data WHERE date = ? AND group_id = ?', (date, group_id))
-    else:
-        cursor.execute(
-            'SELECT * FROM daily_data WHERE date = ? AND group_id IS NULL', (date,))
+def update_daily_data(conn, cursor, date: str, field: str, amount: float, group_id: Optional[str] = None) -> float:
+    """更新日结数据字段（原子累加，group_id为None时更新全局日结），返回更新后的值"""
+    row = _upsert_increment(cursor, 'daily_data', _DAILY_KEY, (date, group_id),
+                            {field: amount}, DAILY_STATS_FIELDS)
+    return row[0]
 
-    row = cursor.fetchone()
 
-    if not row:
-        cursor.execute('''
-        INSERT INTO daily_data (
-            date, group_id, new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount,
-            liquid_flow, company_expenses, other_expenses
-        ) VALUES (?, ?, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        ''', (date, group_id))
-        current_value = 0
-    else:
-        row_dict = dict(row)
-        current_value = row_dict.get(field, 0)
+def _split_range_by_month(start_date: str, end_date: str) -> Tuple[List[Tuple[str, str]], Optional[Tuple[str, str]]]:
+    """把日期范围拆成首尾不足一个月的日期段和中间的整月段
 
-    new_value = current_value + amount
-    if group_id:
-        cursor.execute(f'''
-        UPDATE daily_data 
-        SET "{field}" = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE date = ? AND group_id = ?
-        ''', (new_value, date, group_id))
+    返回 ([(起始日期, 结束日期), ...], (起始月份, 结束月份) 或 None)。
+    日期格式不是 YYYY-MM-DD 时不拆分，整个范围按日结行查询。
+    """
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return [(start_date, end_date)], None
+
+    one_day = timedelta(days=1)
+    if start.day == 1:
+        first_full = start
     else:
-        cursor.execute(f'''
-        UPDATE daily_data 
-        SET "{field}" = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE date = ? AND group_id IS NULL
-        ''', (new_value, date))
+        first_full = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if (end + one_day).day == 1:
+        last_full = end
+    else:
+        last_full = end.replace(day=1) - one_day
 
-    return True
+    if first_full > last_full:
+        return [(start_date, end_date)], None
+
+    day_ranges = []
+    if start < first_full:
+        day_ranges.append((start_date, (first_full - one_day).isoformat()))
+    if last_full < end:
+        day_ranges.append(((last_full + one_day).isoformat(), end_date))
+    return day_ranges, (first_full.strftime('%Y-%m'), last_full.strftime('%Y-%m'))
 
 
 @db_query
 def get_stats_by_date_range(conn, cursor, start_date: str, end_date: str, group_id: Optional[str] = None) -> Dict:
-    """根据日期范围聚合统计数据"""
-    where_clause = "date >= ? AND date <= ?"
-    params = [start_date, end_date]
+    """根据日期范围聚合统计数据
 
+    整月部分读取 monthly_data 汇总行，只有首尾不足一个月的部分读取 daily_data，
+    读取的行数与月份数成正比，而不是天数。
+    """
     if group_id:
-        where_clause += " AND group_id = ?"
-        params.append(group_id)
+        group_clause = "group_id = ?"
+        group_params = [group_id]
     else:
-        where_clause += " AND group_id IS NULL"
+        group_clause = "group_id IS NULL"
+        group_params = []
 
+    columns = ", ".join(DAILY_STATS_FIELDS)
+    parts = []
+    params = []
+    day_ranges, month_range = _split_range_by_month(start_date, end_date)
+    for range_start, range_end in day_ranges:
+        parts.append(
+            f"SELECT {columns} FROM daily_data WHERE date >= ? AND date <= ? AND {group_clause}")
+        params.extend([range_start, range_end] + group_params)
+    if month_range:
+        parts.append(
+            f"SELECT {columns} FROM monthly_data WHERE month >= ? AND month <= ? AND {group_clause}")
+        params.extend(list(month_range) + group_params)
+
+    sums = ", ".join(f"SUM({field}) AS {field}" for field in DAILY_STATS_FIELDS)
     cursor.execute(f'''
-    SELECT 
-        SUM(new_clients) as new_clients,
-        SUM(new_clients_amount) as new_clients_amount,
-        SUM(old_clients) as old_clients,
-        SUM(old_clients_amount) as old_clients_amount,
-        SUM(interest) as interest,
-        SUM(completed_orders) as completed_orders,
-        SUM(completed_amount) as completed_amount,
-        SUM(breach_orders) as breach_orders,
-        SUM(breach_amount) as breach_amount,
-        SUM(breach_end_orders) as breach_end_orders,
-        SUM(breach_end_amount) as breach_end_amount,
-        SUM(liquid_flow) as liquid_flow,
-        SUM(company_expenses) as company_expenses,
-        SUM(other_expenses) as other_expenses
-    FROM daily_data 
-    WHERE {where_clause}
+    SELECT {sums}
+    FROM ({" UNION ALL ".join(parts)})
     ''', params)
 
     row = cursor.fetchone()
+    return {key: (row[key] if row[key] is not None else 0) for key in DAILY_STATS_FIELDS}
 
-    result = {}
-    keys = [
-        'new_clients', 'new_clients_amount',
-        'old_clients', 'old_clients_amount',
-        'interest',
-        'completed_orders', 'completed_amount',
-        'breach_orders', 'breach_amount',
-        'breach_end_orders', 'breach_end_amount',
-        'liquid_flow', 'company_expenses', 'other_expenses'
-    ]
+# ========== 授权用户操作 ==========
 
-    for i, key in enumerate(keys):
-        result[key] = row[i] if row[i] is not None else 0
 
-    return result
+class AccessCache:
+    """授权用户集合与用户归属ID映射的内存缓存
+
+    首次使用（或启动时 load_access_cache）从数据库整体加载，
+    之后权限检查和归属ID查询都是内存查找；
+    增删授权用户、设置/移除归属ID映射在事务提交后同步更新缓存并递增版本号。
+    整体加载在查询前记下版本号，查询期间发生过修改则放弃这次加载，
+    避免旧快照覆盖刚提交的修改（用法与 FinancialDataCache 相同）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.version = 0
+        self.authorized_users: Set[int] = set()
+        self.user_groups: Dict[int, str] = {}
+
+    def replace(self, authorized_users: List[int], user_groups: Dict[int, str],
+                version: int) -> bool:
+        """用数据库中的完整数据替换缓存（查询期间发生过修改则放弃，返回是否替换）"""
+        with self._lock:
+            if version != self.version:
+                return False
+            self.authorized_users = set(authorized_users)
+            self.user_groups = dict(user_groups)
+            self.loaded = True
+            return True
+
+    def set_authorized(self, user_id: int, authorized: bool):
+        with self._lock:
+            if authorized:
+                self.authorized_users.add(user_id)
+            else:
+                self.authorized_users.discard(user_id)
+            self.version += 1
+
+    def set_group(self, user_id: int, group_id: Optional[str]):
+        with self._lock:
+            if group_id is None:
+                self.user_groups.pop(user_id, None)
+            else:
+                self.user_groups[user_id] = group_id
+            self.version += 1
 
-# ========== 授权用户操作 ==========
+
+_access_cache = AccessCache()
+
+
+@db_query
+def _load_access_data(conn, cursor) -> Tuple[List[int], Dict[int, str]]:
+    """读取全部授权用户和用户归属ID映射"""
+    cursor.execute('SELECT user_id FROM authorized_users')
+    authorized_users = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT user_id, group_id FROM user_group_mapping')
+    user_groups = {row[0]: row[1] for row in cursor.fetchall()}
+    return authorized_users, user_groups
+
+
+async def load_access_cache():
+    """从数据库（重新）加载权限缓存"""
+    while True:
+        version = _access_cache.version
+        authorized_users, user_groups = await _load_access_data()
+        if _access_cache.replace(authorized_users, user_groups, version):
+            return
+
+
+async def _ensure_access_cache():
+    if not _access_cache.loaded:
+        await load_access_cache()
 
 
 @db_transaction
-def add_authorized_user(conn, cursor, user_id: int) -> bool:
-    """添加授权用户"""
+def _insert_authorized_user(conn, cursor, user_id: int) -> bool:
     cursor.execute(
         'INSERT OR IGNORE INTO authorized_users (user_id) VALUES (?)', (user_id,))
     return True
 
 
 @db_transaction
-def remove_authorized_user(conn, cursor, user_id: int) -> bool:
-    """移除授权用户"""
+def _delete_authorized_user(conn, cursor, user_id: int) -> bool:
     cursor.execute(
         'DELETE FROM authorized_users WHERE user_id = ?', (user_id,))
     return True
 
 
+async def add_authorized_user(user_id: int) -> bool:
+    """添加授权用户"""
+    success = await _insert_authorized_user(user_id)
+    if success:
+        _access_cache.set_authorized(user_id, True)
+    return success
+
+
+async def remove_authorized_user(user_id: int) -> bool:
+    """移除授权用户"""
+    success = await _delete_authorized_user(user_id)
+    if success:
+        _access_cache.set_authorized(user_id, False)
+    return success
+
+
 @db_query
 def get_authorized_users(conn, cursor) -> List[int]:
     """获取所有授权用户ID"""
@@ -599,28 +1936,22 @@ def get_authorized_users(conn, cursor) -> List[int]:
     return [row[0] for row in rows]
 
 
-@db_query
-def is_user_authorized(conn, cursor, user_id: int) -> bool:
-    """检查用户是否授权"""
-    cursor.execute(
-        'SELECT 1 FROM authorized_users WHERE user_id = ?', (user_id,))
-    return cursor.fetchone() is not None
+async def is_user_authorized(user_id: int) -> bool:
+    """检查用户是否授权（内存查找）"""
+    await _ensure_access_cache()
+    return user_id in _access_cache.authorized_users
 
 # ========== 用户归属ID映射操作 ==========
 
 
-@db_query
-def get_user_group_id(conn, cursor, user_id: int) -> Optional[str]:
-    """获取用户有权限查看的归属ID"""
-    cursor.execute(
-        'SELECT group_id FROM user_group_mapping WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    return row[0] if row else None
+async def get_user_group_id(user_id: int) -> Optional[str]:
+    """获取用户有权限查看的归属ID（内存查找）"""
+    await _ensure_access_cache()
+    return _access_cache.user_groups.get(user_id)
 
 
 @db_transaction
-def set_user_group_id(conn, cursor, user_id: int, group_id: str) -> bool:
-    """设置用户有权限查看的归属ID"""
+def _upsert_user_group_id(conn, cursor, user_id: int, group_id: str) -> bool:
     cursor.execute('''
     INSERT OR REPLACE INTO user_group_mapping (user_id, group_id, updated_at)
     VALUES (?, ?, CURRENT_TIMESTAMP)
@@ -629,13 +1960,28 @@ def set_user_group_id(conn, cursor, user_id: int, group_id: str) -> bool:
 
 
 @db_transaction
-def remove_user_group_id(conn, cursor, user_id: int) -> bool:
-    """移除用户的归属ID映射"""
+def _delete_user_group_id(conn, cursor, user_id: int) -> bool:
     cursor.execute(
         'DELETE FROM user_group_mapping WHERE user_id = ?', (user_id,))
     return cursor.rowcount > 0
 
 
+async def set_user_group_id(user_id: int, group_id: str) -> bool:
+    """设置用户有权限查看的归属ID"""
+    success = await _upsert_user_group_id(user_id, group_id)
+    if success:
+        _access_cache.set_group(user_id, group_id)
+    return success
+
+
+async def remove_user_group_id(user_id: int) -> bool:
+    """移除用户的归属ID映射"""
+    success = await _delete_user_group_id(user_id)
+    if success:
+        _access_cache.set_group(user_id, None)
+    return success
+
+
 @db_query
 def get_all_user_group_mappings(conn, cursor) -> List[Dict]:
     """获取所有用户归属ID映射"""
@@ -769,91 +2115,30 @@ def update_payment_account(conn, cursor, account_type: str, account_number: str
 
 @db_transaction
 def record_expense(conn, cursor, date: str, type: str, amount: float, note: str) -> int:
-    """记录开销，返回开销记录ID"""
-    cursor.execute('''
-    INSERT INTO expense_records (date, type, amount, note)
-    VALUES (?, ?, ?, ?)
-    ''', (date, type, amount, note))
-    expense_id = cursor.lastrowid
-
-    field = 'company_expenses' if type == 'company' else 'other_expenses'
-
-    cursor.execute(
-        'SELECT * FROM daily_data WHERE date = ? AND group_id IS NULL', (date,))
-    row = cursor.fetchone()
-
-    if not row:
-        cursor.execute('''
-        INSERT INTO daily_data (
-            date, group_id, new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount,
-            liquid_flow, company_expenses, other_expenses
-        ) VALUES (?, NULL, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, ?, ?)
-        ''', (date, amount if field == 'company_expenses' else 0, amount if field == 'other_expenses' else 0))
-    else:
-        cursor.execute(f'''
-        UPDATE daily_data 
-        SET "{field}" = "{field}" + ?, updated_at = CURRENT_TIMESTAMP
-        WHERE date = ? AND group_id IS NULL
-        ''', (amount, date))
-
-    cursor.execute('SELECT * FROM financial_data ORDER BY id DESC LIMIT 1')
-    row = cursor.fetchone()
-    if not row:
-        cursor.execute('''
-        INSERT INTO financial_data (
-            valid_orders, valid_amount, liquid_funds,
-            new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount
-        ) VALUES (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        ''')
-        current_value = 0
-    else:
-        row_dict = dict(row)
-        current_value = row_dict.get('liquid_funds', 0)
-
-    new_value = current_value - amount
-
+    """记录开销，返回开销记录ID"""
     cursor.execute('''
-    UPDATE financial_data 
-    SET "liquid_funds" = ?, updated_at = CURRENT_TIMESTAMP
-    WHERE id = (SELECT id FROM financial_data ORDER BY id DESC LIMIT 1)
-    ''', (new_value,))
+    INSERT INTO expense_records (date, type, amount, note)
+    VALUES (?, ?, ?, ?)
+    ''', (date, type, amount, note))
+    expense_id = cursor.lastrowid
 
-    cursor.execute(
-        'SELECT * FROM daily_data WHERE date = ? AND group_id IS NULL', (date,))
-    daily_row = cursor.fetchone()
+    field = 'company_expenses' if type == 'company' else 'other_expenses'
 
-    if not daily_row:
-        cursor.execute('''
-        INSERT INTO daily_data (
-            date, group_id, new_clients, new_clients_amount,
-            old_clients, old_clients_amount,
-            interest, completed_orders, completed_amount,
-            breach_orders, breach_amount,
-            breach_end_orders, breach_end_amount,
-            liquid_flow, company_expenses, other_expenses
-        ) VALUES (?, NULL, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, ?, ?, ?)
-        ''', (date, -amount, amount if field == 'company_expenses' else 0, amount if field == 'other_expenses' else 0))
-    else:
-        cursor.execute('''
-        UPDATE daily_data 
-        SET "liquid_flow" = "liquid_flow" - ?, updated_at = CURRENT_TIMESTAMP
-        WHERE date = ? AND group_id IS NULL
-        ''', (amount, date))
+    # 开销计入全局日结，同时减少流动资金
+    _apply_stats_deltas(
+        cursor,
+        {'liquid_funds': -amount},
+        {(date, None): {field: amount, 'liquid_flow': -amount}},
+        {}
+    )
 
     return expense_id
 
 
 @db_query
-def get_expense_records(conn, cursor, start_date: str, end_date: str = None, type: Optional[str] = None) -> List[Dict]:
+def get_expense_records(conn, cursor, start_date: str, end_date: str = None, type: Optional[str] = None) -> List[ExpenseRecord]:
     """获取开销记录（支持日期范围）"""
+    cursor.row_factory = ExpenseRecord.row_factory
     query = "SELECT * FROM expense_records WHERE date >= ?"
     params = [start_date]
 
@@ -871,8 +2156,7 @@ def get_expense_records(conn, cursor, start_date: str, end_date: str = None, typ
     query += " ORDER BY date DESC, created_at ASC"
 
     cursor.execute(query, params)
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_transaction
@@ -954,6 +2238,123 @@ def toggle_scheduled_broadcast(conn, cursor, slot: int, is_active: int) -> bool:
     ''', (is_active, slot))
     return cursor.rowcount > 0
 
+# ========== 群发任务 ==========
+
+
+@db_transaction
+def create_broadcast_job(conn, cursor, message: str, chat_ids: Sequence[int],
+                         created_by: Optional[int] = None,
+                         notify_chat_id: Optional[int] = None,
+                         progress_message_id: Optional[int] = None) -> int:
+    """创建群发任务及其接收方（重复的 chat_id 只保留一个），返回任务ID"""
+    unique_ids = list(dict.fromkeys(chat_ids))
+    cursor.execute('''
+    INSERT INTO broadcast_jobs (message, total, created_by, notify_chat_id, progress_message_id)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (message, len(unique_ids), created_by, notify_chat_id, progress_message_id))
+    job_id = cursor.lastrowid
+    cursor.executemany(
+        'INSERT INTO broadcast_recipients (job_id, chat_id) VALUES (?, ?)',
+        [(job_id, chat_id) for chat_id in unique_ids])
+    return job_id
+
+
+@db_transaction
+def claim_next_broadcast_job(conn, cursor) -> Optional[Dict]:
+    """取出最早的未完成任务并标记为执行中（含上次运行中断的任务）"""
+    cursor.execute('''
+    SELECT * FROM broadcast_jobs
+    WHERE status IN ('pending', 'running')
+    ORDER BY id
+    LIMIT 1
+    ''')
+    row = cursor.fetchone()
+    if not row:
+        return None
+    cursor.execute('''
+    UPDATE broadcast_jobs
+    SET status = 'running', started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+    WHERE id = ?
+    ''', (row['id'],))
+    job = dict(row)
+    job['status'] = 'running'
+    return job
+
+
+@db_query
+def get_pending_broadcast_recipients(conn, cursor, job_id: int) -> List[int]:
+    """获取任务中尚未发送的群组"""
+    cursor.execute('''
+    SELECT chat_id FROM broadcast_recipients
+    WHERE job_id = ? AND status = 'pending'
+    ORDER BY rowid
+    ''', (job_id,))
+    return [row['chat_id'] for row in cursor.fetchall()]
+
+
+@db_transaction
+def record_broadcast_result(conn, cursor, job_id: int, chat_id: int, ok: bool,
+                            error: Optional[str] = None,
+                            migrated_to: Optional[int] = None) -> bool:
+    """记录单个群组的发送结果，同时累加任务的成功/失败数
+
+    只更新仍为 pending 的接收方，重复记录不会重复计数。
+    """
+    status = 'sent' if ok else 'failed'
+    cursor.execute('''
+    UPDATE broadcast_recipients
+    SET status = ?, error = ?, migrated_to = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = ? AND chat_id = ? AND status = 'pending'
+    ''', (status, error, migrated_to, job_id, chat_id))
+    if cursor.rowcount == 0:
+        return False
+    # 状态名与任务表的计数列同名（sent / failed）
+    cursor.execute(f'UPDATE broadcast_jobs SET {status} = {status} + 1 WHERE id = ?', (job_id,))
+    return True
+
+
+@db_transaction
+def finish_broadcast_job(conn, cursor, job_id: int) -> bool:
+    """把没有待发送接收方的任务标记为完成"""
+    cursor.execute('''
+    UPDATE broadcast_jobs
+    SET status = 'done', finished_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND status != 'done'
+      AND NOT EXISTS (
+          SELECT 1 FROM broadcast_recipients WHERE job_id = ? AND status = 'pending')
+    ''', (job_id, job_id))
+    return cursor.rowcount > 0
+
+
+@db_query
+def get_broadcast_job(conn, cursor, job_id: int) -> Optional[Dict]:
+    """获取群发任务"""
+    cursor.execute('SELECT * FROM broadcast_jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+@db_query
+def get_recent_broadcast_jobs(conn, cursor, limit: int = 10) -> List[Dict]:
+    """获取最近的群发任务（未完成的排在前面）"""
+    cursor.execute('''
+    SELECT * FROM broadcast_jobs
+    ORDER BY status = 'done', id DESC
+    LIMIT ?
+    ''', (limit,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+@db_query
+def get_failed_broadcast_recipients(conn, cursor, job_id: int) -> List[Dict]:
+    """获取任务中发送失败的群组及原因"""
+    cursor.execute('''
+    SELECT chat_id, error, updated_at FROM broadcast_recipients
+    WHERE job_id = ? AND status = 'failed'
+    ORDER BY rowid
+    ''', (job_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
 # ========== 收入明细操作 ==========
 
 
@@ -962,8 +2363,18 @@ def record_income(conn, cursor, date: str, type: str, amount: float,
                   group_id: Optional[str] = None, order_id: Optional[str] = None,
                   order_date: Optional[str] = None, customer: Optional[str] = None,
                   weekday_group: Optional[str] = None, note: Optional[str] = None,
-                  created_by: Optional[int] = None) -> bool:
-    """记录收入明细"""
+                  created_by: Optional[int] = None) -> int:
+    """记录收入明细，返回明细ID"""
+    return _insert_income(cursor, date, type, amount, group_id, order_id, order_date,
+                          customer, weekday_group, note, created_by)
+
+
+def _insert_income(cursor, date: str, type: str, amount: float,
+                   group_id: Optional[str] = None, order_id: Optional[str] = None,
+                   order_date: Optional[str] = None, customer: Optional[str] = None,
+                   weekday_group: Optional[str] = None, note: Optional[str] = None,
+                   created_by: Optional[int] = None) -> int:
+    """在当前事务中写入收入明细并累加收入汇总，返回明细ID"""
     # 使用北京时间作为 created_at
     tz_beijing = pytz.timezone('Asia/Shanghai')
     created_at = datetime.now(tz_beijing).strftime('%Y-%m-%d %H:%M:%S')
@@ -974,45 +2385,261 @@ def record_income(conn, cursor, date: str, type: str, amount: float,
         customer, weekday_group, note, created_by, created_at
     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (date, type, amount, group_id, order_id, order_date, customer, weekday_group, note, created_by, created_at))
-    return True
+    income_id = cursor.lastrowid
+    _rollup_income(cursor, date, type, group_id, customer, amount)
+    return income_id
+
+
+# ========== 收入汇总（income_rollup） ==========
+
+# income_rollup 按 (日期, 类型, 归属ID, 客户类型) 保存收入笔数和金额，
+# 与 income_records 在同一事务中维护；NULL 的归属ID/客户类型依赖表达式唯一索引
+_INCOME_ROLLUP_KEY = (
+    ('date', 'type', 'group_id', 'customer'), ('?', '?', '?', '?'),
+    "date, type, IFNULL(group_id, ''), IFNULL(customer, '')")
+INCOME_ROLLUP_DIMENSIONS = ('date', 'type', 'group_id', 'customer')
+
+
+def _rollup_income(cursor, date: str, type: str, group_id: Optional[str],
+                   customer: Optional[str], amount: float, count: int = 1):
+    """在当前事务中累加收入汇总（删除明细时传入负的金额和笔数）
+
+    笔数减到 0 时删除该汇总行，不留下笔数为 0、金额为浮点残差的空行。
+    """
+    row = _upsert_increment(cursor, 'income_rollup', _INCOME_ROLLUP_KEY,
+                            (date, type, group_id, customer),
+                            {'count': count, 'amount': amount}, ('count', 'amount'))
+    if row['count'] <= 0:
+        cursor.execute('''
+        DELETE FROM income_rollup
+        WHERE date = ? AND type = ? AND IFNULL(group_id, '') = IFNULL(?, '')
+          AND IFNULL(customer, '') = IFNULL(?, '')
+        ''', (date, type, group_id, customer))
+
+
+def _income_rollup_rows(cursor, start_date: str, end_date: str = None,
+                        group_by: Sequence[str] = ('type',), type: Optional[str] = None,
+                        customer: Optional[str] = None, group_id: Optional[str] = None,
+                        global_only: bool = False) -> List[Dict]:
+    """从 income_rollup 按指定维度汇总笔数和金额"""
+    unknown = [dim for dim in group_by if dim not in INCOME_ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"未知的收入汇总维度: {unknown}")
+
+    where_clause, params = _build_income_criteria(
+        start_date, end_date, type, customer, group_id, None, global_only)
+    dims = ", ".join(group_by)
+    select_dims = f"{dims}, " if group_by else ""
+    # 没有明细的维度组合（如全部撤销后）不返回
+    group_clause = (f"GROUP BY {dims} HAVING SUM(count) > 0 ORDER BY {dims}" if group_by
+                    else "HAVING SUM(count) > 0")
+    cursor.execute(f'''
+    SELECT {select_dims}COALESCE(SUM(count), 0) AS count, COALESCE(SUM(amount), 0) AS amount
+    FROM income_rollup WHERE {where_clause}
+    {group_clause}
+    ''', params)
+    return [dict(row) for row in cursor.fetchall()]
 
 
 @db_query
-def get_income_records(conn, cursor, start_date: str, end_date: str = None,
-                       type: Optional[str] = None, customer: Optional[str] = None,
-                       group_id: Optional[str] = None, order_id: Optional[str] = None) -> List[Dict]:
-    """获取收入明细（支持多维度过滤）"""
-    query = "SELECT * FROM income_records WHERE date >= ?"
-    params = [start_date]
+def get_income_rollup(conn, cursor, start_date: str, end_date: str = None,
+                      group_by: Sequence[str] = ('type',), type: Optional[str] = None,
+                      customer: Optional[str] = None, group_id: Optional[str] = None,
+                      global_only: bool = False) -> List[Dict]:
+    """
+    按维度汇总收入笔数和金额（读取 income_rollup，不扫描收入明细）
 
-    if end_date:
-        query += " AND date <= ?"
-        params.append(end_date)
-    else:
-        query += " AND date <= ?"
-        params.append(start_date)
+    参数:
+        group_by: 汇总维度，取自 date/type/group_id/customer
+        其余参数: 过滤条件（同 get_income_records_page）
+
+    返回:
+        [{维度列..., 'count': 笔数, 'amount': 金额}]
+    """
+    return _income_rollup_rows(cursor, start_date, end_date, group_by,
+                               type, customer, group_id, global_only)
+
+
+@db_transaction
+def rebuild_income_rollup(conn, cursor) -> int:
+    """根据 income_records 重新生成 income_rollup，返回汇总行数"""
+    cursor.execute('DELETE FROM income_rollup')
+    cursor.execute('''
+    INSERT INTO income_rollup (date, type, group_id, customer, count, amount)
+    SELECT date, type, group_id, customer, COUNT(*), COALESCE(SUM(amount), 0)
+    FROM income_records
+    GROUP BY date, type, group_id, customer
+    ''')
+    return cursor.rowcount
+
+
+def _build_income_criteria(start_date: str, end_date: str = None,
+                           type: Optional[str] = None, customer: Optional[str] = None,
+                           group_id: Optional[str] = None, order_id: Optional[str] = None,
+                           global_only: bool = False) -> Tuple[str, List]:
+    """构建收入明细查询的 WHERE 子句和参数（未指定结束日期时只查起始日期当天）"""
+    conditions = ["date >= ?", "date <= ?"]
+    params = [start_date, end_date or start_date]
 
     if type:
-        query += " AND type = ?"
+        conditions.append("type = ?")
         params.append(type)
 
     if customer:
-        query += " AND customer = ?"
+        conditions.append("customer = ?")
         params.append(customer)
 
-    if group_id:
-        query += " AND group_id = ?"
+    if global_only:
+        # 只查全局收入（未关联归属ID）
+        conditions.append("group_id IS NULL")
+    elif group_id:
+        conditions.append("group_id = ?")
         params.append(group_id)
 
     if order_id:
-        query += " AND order_id = ?"
+        conditions.append("order_id = ?")
         params.append(order_id)
 
-    query += " ORDER BY date DESC, created_at DESC"
+    return " AND ".join(conditions), params
 
-    cursor.execute(query, params)
+
+@db_query
+def get_income_records(conn, cursor, start_date: str, end_date: str = None,
+                       type: Optional[str] = None, customer: Optional[str] = None,
+                       group_id: Optional[str] = None, order_id: Optional[str] = None) -> List[IncomeRecord]:
+    """获取收入明细（支持多维度过滤）"""
+    cursor.row_factory = IncomeRecord.row_factory
+    where_clause, params = _build_income_criteria(
+        start_date, end_date, type, customer, group_id, order_id)
+    cursor.execute(f'''
+    SELECT * FROM income_records WHERE {where_clause}
+    ORDER BY date DESC, created_at DESC
+    ''', params)
+    return cursor.fetchall()
+
+
+def _income_totals_by_type(cursor, where_clause: str, params: List,
+                           from_rollup: bool = True) -> Dict[str, Dict]:
+    """按收入类型汇总笔数和金额（按订单过滤时 from_rollup=False，从明细汇总）"""
+    if from_rollup:
+        cursor.execute(f'''
+        SELECT type, SUM(count) AS count, COALESCE(SUM(amount), 0) AS amount
+        FROM income_rollup WHERE {where_clause}
+        GROUP BY type
+        HAVING SUM(count) > 0
+        ''', params)
+    else:
+        cursor.execute(f'''
+        SELECT type, COUNT(*) AS count, COALESCE(SUM(amount), 0) AS amount
+        FROM income_records WHERE {where_clause}
+        GROUP BY type
+        ''', params)
+    return {row['type']: {'count': row['count'], 'amount': row['amount']}
+            for row in cursor.fetchall()}
+
+
+@db_query
+def get_income_records_page(conn, cursor, start_date: str, end_date: str = None,
+                            type: Optional[str] = None, customer: Optional[str] = None,
+                            group_id: Optional[str] = None, order_id: Optional[str] = None,
+                            global_only: bool = False, limit: int = 20,
+                            page_token: Optional[str] = None, offset: int = 0) -> Dict:
+    """
+    分页获取收入明细（按录入时间正序的键集分页），并在SQL中汇总总数和金额
+
+    参数:
+        start_date/end_date/type/customer/group_id/order_id: 过滤条件（同 get_income_records）
+        global_only: 只查 group_id 为空的全局收入
+        limit: 每页条数
+        page_token: 上一页返回的 next_token；提供时忽略 offset
+        offset: 没有令牌时（如直接跳到第N页）使用的偏移量
+
+    返回:
+        {
+            'records': 当前页明细,
+            'next_token': 下一页令牌（没有更多时为 None）,
+            'total_count': 匹配的总笔数,
+            'total_amount': 匹配的总金额,
+            'by_type': {类型: {'count': 笔数, 'amount': 金额}}
+        }
+    """
+    where_clause, params = _build_income_criteria(
+        start_date, end_date, type, customer, group_id, order_id, global_only)
+
+    by_type = _income_totals_by_type(
+        cursor, where_clause, params, from_rollup=order_id is None)
+
+    page_params = list(params)
+    if page_token:
+        where_clause += " AND (IFNULL(created_at, ''), id) > (?, ?)"
+        page_params.extend(decode_page_token(page_token))
+        offset = 0
+
+    # 多取一条用于判断是否还有下一页
+    cursor.row_factory = IncomeRecord.row_factory
+    cursor.execute(f'''
+    SELECT * FROM income_records WHERE {where_clause}
+    ORDER BY IFNULL(created_at, ''), id
+    LIMIT ? OFFSET ?
+    ''', page_params + [limit + 1, offset])
     rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+
+    next_token = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_token = encode_page_token(
+            rows[-1]['created_at'] or '', rows[-1]['id'])
+
+    return {
+        'records': rows,
+        'next_token': next_token,
+        'total_count': sum(t['count'] for t in by_type.values()),
+        'total_amount': sum(t['amount'] for t in by_type.values()),
+        'by_type': by_type
+    }
+
+
+@db_query
+def get_income_type_previews(conn, cursor, start_date: str, end_date: str = None,
+                             group_id: Optional[str] = None, global_only: bool = False,
+                             limit_per_type: int = 20) -> Dict[str, Dict]:
+    """
+    获取每种收入类型的汇总和前 N 条明细（按录入时间正序），用于收入明细总览
+
+    返回:
+        {类型: {'count': 笔数, 'amount': 金额, 'records': 前N条明细, 'next_token': 下一页令牌}}
+    """
+    where_clause, params = _build_income_criteria(
+        start_date, end_date, group_id=group_id, global_only=global_only)
+
+    result = {income_type: dict(totals, records=[], next_token=None)
+              for income_type, totals in _income_totals_by_type(cursor, where_clause, params).items()}
+    if not result:
+        return result
+
+    # 行工厂会忽略 row_num 列
+    cursor.row_factory = IncomeRecord.row_factory
+    cursor.execute(f'''
+    SELECT * FROM (
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY type ORDER BY IFNULL(created_at, ''), id
+        ) AS row_num
+        FROM income_records WHERE {where_clause}
+    )
+    WHERE row_num <= ?
+    ORDER BY type, row_num
+    ''', params + [limit_per_type])
+
+    for record in cursor.fetchall():
+        result[record['type']]['records'].append(record)
+
+    for summary in result.values():
+        if summary['count'] > limit_per_type:
+            last = summary['records'][-1]
+            summary['next_token'] = encode_page_token(
+                last['created_at'] or '', last['id'])
+
+    return result
 
 
 @db_query
@@ -1045,66 +2672,93 @@ def get_interest_by_order_id(conn, cursor, order_id: str) -> Dict:
 
 
 @db_query
-def get_all_interest_by_order_id(conn, cursor, order_id: str) -> List[Dict]:
+def get_all_interest_by_order_id(conn, cursor, order_id: str) -> List[IncomeRecord]:
     """获取指定订单的所有利息收入明细"""
+    cursor.row_factory = IncomeRecord.row_factory
     cursor.execute('''
     SELECT * FROM income_records 
     WHERE order_id = ? AND type = 'interest'
     ORDER BY date ASC, created_at ASC
     ''', (order_id,))
 
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
+
+
+# 单条 IN (...) 语句的参数上限（低于旧版 SQLite 的 999 变量限制）
+_IN_CLAUSE_BATCH_SIZE = 500
+
+
+@db_query
+def get_interests_by_order_ids(conn, cursor, order_ids: List[str]) -> Dict[str, List[IncomeRecord]]:
+    """批量获取多个订单的利息收入明细，按订单编号分组
+
+    每 500 个订单一条查询，代替逐个调用 get_all_interest_by_order_id。
+    没有利息记录的订单不会出现在返回的字典中。
+    """
+    cursor.row_factory = IncomeRecord.row_factory
+    unique_ids = list(dict.fromkeys(oid for oid in order_ids if oid))
+    interests_by_order = {}
+    for start in range(0, len(unique_ids), _IN_CLAUSE_BATCH_SIZE):
+        batch = unique_ids[start:start + _IN_CLAUSE_BATCH_SIZE]
+        placeholders = ','.join('?' * len(batch))
+        cursor.execute(f'''
+        SELECT * FROM income_records
+        WHERE type = 'interest' AND order_id IN ({placeholders})
+        ORDER BY order_id, date ASC, created_at ASC
+        ''', batch)
+        for row in cursor.fetchall():
+            interests_by_order.setdefault(row['order_id'], []).append(row)
+    return interests_by_order
 
 
 @db_query
-def get_all_valid_orders(conn, cursor) -> List[Dict]:
+def get_all_valid_orders(conn, cursor) -> List[OrderRecord]:
     """获取所有有效订单（normal和overdue状态）"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('''
     SELECT * FROM orders 
     WHERE state IN ('normal', 'overdue')
     ORDER BY date DESC, order_id DESC
     ''')
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def get_completed_orders_by_date(conn, cursor, date: str) -> List[Dict]:
+def get_completed_orders_by_date(conn, cursor, date: str) -> List[OrderRecord]:
     """获取指定日期完成的订单（通过updated_at判断）"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('''
     SELECT * FROM orders 
     WHERE state = 'end' 
     AND updated_at >= ? AND updated_at < ?
     ORDER BY updated_at DESC
     ''', (f"{date} 00:00:00", f"{date} 23:59:59"))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def get_breach_end_orders_by_date(conn, cursor, date: str) -> List[Dict]:
+def get_breach_end_orders_by_date(conn, cursor, date: str) -> List[OrderRecord]:
     """获取指定日期违约完成且有变动的订单（通过updated_at判断）"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('''
     SELECT * FROM orders 
     WHERE state = 'breach_end' 
     AND updated_at >= ? AND updated_at < ?
     ORDER BY updated_at DESC
     ''', (f"{date} 00:00:00", f"{date} 23:59:59"))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
-def get_new_orders_by_date(conn, cursor, date: str) -> List[Dict]:
+def get_new_orders_by_date(conn, cursor, date: str) -> List[OrderRecord]:
     """获取指定日期新增的订单（通过created_at判断）"""
+    cursor.row_factory = OrderRecord.row_factory
     cursor.execute('''
     SELECT * FROM orders 
     WHERE created_at >= ? AND created_at < ?
     ORDER BY created_at DESC
     ''', (f"{date} 00:00:00", f"{date} 23:59:59"))
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    return cursor.fetchall()
 
 
 @db_query
@@ -1112,7 +2766,7 @@ def get_daily_interest_total(conn, cursor, date: str) -> float:
     """获取指定日期的利息收入总额"""
     cursor.execute('''
     SELECT COALESCE(SUM(amount), 0) as total
-    FROM income_records 
+    FROM income_rollup
     WHERE date = ? AND type = 'interest'
     ''', (date,))
     row = cursor.fetchone()
@@ -1166,43 +2820,52 @@ def get_daily_summary(conn, cursor, date: str) -> Optional[Dict]:
 @db_transaction
 def save_daily_summary(conn, cursor, date: str, data: Dict) -> bool:
     """保存日切数据"""
-    try:
-        cursor.execute('''
-        INSERT OR REPLACE INTO daily_summary (
-            date, new_orders_count, new_orders_amount,
-            completed_orders_count, completed_orders_amount,
-            breach_end_orders_count, breach_end_orders_amount,
-            daily_interest, company_expenses, other_expenses,
-            created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            date,
-            data.get('new_orders_count', 0),
-            data.get('new_orders_amount', 0.0),
-            data.get('completed_orders_count', 0),
-            data.get('completed_orders_amount', 0.0),
-            data.get('breach_end_orders_count', 0),
-            data.get('breach_end_orders_amount', 0.0),
-            data.get('daily_interest', 0.0),
-            data.get('company_expenses', 0.0),
-            data.get('other_expenses', 0.0),
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
+    cursor.execute('''
+    INSERT OR REPLACE INTO daily_summary (
+        date, new_orders_count, new_orders_amount,
+        completed_orders_count, completed_orders_amount,
+        breach_end_orders_count, breach_end_orders_amount,
+        daily_interest, company_expenses, other_expenses,
+        created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        date,
+        data.get('new_orders_count', 0),
+        data.get('new_orders_amount', 0.0),
+        data.get('completed_orders_count', 0),
+        data.get('completed_orders_amount', 0.0),
+        data.get('breach_end_orders_count', 0),
+        data.get('breach_end_orders_amount', 0.0),
+        data.get('daily_interest', 0.0),
+        data.get('company_expenses', 0.0),
+        data.get('other_expenses', 0.0),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ))
+    return True
+
+
+# 按收入类型拆分金额的聚合表达式（利息/完成/违约完成/本金减少）
+_INCOME_TYPE_SUMS = '''
+    COALESCE(SUM(CASE WHEN {p}type = 'interest' THEN {p}amount END), 0) AS interest,
+    COUNT(CASE WHEN {p}type = 'interest' THEN 1 END) AS interest_count,
+    COALESCE(SUM(CASE WHEN {p}type = 'completed' THEN {p}amount END), 0) AS completed,
+    COALESCE(SUM(CASE WHEN {p}type = 'breach_end' THEN {p}amount END), 0) AS breach_end,
+    COALESCE(SUM(CASE WHEN {p}type = 'principal_reduction' THEN {p}amount END), 0) AS principal_reduction,
+    COALESCE(SUM({p}amount), 0) AS total
+'''
 
 
 @db_query
-def get_customer_total_contribution(conn, cursor, customer: str, start_date: str = None, end_date: str = None) -> Dict:
-    """获取指定客户的总贡献（跨所有订单周期）
+def get_customer_contribution_report(conn, cursor, customer: str, start_date: str = None,
+                                     end_date: str = None, limit: int = 10, offset: int = 0) -> Dict:
+    """获取指定客户的总贡献（跨所有订单周期）及一页订单贡献明细
 
     参数:
         customer: 客户类型（'A'=新客户，'B'=老客户）
         start_date: 起始日期（可选，如果提供则只统计该日期之后的数据）
         end_date: 结束日期（可选，如果提供则只统计该日期之前的数据）
+        limit: 每页订单数
+        offset: 订单明细的偏移量（按订单日期倒序）
 
     返回:
         {
@@ -1214,105 +2877,11 @@ def get_customer_total_contribution(conn, cursor, customer: str, start_date: str
             'order_count': 订单数量,
             'interest_count': 利息收取次数,
             'first_order_date': 首次订单日期,
-            'last_order_date': 最后订单日期
+            'last_order_date': 最后订单日期,
+            'orders': [{'order', 'interest', 'completed', 'breach_end',
+                        'principal_reduction', 'total_contribution'}, ...]
         }
     """
-    # 构建基础查询条件
-    income_conditions = ["customer = ?"]
-    income_params = [customer.upper()]
-
-    order_conditions = ["customer = ?"]
-    order_params = [customer.upper()]
-
-    if start_date:
-        income_conditions.append("date >= ?")
-        income_params.append(start_date)
-        order_conditions.append("date >= ?")
-        order_params.append(start_date)
-
-    if end_date:
-        income_conditions.append("date <= ?")
-        income_params.append(end_date)
-        order_conditions.append("date <= ?")
-        order_params.append(end_date)
-
-    income_where = " AND ".join(income_conditions)
-    order_where = " AND ".join(order_conditions)
-
-    # 查询收入汇总
-    cursor.execute(f'''
-    SELECT 
-        type,
-        COUNT(*) as count,
-        SUM(amount) as total_amount
-    FROM income_records 
-    WHERE {income_where}
-    GROUP BY type
-    ''', income_params)
-
-    income_rows = cursor.fetchall()
-
-    # 初始化结果
-    result = {
-        'total_interest': 0.0,
-        'total_completed': 0.0,
-        'total_breach_end': 0.0,
-        'total_principal_reduction': 0.0,
-        'total_amount': 0.0,
-        'interest_count': 0,
-        'order_count': 0,
-        'first_order_date': None,
-        'last_order_date': None
-    }
-
-    # 处理收入数据
-    for row in income_rows:
-        income_type = row[0]
-        count = row[1]
-        amount = row[2] or 0.0
-
-        if income_type == 'interest':
-            result['total_interest'] = amount
-            result['interest_count'] = count
-        elif income_type == 'completed':
-            result['total_completed'] = amount
-        elif income_type == 'breach_end':
-            result['total_breach_end'] = amount
-        elif income_type == 'principal_reduction':
-            result['total_principal_reduction'] = amount
-
-        result['total_amount'] += amount
-
-    # 查询订单统计
-    cursor.execute(f'''
-    SELECT 
-        COUNT(*) as order_count,
-        MIN(date) as first_date,
-        MAX(date) as last_date
-    FROM orders 
-    WHERE {order_where}
-    ''', order_params)
-
-    order_row = cursor.fetchone()
-    if order_row:
-        result['order_count'] = order_row[0] or 0
-        result['first_order_date'] = order_row[1]
-        result['last_order_date'] = order_row[2]
-
-    return result
-
-
-@db_query
-def get_customer_orders_summary(conn, cursor, customer: str, start_date: str = None, end_date: str = None) -> List[Dict]:
-    """获取指定客户的所有订单及每笔订单的贡献汇总
-
-    返回每个订单的详细信息，包括：
-    - 订单基本信息
-    - 该订单的利息总额
-    - 该订单的完成金额
-    - 该订单的总贡献
-    """
-    # 构建查询条件
     conditions = ["customer = ?"]
     params = [customer.upper()]
 
@@ -1326,62 +2895,58 @@ def get_customer_orders_summary(conn, cursor, customer: str, start_date: str = N
 
     where_clause = " AND ".join(conditions)
 
-    # 查询所有订单
+    # 总贡献：收入汇总与订单统计在同一条语句中聚合
     cursor.execute(f'''
-    SELECT * FROM orders 
-    WHERE {where_clause}
-    ORDER BY date DESC
-    ''', params)
-
-    order_rows = cursor.fetchall()
-    orders = [dict(row) for row in order_rows]
+    SELECT income.*, ord.*
+    FROM (
+        SELECT {_INCOME_TYPE_SUMS.format(p='')}
+        FROM income_records
+        WHERE {where_clause}
+    ) AS income,
+    (
+        SELECT COUNT(*) AS order_count, MIN(date) AS first_order_date, MAX(date) AS last_order_date
+        FROM orders
+        WHERE {where_clause}
+    ) AS ord
+    ''', params + params)
+    row = cursor.fetchone()
 
-    # 为每个订单查询收入汇总
-    result = []
-    for order in orders:
-        order_id = order['order_id']
+    result = {
+        'total_interest': row['interest'],
+        'total_completed': row['completed'],
+        'total_breach_end': row['breach_end'],
+        'total_principal_reduction': row['principal_reduction'],
+        'total_amount': row['total'],
+        'interest_count': row['interest_count'],
+        'order_count': row['order_count'],
+        'first_order_date': row['first_order_date'],
+        'last_order_date': row['last_order_date'],
+        'orders': []
+    }
 
-        # 查询该订单的收入汇总
-        cursor.execute('''
-        SELECT 
-            type,
-            COUNT(*) as count,
-            SUM(amount) as total_amount
-        FROM income_records 
-        WHERE order_id = ?
-        GROUP BY type
-        ''', (order_id,))
-
-        income_rows = cursor.fetchall()
-
-        order_interest = 0.0
-        order_completed = 0.0
-        order_breach_end = 0.0
-        order_principal_reduction = 0.0
-        order_total = 0.0
-
-        for row in income_rows:
-            income_type = row[0]
-            amount = row[2] or 0.0
-
-            if income_type == 'interest':
-                order_interest = amount
-            elif income_type == 'completed':
-                order_completed = amount
-            elif income_type == 'breach_end':
-                order_breach_end = amount
-            elif income_type == 'principal_reduction':
-                order_principal_reduction = amount
-
-            order_total += amount
-
-        result.append({
-            'order': order,
-            'interest': order_interest,
-            'completed': order_completed,
-            'breach_end': order_breach_end,
-            'principal_reduction': order_principal_reduction,
-            'total_contribution': order_total
+    # 订单明细：先在SQL中分页，再 LEFT JOIN 收入明细按订单聚合
+    cursor.execute(f'''
+    SELECT {', '.join(f'o.{col}' for col in OrderRecord.FIELDS)},
+        {_INCOME_TYPE_SUMS.format(p='i.')}
+    FROM (
+        SELECT * FROM orders
+        WHERE {where_clause}
+        ORDER BY date DESC, id DESC
+        LIMIT ? OFFSET ?
+    ) AS o
+    LEFT JOIN income_records i ON i.order_id = o.order_id
+    GROUP BY o.id
+    ORDER BY o.date DESC, o.id DESC
+    ''', params + [limit, offset])
+
+    for order_row in cursor.fetchall():
+        result['orders'].append({
+            'order': {col: order_row[col] for col in OrderRecord.FIELDS},
+            'interest': order_row['interest'],
+            'completed': order_row['completed'],
+            'breach_end': order_row['breach_end'],
+            'principal_reduction': order_row['principal_reduction'],
+            'total_contribution': order_row['total']
         })
 
     return result
@@ -1391,39 +2956,16 @@ def get_customer_orders_summary(conn, cursor, customer: str, start_date: str = N
 def get_income_summary_by_type(conn, cursor, start_date: str, end_date: str = None,
                                group_id: Optional[str] = None) -> Dict:
     """按收入类型和客户类型汇总"""
-    query = """
-    SELECT 
-        type,
-        customer,
-        COUNT(*) as count,
-        SUM(amount) as total_amount
-    FROM income_records 
-    WHERE date >= ? AND date <= ?
-    """
-    params = [start_date, end_date or start_date]
-
-    if group_id:
-        query += " AND group_id = ?"
-        params.append(group_id)
-
-    query += " GROUP BY type, customer ORDER BY type, customer"
-
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    rows = _income_rollup_rows(cursor, start_date, end_date, ('type', 'customer'),
+                               group_id=group_id)
 
     # 构建汇总字典
     summary = {}
     for row in rows:
-        type_name = row[0]
-        customer_type = row[1] or 'None'
-        count = row[2]
-        total = row[3]
-
-        if type_name not in summary:
-            summary[type_name] = {}
-        summary[type_name][customer_type] = {
-            'count': count,
-            'total': total
+        customer_type = row['customer'] or 'None'
+        summary.setdefault(row['type'], {})[customer_type] = {
+            'count': row['count'],
+            'total': row['amount']
         }
 
     return summary
@@ -1432,29 +2974,14 @@ def get_income_summary_by_type(conn, cursor, start_date: str, end_date: str = No
 @db_query
 def get_income_summary_by_group(conn, cursor, start_date: str, end_date: str = None) -> Dict:
     """按归属ID汇总收入"""
-    query = """
-    SELECT 
-        group_id,
-        COUNT(*) as count,
-        SUM(amount) as total_amount
-    FROM income_records 
-    WHERE date >= ? AND date <= ?
-    GROUP BY group_id
-    ORDER BY total_amount DESC
-    """
-    params = [start_date, end_date or start_date]
-
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    rows = _income_rollup_rows(cursor, start_date, end_date, ('group_id',))
+    rows.sort(key=lambda row: row['amount'], reverse=True)
 
     summary = {}
     for row in rows:
-        group_id = row[0] or 'NULL'
-        count = row[1]
-        total = row[2]
-        summary[group_id] = {
-            'count': count,
-            'total': total
+        summary[row['group_id'] or 'NULL'] = {
+            'count': row['count'],
+            'total': row['amount']
         }
 
     return summary
@@ -1465,6 +2992,11 @@ def get_income_summary_by_group(conn, cursor, start_date: str, end_date: str = N
 @db_transaction
 def record_operation(conn, cursor, user_id: int, operation_type: str, operation_data: Dict, chat_id: int) -> int:
     """记录操作历史，返回操作ID"""
+    return _insert_operation(cursor, user_id, operation_type, operation_data, chat_id)
+
+
+def _insert_operation(cursor, user_id: int, operation_type: str, operation_data: Dict, chat_id: int) -> int:
+    """在当前事务中写入操作历史，返回操作ID"""
     cursor.execute('''
     INSERT INTO operation_history (user_id, chat_id, operation_type, operation_data, is_undone)
     VALUES (?, ?, ?, ?, 0)
@@ -1500,6 +3032,85 @@ def mark_operation_undone(conn, cursor, operation_id: int) -> bool:
     return cursor.rowcount > 0
 
 
+def _delete_income(cursor, income_id: int) -> bool:
+    """在当前事务中删除收入明细并扣减收入汇总"""
+    cursor.execute('''
+    SELECT date, type, group_id, customer, amount FROM income_records WHERE id = ?
+    ''', (income_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False
+    cursor.execute('DELETE FROM income_records WHERE id = ?', (income_id,))
+    _rollup_income(cursor, row['date'], row['type'], row['group_id'],
+                   row['customer'], -row['amount'], count=-1)
+    return True
+
+
+@db_transaction
+def undo_operation(conn, cursor, operation_id: int, plan: Dict) -> Optional[bool]:
+    """在一个事务中撤销操作：回滚订单、明细和统计数据并标记操作已撤销
+
+    plan 由撤销处理器按操作类型生成，可包含:
+        restore_state: {'order_id', 'from_state', 'to_state'}，订单状态必须仍为 from_state
+        restore_amount: {'order_id', 'amount'}，恢复有效订单的金额
+        delete_order: 要删除的订单编号
+        delete_income_id / delete_expense_id: 要删除的收入/开销明细ID
+        global_deltas / daily_deltas / grouped_deltas: 反向统计增量
+
+    返回 True 表示撤销成功；操作已被撤销时返回 None；
+    订单已被修改等无法撤销的情况返回 False（整个事务回滚）。
+    """
+    cursor.execute('''
+    UPDATE operation_history
+    SET is_undone = 1
+    WHERE id = ? AND is_undone = 0
+    ''', (operation_id,))
+    if cursor.rowcount == 0:
+        return None
+
+    restore_state = plan.get('restore_state')
+    if restore_state:
+        _mark_orders_dirty()
+        cursor.execute('''
+        UPDATE orders
+        SET state = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE order_id = ? AND state = ?
+        ''', (restore_state['to_state'], restore_state['order_id'], restore_state['from_state']))
+        if cursor.rowcount == 0:
+            print(f"撤销失败：订单 {restore_state['order_id']} 状态不是 {restore_state['from_state']}")
+            return False
+
+    restore_amount = plan.get('restore_amount')
+    if restore_amount:
+        _mark_orders_dirty()
+        cursor.execute('''
+        UPDATE orders
+        SET amount = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE order_id = ? AND state IN ('normal', 'overdue')
+        ''', (restore_amount['amount'], restore_amount['order_id']))
+        if cursor.rowcount == 0:
+            print(f"撤销失败：订单 {restore_amount['order_id']} 不是有效订单")
+            return False
+
+    if plan.get('delete_order'):
+        _mark_orders_dirty()
+        cursor.execute('DELETE FROM orders WHERE order_id = ?', (plan['delete_order'],))
+        if cursor.rowcount == 0:
+            print(f"撤销失败：订单 {plan['delete_order']} 不存在")
+            return False
+
+    if plan.get('delete_income_id'):
+        if not _delete_income(cursor, plan['delete_income_id']):
+            print(f"撤销失败：收入明细 {plan['delete_income_id']} 不存在")
+            return False
+    if plan.get('delete_expense_id'):
+        cursor.execute('DELETE FROM expense_records WHERE id = ?', (plan['delete_expense_id'],))
+
+    _apply_stats_deltas(cursor, plan.get('global_deltas') or {},
+                        plan.get('daily_deltas') or {}, plan.get('grouped_deltas') or {})
+    return True
+
+
 @db_query
 def get_operation_by_id(conn, cursor, operation_id: int) -> Optional[Dict]:
     """根据ID获取操作记录"""
@@ -3,7 +3,7 @@ from .undo_handlers import undo_last_operation
 from .schedule_handlers import show_schedule_menu, handle_schedule_input
 from .order_table_handlers import show_order_table
 from .payment_handlers import show_gcash, show_paymaya, show_all_accounts
-from .broadcast_handlers import broadcast_payment
+from .broadcast_handlers import broadcast_payment, show_broadcast_jobs
 from .message_handlers import (
     handle_new_chat_members,
     handle_new_chat_title,
@@ -33,6 +33,7 @@ from .command_handlers import (
     update_weekday_groups,
     fix_statistics,
     fix_income_statistics,
+    rebuild_income_rollup,
     find_tail_orders,
     set_user_group_id,
     remove_user_group_id,
@@ -89,6 +90,7 @@ __all__ = [
     'update_weekday_groups',
     'fix_statistics',
     'fix_income_statistics',
+    'rebuild_income_rollup',
     'find_tail_orders',
     'set_user_group_id',
     'remove_user_group_id',
@@ -116,6 +118,7 @@ __all__ = [
     'handle_text_input',
     # 播报处理器
     'broadcast_payment',
+    'show_broadcast_jobs',
     # 支付账户处理器
     'show_gcash',
     'show_paymaya',
@@ -13,7 +13,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import db_operations
 from utils.chat_helpers import is_group_chat
-from utils.stats_helpers import update_all_stats, update_liquid_capital
+from utils.stats_helpers import StatsDelta
 from utils.date_helpers import get_daily_period_date
 from config import ADMIN_IDS
 from handlers.undo_handlers import reset_undo_count
@@ -85,7 +85,7 @@ async def handle_amount_operation(update: Update, context: ContextTypes.DEFAULT_
                     # 如果没有订单，先记录收入明细，再更新统计数据
                     try:
                         # 1. 先记录收入明细（如果失败，不更新统计数据）
-                        await db_operations.record_income(
+                        income_id = await db_operations.record_income(
                             date=get_daily_period_date(),
                             type='interest',
                             amount=amount,
@@ -105,8 +105,10 @@ async def handle_amount_operation(update: Update, context: ContextTypes.DEFAULT_
 
                     # 2. 收入明细记录成功后，再更新统计数据
                     try:
-                        await update_all_stats('interest', amount, 0, None)
-                        await update_liquid_capital(amount)
+                        delta = StatsDelta()
+                        delta.add('interest', amount, 0, None)
+                        delta.add_liquid_capital(amount)
+                        await delta.apply()
                     except Exception as e:
                         logger.error(f"更新利息收入统计数据失败: {e}", exc_info=True)
                         # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
@@ -123,7 +125,8 @@ async def handle_amount_operation(update: Update, context: ContextTypes.DEFAULT_
                                 'amount': amount,
                                 'group_id': None,
                                 'order_id': None,
-                                'date': get_daily_period_date()
+                                'date': get_daily_period_date(),
+                                'income_record_id': income_id
                             },
                             chat_id=current_chat_id  # 当前操作发生的聊天环境
                         )
@@ -178,19 +181,18 @@ async def process_principal_reduction(update: Update, order: dict, amount: float
 
         group_id = order['group_id']
 
-        # 1. 有效金额减少
-        await update_all_stats('valid', -amount, 0, group_id)
-
-        # 2. 完成金额增加
-        await update_all_stats('completed', amount, 0, group_id)
-
-        # 3. 流动资金增加
-        await update_liquid_capital(amount)
+        # 有效金额减少、完成金额增加、流动资金增加（一次写入）
+        delta = StatsDelta()
+        delta.add('valid', -amount, 0, group_id)
+        delta.add('completed', amount, 0, group_id)
+        delta.add_liquid_capital(amount)
+        await delta.apply()
 
         # 记录收入明细
         user_id = update.effective_user.id if update.effective_user else None
+        income_id = None
         try:
-            await db_operations.record_income(
+            income_id = await db_operations.record_income(
                 date=get_daily_period_date(),
                 type='principal_reduction',
                 amount=amount,
@@ -219,7 +221,8 @@ async def process_principal_reduction(update: Update, order: dict, amount: float
                     'group_id': group_id,
                     'chat_id': order['chat_id'],  # 订单的 chat_id（用于撤销时恢复订单）
                     'order_id': order['order_id'],
-                    'date': get_daily_period_date()
+                    'date': get_daily_period_date(),
+                    'income_record_id': income_id
                 },
                 chat_id=current_chat_id  # 当前操作发生的聊天环境
             )
@@ -258,7 +261,7 @@ async def process_interest(update: Update, order: dict, amount: float, context:
         user_id = update.effective_user.id if update.effective_user else None
         try:
             # 1. 先记录收入明细（如果失败，不更新统计数据）
-            await db_operations.record_income(
+            income_id = await db_operations.record_income(
                 date=get_daily_period_date(),
                 type='interest',
                 amount=amount,
@@ -278,10 +281,11 @@ async def process_interest(update: Update, order: dict, amount: float, context:
 
         # 2. 收入明细记录成功后，再更新统计数据
         try:
-            # 1. 利息收入
-            await update_all_stats('interest', amount, 0, group_id)
-            # 2. 流动资金增加
-            await update_liquid_capital(amount)
+            # 利息收入、流动资金增加（一次写入）
+            delta = StatsDelta()
+            delta.add('interest', amount, 0, group_id)
+            delta.add_liquid_capital(amount)
+            await delta.apply()
         except Exception as e:
             logger.error(f"更新利息收入统计数据失败: {e}", exc_info=True)
             # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
@@ -300,7 +304,8 @@ async def process_interest(update: Update, order: dict, amount: float, context:
                     'amount': amount,
                     'group_id': group_id,
                     'order_id': order['order_id'],
-                    'date': get_daily_period_date()
+                    'date': get_daily_period_date(),
+                    'income_record_id': income_id
                 },
                 chat_id=current_chat_id  # 当前操作发生的聊天环境
             )
@@ -5,6 +5,7 @@ from telegram.ext import ContextTypes
 import db_operations
 from utils.chat_helpers import is_group_chat
 from utils.broadcast_helpers import format_broadcast_message, calculate_next_payment_date
+from utils.broadcast_queue import format_broadcast_job
 from decorators import authorized_required, group_chat_only
 
 logger = logging.getLogger(__name__)
@@ -166,3 +167,31 @@ async def send_broadcast_message(update: Update, context: ContextTypes.DEFAULT_T
     except Exception as e:
         logger.error(f"发送播报消息失败: {e}", exc_info=True)
         await update.message.reply_text(f"❌ 发送失败: {e}")
+
+
+async def show_broadcast_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """查看群发任务状态（管理员命令）
+
+    用法:
+        /broadcast_jobs        最近的群发任务（未完成的在前）
+        /broadcast_jobs <ID>   指定任务的详情和失败群组
+    """
+    if context.args:
+        try:
+            job_id = int(context.args[0].lstrip('#'))
+        except ValueError:
+            await update.message.reply_text("❌ 用法: /broadcast_jobs [任务ID]")
+            return
+        job = await db_operations.get_broadcast_job(job_id)
+        if not job:
+            await update.message.reply_text(f"❌ 群发任务 #{job_id} 不存在")
+            return
+        failures = await db_operations.get_failed_broadcast_recipients(job_id)
+        await update.message.reply_text(format_broadcast_job(job, failures))
+        return
+
+    jobs = await db_operations.get_recent_broadcast_jobs()
+    if not jobs:
+        await update.message.reply_text("📭 暂无群发任务")
+        return
+    await update.message.reply_text("\n\n".join(format_broadcast_job(job) for job in jobs))
@@ -1,6 +1,7 @@
 """命令处理器"""
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 import db_operations
 from utils.chat_helpers import is_group_chat
@@ -69,10 +70,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/set_user_group_id <用户ID> <归属ID> - 设置用户归属ID权限\n"
         "/remove_user_group_id <用户ID> - 移除用户归属ID权限\n"
         "/list_user_group_mappings - 列出所有用户归属ID映射\n"
-        "/update_weekday_groups - 更新星期分组\n"
-        "/fix_statistics - 修复统计数据\n"
+        "/update_weekday_groups [dry] - 更新星期分组（dry 仅预览）\n"
+        "/fix_statistics [dry] - 修复统计数据（dry 仅预览差异）\n"
+        "/rebuild_income_rollup - 重建收入汇总表\n"
         "/find_tail_orders - 查找尾数订单\n"
-        "/check_mismatch [日期] - 检查收入明细和统计数据不一致\n\n"
+        "/check_mismatch [all|日期] - 检查收入明细和统计数据不一致（默认只查有变动的日期）\n"
+        "/broadcast_jobs [ID] - 查看群发任务状态\n\n"
         "⚠️ 部分操作需要管理员权限".format(
             financial_data['liquid_funds'])
     )
@@ -311,89 +314,35 @@ async def remove_employee(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_required
 @private_chat_only
 async def update_weekday_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """更新所有订单的星期分组（管理员命令）"""
-    try:
-        msg = await update.message.reply_text("🔄 开始更新所有订单的星期分组...")
+    """更新所有订单的星期分组（管理员命令）
+
+    用法: /update_weekday_groups [dry]，dry 只统计需要修正的订单，不修改
+    """
+    import time
 
-        # 直接调用更新逻辑
-        from datetime import datetime
-        from utils.chat_helpers import get_weekday_group_from_date
+    dry_run = bool(context.args) and context.args[0].lower() in ('dry', 'preview', '预览')
+    try:
+        msg = await update.message.reply_text(
+            "🔍 正在检查所有订单的星期分组..." if dry_run else "🔄 开始更新所有订单的星期分组...")
 
-        all_orders = await db_operations.search_orders_advanced_all_states({})
+        started = time.monotonic()
+        result = await db_operations.repair_weekday_groups(dry_run=dry_run)
+        elapsed = time.monotonic() - started
 
-        if not all_orders:
+        if result is False:
+            await msg.edit_text("❌ 更新失败：数据库错误，未做任何修改")
+            return
+        if result['total'] == 0:
             await msg.edit_text("❌ 没有找到订单")
             return
 
-        updated_count = 0
-        error_count = 0
-        skipped_count = 0
-
-        for order in all_orders:
-            order_id = order['order_id']
-            chat_id = order['chat_id']
-            order_date_str = order.get('date', '')
-
-            try:
-                # 从订单ID解析日期
-                date_from_id = None
-                if order_id.startswith('A'):
-                    if len(order_id) >= 7 and order_id[1:7].isdigit():
-                        date_part = order_id[1:7]
-                        try:
-                            full_date_str = f"20{date_part}"
-                            date_from_id = datetime.strptime(
-                                full_date_str, "%Y%m%d").date()
-                        except ValueError:
-                            pass
-                else:
-                    if len(order_id) >= 6 and order_id[:6].isdigit():
-                        date_part = order_id[:6]
-                        try:
-                            full_date_str = f"20{date_part}"
-                            date_from_id = datetime.strptime(
-                                full_date_str, "%Y%m%d").date()
-                        except ValueError:
-                            pass
-
-                # 从date字段解析日期
-                date_from_db = None
-                if order_date_str:
-                    try:
-                        date_str = order_date_str.split(
-                        )[0] if ' ' in order_date_str else order_date_str
-                        date_from_db = datetime.strptime(
-                            date_str, "%Y-%m-%d").date()
-                    except ValueError:
-                        pass
-
-                order_date = date_from_id or date_from_db
-
-                if not order_date:
-                    skipped_count += 1
-                    continue
-
-                # 计算正确的星期分组
-                correct_weekday_group = get_weekday_group_from_date(order_date)
-
-                # 更新
-                success = await db_operations.update_order_weekday_group(chat_id, correct_weekday_group)
-
-                if success:
-                    updated_count += 1
-                else:
-                    error_count += 1
-
-            except Exception as e:
-                logger.error(f"处理订单 {order_id} 时出错: {e}")
-                error_count += 1
-
         result_msg = (
-            f"✅ 更新完成！\n\n"
-            f"已更新: {updated_count} 个订单\n"
-            f"跳过: {skipped_count} 个订单\n"
-            f"错误: {error_count} 个订单\n"
-            f"总计: {len(all_orders)} 个订单"
+            f"{'🔍 预览完成（未修改）' if dry_run else '✅ 更新完成！'}\n\n"
+            f"{'需要更新' if dry_run else '已更新'}: {result['updated']} 个订单\n"
+            f"无需更新: {result['unchanged']} 个订单\n"
+            f"跳过(无法解析日期): {result['skipped']} 个订单\n"
+            f"总计: {result['total']} 个订单\n"
+            f"耗时: {elapsed:.2f} 秒"
         )
 
         await msg.edit_text(result_msg)
@@ -403,72 +352,70 @@ async def update_weekday_groups(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text(f"❌ 更新失败: {str(e)}")
 
 
-@admin_required
-@private_chat_only
-async def fix_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """修复统计数据：根据实际订单数据重新计算所有统计数据（管理员命令）"""
-    try:
-        msg = await update.message.reply_text("🔄 开始修复统计数据...")
+# 对账结果中各字段的显示名称
+_RECONCILE_FIELD_LABELS = {
+    'valid_orders': '有效订单数',
+    'valid_amount': '有效金额',
+    'breach_orders': '违约订单数',
+    'breach_amount': '违约金额',
+}
 
-        # 直接在这里实现修复逻辑
-        all_orders = await db_operations.search_orders_advanced_all_states({})
-        all_group_ids = list(set(order.get('group_id')
-                             for order in all_orders if order.get('group_id')))
+# 对账结果最多列出的归属ID数（避免超出消息长度限制）
+_RECONCILE_MAX_GROUPS = 50
 
-        fixed_count = 0
-        fixed_groups = []
 
-        for group_id in sorted(all_group_ids):
-            group_orders = [o for o in all_orders if o.get(
-                'group_id') == group_id]
-            valid_orders = [o for o in group_orders if o.get('state') in [
-                'normal', 'overdue']]
+def _format_stats_diffs(diffs: dict) -> str:
+    """格式化字段差异：有效订单数 3 → 5 (+2)"""
+    parts = []
+    for field, d in diffs.items():
+        label = _RECONCILE_FIELD_LABELS.get(field, field)
+        if field.endswith('_orders'):
+            parts.append(f"{label} {int(d['current'])} → {int(d['actual'])} ({int(d['diff']):+d})")
+        else:
+            parts.append(f"{label} {d['current']:,.2f} → {d['actual']:,.2f} ({d['diff']:+,.2f})")
+    return "，".join(parts)
 
-            actual_valid_count = len(valid_orders)
-            actual_valid_amount = sum(o.get('amount', 0) for o in valid_orders)
 
-            grouped_data = await db_operations.get_grouped_data(group_id)
+@admin_required
+@private_chat_only
+async def fix_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """修复统计数据：根据实际订单数据重新计算有效/违约统计（管理员命令）
 
-            valid_count_diff = actual_valid_count - \
-                grouped_data['valid_orders']
-            valid_amount_diff = actual_valid_amount - \
-                grouped_data['valid_amount']
-
-            if abs(valid_count_diff) > 0 or abs(valid_amount_diff) > 0.01:
-                if valid_count_diff != 0:
-                    await db_operations.update_grouped_data(group_id, 'valid_orders', valid_count_diff)
-                if abs(valid_amount_diff) > 0.01:
-                    await db_operations.update_grouped_data(group_id, 'valid_amount', valid_amount_diff)
-                fixed_count += 1
-                fixed_groups.append(
-                    f"{group_id} (订单数: {valid_count_diff}, 金额: {valid_amount_diff:,.2f})")
-
-        # 修复全局统计
-        all_valid_orders = [o for o in all_orders if o.get('state') in [
-            'normal', 'overdue']]
-        global_valid_count = len(all_valid_orders)
-        global_valid_amount = sum(o.get('amount', 0) for o in all_valid_orders)
+    用法: /fix_statistics [dry]，dry 只预览差异，不写入
+    """
+    try:
+        dry_run = bool(context.args) and context.args[0].lower() in ('dry', 'preview', '预览')
+        msg = await update.message.reply_text(
+            "🔍 正在对账统计数据（预览模式）..." if dry_run else "🔄 开始修复统计数据...")
 
-        financial_data = await db_operations.get_financial_data()
-        global_valid_count_diff = global_valid_count - \
-            financial_data['valid_orders']
-        global_valid_amount_diff = global_valid_amount - \
-            financial_data['valid_amount']
-
-        if abs(global_valid_count_diff) > 0 or abs(global_valid_amount_diff) > 0.01:
-            if global_valid_count_diff != 0:
-                await db_operations.update_financial_data('valid_orders', global_valid_count_diff)
-            if abs(global_valid_amount_diff) > 0.01:
-                await db_operations.update_financial_data('valid_amount', global_valid_amount_diff)
-            fixed_count += 1
-
-        if fixed_count > 0:
-            result_msg = f"✅ 统计数据修复完成！\n\n已修复 {fixed_count} 个归属ID的统计数据。"
-            if fixed_groups:
-                result_msg += f"\n\n修复的归属ID:\n" + \
-                    "\n".join(f"• {g}" for g in fixed_groups)
+        result = await db_operations.reconcile_order_stats(dry_run=dry_run)
+        if result is False:
+            await msg.edit_text("❌ 修复失败：数据库错误，未写入任何修改")
+            return
+
+        group_diffs = result['groups']
+        global_diffs = result['global']
+        if not group_diffs and not global_diffs:
+            await msg.edit_text(
+                f"✅ 统计数据一致，无需修复。（已检查 {result['checked_groups']} 个归属ID）")
+            return
+
+        if dry_run:
+            result_msg = f"🔍 统计数据差异预览（未写入）\n\n共 {len(group_diffs)} 个归属ID存在差异"
         else:
-            result_msg = "✅ 统计数据一致，无需修复。"
+            result_msg = f"✅ 统计数据修复完成！\n\n已修复 {len(group_diffs)} 个归属ID的统计数据"
+        result_msg += f"（已检查 {result['checked_groups']} 个）。"
+
+        if group_diffs:
+            lines = [f"• {group_id}: {_format_stats_diffs(diffs)}"
+                     for group_id, diffs in list(group_diffs.items())[:_RECONCILE_MAX_GROUPS]]
+            if len(group_diffs) > _RECONCILE_MAX_GROUPS:
+                lines.append(f"… 另有 {len(group_diffs) - _RECONCILE_MAX_GROUPS} 个归属ID")
+            result_msg += "\n\n归属ID:\n" + "\n".join(lines)
+        if global_diffs:
+            result_msg += f"\n\n全局: {_format_stats_diffs(global_diffs)}"
+        if dry_run:
+            result_msg += "\n\n确认无误后运行 /fix_statistics 执行修复"
 
         await msg.edit_text(result_msg)
 
@@ -477,156 +424,86 @@ async def fix_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ 修复失败: {str(e)}")
 
 
+_INCOME_FIELD_LABELS = {
+    'interest': '利息收入',
+    'completed_amount': '完成订单金额',
+    'completed_orders': '完成订单数',
+    'breach_end_amount': '违约完成金额',
+    'breach_end_orders': '违约完成订单数',
+}
+
+
 @admin_required
 @private_chat_only
 @error_handler
 async def fix_income_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """修复收入统计数据：根据收入明细重新计算所有收入统计数据（管理员命令）"""
+    """修复收入统计数据：根据收入明细重新计算所有收入统计数据（管理员命令）
+
+    用法: /fix_income_statistics [dry]，dry 只预览差异，不写入
+    """
+    import asyncio
+    import time
+
     try:
-        msg = await update.message.reply_text("🔄 开始修复收入统计数据...")
+        dry_run = bool(context.args) and context.args[0].lower() in ('dry', 'preview', '预览')
+        title = "🔍 收入统计对账（预览模式）" if dry_run else "🔄 开始修复收入统计数据"
+        msg = await update.message.reply_text(f"{title}...")
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        progress_edits = []
+
+        async def edit_progress(stage: str):
+            try:
+                await msg.edit_text(f"{title}\n⏳ {stage}...")
+            except BadRequest:
+                # 文本未变化（message is not modified）等，进度消息无需处理
+                pass
+
+        def report_progress(stage: str):
+            # 可能在数据库线程中调用，统一转交事件循环更新进度消息
+            progress_edits.append(
+                asyncio.run_coroutine_threadsafe(edit_progress(stage), loop))
+
+        try:
+            result = await db_operations.reconcile_income_stats(
+                dry_run=dry_run, progress=report_progress)
+        finally:
+            # 等所有进度更新结束，避免晚到的进度覆盖最终结果
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in progress_edits),
+                                 return_exceptions=True)
+        if result is False:
+            await msg.edit_text("❌ 修复失败：数据库错误，未写入任何修改")
+            return
 
-        # 获取所有收入明细
-        income_records = await db_operations.get_income_records("1970-01-01", "2099-12-31")
-        
-        # 计算收入明细汇总
-        income_summary = {
-            'interest': 0.0,
-            'completed_amount': 0.0,
-            'breach_end_amount': 0.0,
-            'completed_count': 0,
-            'breach_end_count': 0
-        }
-        
-        # 按日期和归属ID分组统计
-        daily_income = {}  # {date: {group_id: {type: amount}}}
-        global_income = {}  # {type: amount}
-        
-        for record in income_records:
-            record_type = record.get('type', '')
-            amount = record.get('amount', 0.0) or 0.0
-            date = record.get('date', '')
-            group_id = record.get('group_id')
-            
-            if record_type == 'interest':
-                income_summary['interest'] += amount
-                global_income['interest'] = global_income.get('interest', 0.0) + amount
-                if date not in daily_income:
-                    daily_income[date] = {}
-                if group_id not in daily_income[date]:
-                    daily_income[date][group_id] = {}
-                daily_income[date][group_id]['interest'] = daily_income[date][group_id].get('interest', 0.0) + amount
-            elif record_type == 'completed':
-                income_summary['completed_amount'] += amount
-                income_summary['completed_count'] += 1
-                global_income['completed_amount'] = global_income.get('completed_amount', 0.0) + amount
-                global_income['completed_count'] = global_income.get('completed_count', 0) + 1
-                if date not in daily_income:
-                    daily_income[date] = {}
-                if group_id not in daily_income[date]:
-                    daily_income[date][group_id] = {}
-                daily_income[date][group_id]['completed_amount'] = daily_income[date][group_id].get('completed_amount', 0.0) + amount
-                daily_income[date][group_id]['completed_count'] = daily_income[date][group_id].get('completed_count', 0) + 1
-            elif record_type == 'breach_end':
-                income_summary['breach_end_amount'] += amount
-                income_summary['breach_end_count'] += 1
-                global_income['breach_end_amount'] = global_income.get('breach_end_amount', 0.0) + amount
-                global_income['breach_end_count'] = global_income.get('breach_end_count', 0) + 1
-                if date not in daily_income:
-                    daily_income[date] = {}
-                if group_id not in daily_income[date]:
-                    daily_income[date][group_id] = {}
-                daily_income[date][group_id]['breach_end_amount'] = daily_income[date][group_id].get('breach_end_amount', 0.0) + amount
-                daily_income[date][group_id]['breach_end_count'] = daily_income[date][group_id].get('breach_end_count', 0) + 1
-
-        # 获取当前统计数据
-        financial_data = await db_operations.get_financial_data()
-        stats = await db_operations.get_stats_by_date_range("1970-01-01", "2099-12-31", None)
-        
-        fixed_items = []
-        
-        # 修复全局统计数据（financial_data表）
-        interest_diff = income_summary['interest'] - financial_data.get('interest', 0.0)
-        if abs(interest_diff) > 0.01:
-            await db_operations.update_financial_data('interest', interest_diff)
-            fixed_items.append(f"全局利息收入: {interest_diff:+,.2f}")
-        
-        completed_amount_diff = income_summary['completed_amount'] - financial_data.get('completed_amount', 0.0)
-        if abs(completed_amount_diff) > 0.01:
-            await db_operations.update_financial_data('completed_amount', completed_amount_diff)
-            fixed_items.append(f"全局完成订单金额: {completed_amount_diff:+,.2f}")
-        
-        completed_count_diff = income_summary['completed_count'] - financial_data.get('completed_orders', 0)
-        if abs(completed_count_diff) > 0:
-            await db_operations.update_financial_data('completed_orders', float(completed_count_diff))
-            fixed_items.append(f"全局完成订单数: {completed_count_diff:+d}")
-        
-        breach_end_amount_diff = income_summary['breach_end_amount'] - financial_data.get('breach_end_amount', 0.0)
-        if abs(breach_end_amount_diff) > 0.01:
-            await db_operations.update_financial_data('breach_end_amount', breach_end_amount_diff)
-            fixed_items.append(f"全局违约完成金额: {breach_end_amount_diff:+,.2f}")
-        
-        breach_end_count_diff = income_summary['breach_end_count'] - financial_data.get('breach_end_orders', 0)
-        if abs(breach_end_count_diff) > 0:
-            await db_operations.update_financial_data('breach_end_orders', float(breach_end_count_diff))
-            fixed_items.append(f"全局违约完成订单数: {breach_end_count_diff:+d}")
-        
-        # 修复日结统计数据（daily_data表）
-        # 这里需要重新计算所有日期的统计数据
-        # 由于daily_data表是按日期和归属ID存储的，我们需要遍历所有日期和归属ID
-        daily_fixed_count = 0
-        for date, groups in daily_income.items():
-            for group_id, income_data in groups.items():
-                # 获取当前日结数据
-                current_daily = await db_operations.get_stats_by_date_range(date, date, group_id)
-                
-                # 修复利息收入
-                if 'interest' in income_data:
-                    interest_diff = income_data['interest'] - current_daily.get('interest', 0.0)
-                    if abs(interest_diff) > 0.01:
-                        await db_operations.update_daily_data(date, 'interest', interest_diff, group_id)
-                        daily_fixed_count += 1
-                
-                # 修复完成订单
-                if 'completed_amount' in income_data:
-                    completed_amount_diff = income_data['completed_amount'] - current_daily.get('completed_amount', 0.0)
-                    if abs(completed_amount_diff) > 0.01:
-                        await db_operations.update_daily_data(date, 'completed_amount', completed_amount_diff, group_id)
-                        daily_fixed_count += 1
-                
-                if 'completed_count' in income_data:
-                    completed_count_diff = income_data['completed_count'] - current_daily.get('completed_orders', 0)
-                    if abs(completed_count_diff) > 0:
-                        await db_operations.update_daily_data(date, 'completed_orders', float(completed_count_diff), group_id)
-                        daily_fixed_count += 1
-                
-                # 修复违约完成
-                if 'breach_end_amount' in income_data:
-                    breach_end_amount_diff = income_data['breach_end_amount'] - current_daily.get('breach_end_amount', 0.0)
-                    if abs(breach_end_amount_diff) > 0.01:
-                        await db_operations.update_daily_data(date, 'breach_end_amount', breach_end_amount_diff, group_id)
-                        daily_fixed_count += 1
-                
-                if 'breach_end_count' in income_data:
-                    breach_end_count_diff = income_data['breach_end_count'] - current_daily.get('breach_end_orders', 0)
-                    if abs(breach_end_count_diff) > 0:
-                        await db_operations.update_daily_data(date, 'breach_end_orders', float(breach_end_count_diff), group_id)
-                        daily_fixed_count += 1
-        
-        # 构建结果消息
-        if fixed_items or daily_fixed_count > 0:
-            result_msg = "✅ 收入统计数据修复完成！\n\n"
-            if fixed_items:
-                result_msg += "修复的全局统计:\n"
-                for item in fixed_items:
-                    result_msg += f"  • {item}\n"
-            if daily_fixed_count > 0:
-                result_msg += f"\n修复的日结统计: {daily_fixed_count} 条记录\n"
-            result_msg += f"\n📊 修复后的汇总:\n"
-            result_msg += f"  利息收入: {income_summary['interest']:.2f}\n"
-            result_msg += f"  完成订单: {income_summary['completed_count']} 笔, {income_summary['completed_amount']:.2f}\n"
-            result_msg += f"  违约完成: {income_summary['breach_end_count']} 笔, {income_summary['breach_end_amount']:.2f}\n"
-        else:
+        daily_corrections = result['daily']
+        global_diffs = result['global']
+        totals = result['totals']
+        elapsed = time.monotonic() - started
+
+        if not daily_corrections and not global_diffs:
             result_msg = "✅ 收入统计数据一致，无需修复。"
+        else:
+            result_msg = ("🔍 收入统计差异预览（未写入）\n\n" if dry_run
+                          else "✅ 收入统计数据修复完成！\n\n")
+            if global_diffs:
+                result_msg += "全局统计:\n"
+                for field, d in global_diffs.items():
+                    label = _INCOME_FIELD_LABELS[field]
+                    if field.endswith('_orders'):
+                        result_msg += f"  • {label}: {int(d['diff']):+d}\n"
+                    else:
+                        result_msg += f"  • {label}: {d['diff']:+,.2f}\n"
+            if daily_corrections:
+                result_msg += f"\n日结统计: {len(daily_corrections)} 条记录需要修正\n" if dry_run \
+                    else f"\n修复的日结统计: {len(daily_corrections)} 条记录\n"
+            if dry_run:
+                result_msg += "\n确认无误后运行 /fix_income_statistics 执行修复\n"
+
+        result_msg += f"\n📊 收入明细汇总:\n"
+        result_msg += f"  利息收入: {totals['interest']:.2f}\n"
+        result_msg += f"  完成订单: {int(totals['completed_orders'])} 笔, {totals['completed_amount']:.2f}\n"
+        result_msg += f"  违约完成: {int(totals['breach_end_orders'])} 笔, {totals['breach_end_amount']:.2f}\n"
+        result_msg += f"\n已检查 {result['checked_rows']} 条日结数据，耗时 {elapsed:.2f} 秒"
 
         await msg.edit_text(result_msg)
 
@@ -635,6 +512,19 @@ async def fix_income_statistics(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text(f"❌ 修复失败: {str(e)}")
 
 
+@admin_required
+@private_chat_only
+@error_handler
+async def rebuild_income_rollup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """根据收入明细重建收入汇总表（管理员命令）"""
+    msg = await update.message.reply_text("🔄 正在重建收入汇总表...")
+    row_count = await db_operations.rebuild_income_rollup()
+    if row_count is False:
+        await msg.edit_text("❌ 重建收入汇总表失败")
+        return
+    await msg.edit_text(f"✅ 收入汇总表重建完成，共 {row_count} 条汇总记录")
+
+
 @admin_required
 @private_chat_only
 async def find_tail_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -877,20 +767,111 @@ async def list_user_group_mappings(update: Update, context: ContextTypes.DEFAULT
     await update.message.reply_text(message, parse_mode='Markdown')
 
 
+_CONSISTENCY_FIELD_LABELS = {
+    'interest': '利息收入',
+    'completed_amount': '完成订单金额',
+    'breach_end_amount': '违约完成金额',
+}
+
+# 一致性报告中最多列出的不一致日期数
+_MISMATCH_MAX_DATES = 30
+
+
+def format_consistency_report(result: dict, start_date: str = None, end_date: str = None) -> str:
+    """格式化 check_stats_consistency 的结果"""
+    output_lines = []
+    output_lines.append(f"📊 数据一致性检查报告")
+    if result['dirty_only']:
+        output_lines.append(f"📅 核对上次检查后有变动的日期: {result['checked_dates']} 天")
+    elif start_date == end_date:
+        output_lines.append(f"📅 检查日期: {start_date}")
+    else:
+        output_lines.append(f"📅 检查日期范围: {start_date} 至 {end_date}（{result['checked_dates']} 天）")
+    output_lines.append("=" * 50)
+    output_lines.append("")
+
+    income_totals = result['income_totals']
+    daily_totals = result['daily_totals']
+    output_lines.append("📈 收入明细汇总（从income_records表）:")
+    for field, label in _CONSISTENCY_FIELD_LABELS.items():
+        output_lines.append(f"  {label}: {income_totals[field]:.2f}")
+    output_lines.append(f"  本金减少: {income_totals['principal_reduction']:.2f}")
+    output_lines.append("")
+
+    output_lines.append("📊 统计数据汇总（从daily_data表）:")
+    for field, label in _CONSISTENCY_FIELD_LABELS.items():
+        output_lines.append(f"  {label}: {daily_totals[field]:.2f}")
+    output_lines.append("")
+    output_lines.append("=" * 50)
+    output_lines.append("")
+
+    mismatches = []
+    if result['mismatches']:
+        mismatches.append(f"{len(result['mismatches'])} 个日期的日结统计")
+        output_lines.append(f"⚠️ 日结统计与收入明细不一致的日期:")
+        for item in result['mismatches'][:_MISMATCH_MAX_DATES]:
+            parts = [f"{_CONSISTENCY_FIELD_LABELS[field]} {d['daily']:.2f}/{d['income']:.2f}"
+                     for field, d in item.items() if field != 'date']
+            output_lines.append(f"  {item['date']}: " + "，".join(parts))
+        if len(result['mismatches']) > _MISMATCH_MAX_DATES:
+            output_lines.append(f"  … 另有 {len(result['mismatches']) - _MISMATCH_MAX_DATES} 个日期")
+        output_lines.append("  （格式：统计表/明细表）")
+        output_lines.append("")
+
+    # 检查全局统计数据与收入明细的一致性
+    for field, d in result['global'].items():
+        label = _CONSISTENCY_FIELD_LABELS[field]
+        mismatches.append(f"全局{label}")
+        output_lines.append(f"⚠️ 不一致! 全局{label}:")
+        output_lines.append(f"  全局统计(financial_data): {d['financial']:.2f}")
+        output_lines.append(f"  明细表(income_records): {d['income']:.2f}")
+        output_lines.append(f"  差异: {abs(d['diff']):.2f}")
+        output_lines.append("")
+
+    if not mismatches:
+        output_lines.append("✅ 数据一致！所有统计数据与收入明细匹配。")
+    else:
+        output_lines.append("")
+        output_lines.append(f"❌ 发现 {len(mismatches)} 项不一致:")
+        for item in mismatches:
+            output_lines.append(f"  - {item}")
+        output_lines.append("")
+        output_lines.append("💡 修复建议:")
+        output_lines.append("  1. 检查收入明细是否正确记录")
+        output_lines.append("  2. 使用 /fix_income_statistics 修复收入统计数据")
+        output_lines.append("  3. 如果问题持续，请检查日志文件")
+
+    if result['cleared']:
+        output_lines.append("")
+        output_lines.append(f"🧹 已确认一致的日期: {result['cleared']} 天（下次默认检查将跳过）")
+
+    output_lines.append("")
+    output_lines.append("💡 提示：要查看统计收入的来源明细，请使用：")
+    output_lines.append("  /report → 点击「💰 收入明细」按钮")
+    return "\n".join(output_lines)
+
+
 @admin_required
 @private_chat_only
 @error_handler
 async def check_mismatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """检查收入明细和统计数据的不一致问题（管理员命令）"""
-    from datetime import datetime
-    from utils.date_helpers import get_daily_period_date
+    """检查收入明细和统计数据的不一致问题（管理员命令）
+
+    用法:
+        /check_mismatch              只核对上次检查后有变动的日期
+        /check_mismatch all          核对全部历史数据
+        /check_mismatch 日期 [日期]   核对指定日期或日期范围
+    """
     import db_operations
 
     # 获取日期参数（可选），支持日期范围
     start_date = None
     end_date = None
     if context.args and len(context.args) > 0:
-        if len(context.args) == 1:
+        if context.args[0].lower() == 'all':
+            start_date = "1970-01-01"
+            end_date = "2099-12-31"
+        elif len(context.args) == 1:
             # 单个日期
             start_date = context.args[0]
             end_date = context.args[0]
@@ -898,156 +879,17 @@ async def check_mismatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 日期范围
             start_date = context.args[0]
             end_date = context.args[1]
-    else:
-        # 默认检查所有历史数据
-        start_date = "1970-01-01"
-        end_date = "2099-12-31"
 
     # 发送开始消息
     msg = await update.message.reply_text("🔍 正在检查数据不一致问题，请稍候...")
 
     try:
-        # 获取所有收入明细统计（从最早日期到现在）
-        income_records = await db_operations.get_income_records(start_date, end_date)
-        
-        # 计算收入明细汇总
-        income_summary = {
-            'interest': 0.0,
-            'completed_amount': 0.0,
-            'breach_end_amount': 0.0,
-            'principal_reduction': 0.0,
-            'adjustment': 0.0
-        }
-        
-        for record in income_records:
-            record_type = record.get('type', '')
-            amount = record.get('amount', 0.0) or 0.0
-            if record_type == 'interest':
-                income_summary['interest'] += amount
-            elif record_type == 'completed':
-                income_summary['completed_amount'] += amount
-            elif record_type == 'breach_end':
-                income_summary['breach_end_amount'] += amount
-            elif record_type == 'principal_reduction':
-                income_summary['principal_reduction'] += amount
-            elif record_type == 'adjustment':
-                income_summary['adjustment'] += amount
-
-        # 获取统计数据（从daily_data表汇总）
-        stats = await db_operations.get_stats_by_date_range(start_date, end_date, None)
-        
-        # 获取全局统计数据（从financial_data表）
-        financial_data = await db_operations.get_financial_data()
-        
-        # 比较数据
-        output_lines = []
-        output_lines.append(f"📊 数据一致性检查报告")
-        if start_date == end_date:
-            output_lines.append(f"📅 检查日期: {start_date}")
-        else:
-            output_lines.append(f"📅 检查日期范围: {start_date} 至 {end_date}")
-        output_lines.append("=" * 50)
-        output_lines.append("")
-        
-        output_lines.append("📈 收入明细汇总（从income_records表）:")
-        output_lines.append(f"  利息收入: {income_summary['interest']:.2f}")
-        output_lines.append(f"  完成订单金额: {income_summary['completed_amount']:.2f}")
-        output_lines.append(f"  违约完成金额: {income_summary['breach_end_amount']:.2f}")
-        output_lines.append(f"  本金减少: {income_summary['principal_reduction']:.2f}")
-        output_lines.append("")
-        
-        output_lines.append("📊 统计数据汇总（从daily_data表）:")
-        output_lines.append(f"  利息收入: {stats.get('interest', 0.0):.2f}")
-        output_lines.append(f"  完成订单金额: {stats.get('completed_amount', 0.0):.2f}")
-        output_lines.append(f"  违约完成金额: {stats.get('breach_end_amount', 0.0):.2f}")
-        output_lines.append("")
-        
-        output_lines.append("💰 全局统计数据（从financial_data表）:")
-        output_lines.append(f"  利息收入: {financial_data.get('interest', 0.0):.2f}")
-        output_lines.append(f"  完成订单金额: {financial_data.get('completed_amount', 0.0):.2f}")
-        output_lines.append(f"  违约完成金额: {financial_data.get('breach_end_amount', 0.0):.2f}")
-        output_lines.append("")
-        output_lines.append("=" * 50)
-        output_lines.append("")
-        
-        mismatches = []
-        
-        # 检查利息收入（比较daily_data和income_records）
-        interest_diff = abs(stats.get('interest', 0.0) - income_summary['interest'])
-        if interest_diff > 0.01:  # 允许0.01的浮点误差
-            mismatches.append("利息收入")
-            output_lines.append(f"⚠️ 不一致! 利息收入:")
-            output_lines.append(f"  统计表(daily_data): {stats.get('interest', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['interest']:.2f}")
-            output_lines.append(f"  差异: {interest_diff:.2f}")
-            output_lines.append("")
-        
-        # 检查完成订单金额
-        completed_diff = abs(stats.get('completed_amount', 0.0) - income_summary['completed_amount'])
-        if completed_diff > 0.01:
-            mismatches.append("完成订单金额")
-            output_lines.append(f"⚠️ 不一致! 完成订单金额:")
-            output_lines.append(f"  统计表(daily_data): {stats.get('completed_amount', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['completed_amount']:.2f}")
-            output_lines.append(f"  差异: {completed_diff:.2f}")
-            output_lines.append("")
-        
-        # 检查违约完成金额
-        breach_end_diff = abs(stats.get('breach_end_amount', 0.0) - income_summary['breach_end_amount'])
-        if breach_end_diff > 0.01:
-            mismatches.append("违约完成金额")
-            output_lines.append(f"⚠️ 不一致! 违约完成金额:")
-            output_lines.append(f"  统计表(daily_data): {stats.get('breach_end_amount', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['breach_end_amount']:.2f}")
-            output_lines.append(f"  差异: {breach_end_diff:.2f}")
-            output_lines.append("")
-        
-        # 检查全局统计数据与收入明细的一致性
-        global_interest_diff = abs(financial_data.get('interest', 0.0) - income_summary['interest'])
-        if global_interest_diff > 0.01:
-            mismatches.append("全局利息收入")
-            output_lines.append(f"⚠️ 不一致! 全局利息收入:")
-            output_lines.append(f"  全局统计(financial_data): {financial_data.get('interest', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['interest']:.2f}")
-            output_lines.append(f"  差异: {global_interest_diff:.2f}")
-            output_lines.append("")
-        
-        global_completed_diff = abs(financial_data.get('completed_amount', 0.0) - income_summary['completed_amount'])
-        if global_completed_diff > 0.01:
-            mismatches.append("全局完成订单金额")
-            output_lines.append(f"⚠️ 不一致! 全局完成订单金额:")
-            output_lines.append(f"  全局统计(financial_data): {financial_data.get('completed_amount', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['completed_amount']:.2f}")
-            output_lines.append(f"  差异: {global_completed_diff:.2f}")
-            output_lines.append("")
-        
-        global_breach_end_diff = abs(financial_data.get('breach_end_amount', 0.0) - income_summary['breach_end_amount'])
-        if global_breach_end_diff > 0.01:
-            mismatches.append("全局违约完成金额")
-            output_lines.append(f"⚠️ 不一致! 全局违约完成金额:")
-            output_lines.append(f"  全局统计(financial_data): {financial_data.get('breach_end_amount', 0.0):.2f}")
-            output_lines.append(f"  明细表(income_records): {income_summary['breach_end_amount']:.2f}")
-            output_lines.append(f"  差异: {global_breach_end_diff:.2f}")
-            output_lines.append("")
-        
-        if not mismatches:
-            output_lines.append("✅ 数据一致！所有统计数据与收入明细匹配。")
-        else:
-            output_lines.append("")
-            output_lines.append(f"❌ 发现 {len(mismatches)} 项不一致:")
-            for item in mismatches:
-                output_lines.append(f"  - {item}")
-            output_lines.append("")
-            output_lines.append("💡 修复建议:")
-            output_lines.append("  1. 检查收入明细是否正确记录")
-            output_lines.append("  2. 使用 /fix_statistics 修复统计数据")
-            output_lines.append("  3. 如果问题持续，请检查日志文件")
-        
-        output_lines.append("")
-        output_lines.append("💡 提示：要查看统计收入的来源明细，请使用：")
-        output_lines.append("  /report → 点击「💰 收入明细」按钮")
-        
-        output = "\n".join(output_lines)
+        result = await db_operations.check_stats_consistency(start_date, end_date)
+        if result is False:
+            await msg.edit_text("❌ 检查失败：数据库错误")
+            return
+
+        output = format_consistency_report(result, start_date, end_date)
         
         # 处理输出（Telegram消息有长度限制4096字符）
         if len(output) > 4096:
@@ -1114,66 +956,91 @@ async def customer_contribution(update: Update, context: ContextTypes.DEFAULT_TY
 
     try:
         msg = await update.message.reply_text("🔍 正在查询客户总贡献，请稍候...")
+        report, reply_markup = await build_customer_contribution_report(
+            customer, start_date, end_date, page=1)
+        await msg.edit_text(report, reply_markup=reply_markup)
 
-        # 查询总贡献
-        total_contribution = await db_operations.get_customer_total_contribution(
-            customer, start_date, end_date
-        )
+    except Exception as e:
+        logger.error(f"查询客户总贡献时出错: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ 查询失败: {str(e)}")
 
-        # 查询所有订单详情
-        orders_summary = await db_operations.get_customer_orders_summary(
-            customer, start_date, end_date
-        )
 
-        # 构建报告
-        customer_name = "新客户" if customer == 'A' else "老客户"
-        date_range = ""
-        if start_date or end_date:
-            date_range = f"\n📅 查询日期范围: {start_date or '最早'} 至 {end_date or '最新'}"
-
-        report = (
-            f"📊 {customer_name} (客户类型: {customer}) 总贡献报告{date_range}\n"
-            f"{'=' * 60}\n\n"
-            f"💰 总贡献汇总:\n"
-            f"  总贡献金额: {total_contribution['total_amount']:,.2f}\n"
-            f"  其中:\n"
-            f"    - 利息收入: {total_contribution['total_interest']:,.2f} ({total_contribution['interest_count']} 次)\n"
-            f"    - 完成订单: {total_contribution['total_completed']:,.2f}\n"
-            f"    - 违约完成: {total_contribution['total_breach_end']:,.2f}\n"
-            f"    - 本金减少: {total_contribution['total_principal_reduction']:,.2f}\n\n"
-            f"📋 订单统计:\n"
-            f"  订单数量: {total_contribution['order_count']} 个\n"
-        )
+# 客户贡献报告每页显示的订单数
+CUSTOMER_ORDERS_PAGE_SIZE = 10
 
-        if total_contribution['first_order_date']:
-            report += (
-                f"  首次订单: {total_contribution['first_order_date']}\n"
-                f"  最后订单: {total_contribution['last_order_date']}\n"
-            )
 
-        # 显示订单明细（前10个）
-        if orders_summary:
-            report += f"\n📝 订单明细 (显示前 {min(10, len(orders_summary))} 个):\n"
-            report += f"{'-' * 60}\n"
-
-            for i, order_info in enumerate(orders_summary[:10], 1):
-                order = order_info['order']
-                report += (
-                    f"\n{i}. 订单: {order['order_id']}\n"
-                    f"   日期: {order['date']}\n"
-                    f"   状态: {order['state']}\n"
-                    f"   金额: {order['amount']:,.2f}\n"
-                    f"   贡献: {order_info['total_contribution']:,.2f}\n"
-                    f"      - 利息: {order_info['interest']:,.2f}\n"
-                    f"      - 完成: {order_info['completed']:,.2f}\n"
-                    f"      - 违约完成: {order_info['breach_end']:,.2f}\n"
-                )
+async def build_customer_contribution_report(customer: str, start_date: str = None,
+                                             end_date: str = None, page: int = 1):
+    """生成客户总贡献报告（订单明细在SQL中分页）
 
-            if len(orders_summary) > 10:
-                report += f"\n... 还有 {len(orders_summary) - 10} 个订单\n"
+    Returns:
+        (报告文本, 分页按钮 或 None)
+    """
+    contribution = await db_operations.get_customer_contribution_report(
+        customer, start_date, end_date,
+        limit=CUSTOMER_ORDERS_PAGE_SIZE,
+        offset=(page - 1) * CUSTOMER_ORDERS_PAGE_SIZE
+    )
+    orders_summary = contribution['orders']
+    order_count = contribution['order_count']
+    total_pages = max(1, (order_count + CUSTOMER_ORDERS_PAGE_SIZE -
+                      1) // CUSTOMER_ORDERS_PAGE_SIZE)
+
+    # 构建报告
+    customer_name = "新客户" if customer == 'A' else "老客户"
+    date_range = ""
+    if start_date or end_date:
+        date_range = f"\n📅 查询日期范围: {start_date or '最早'} 至 {end_date or '最新'}"
+
+    report = (
+        f"📊 {customer_name} (客户类型: {customer}) 总贡献报告{date_range}\n"
+        f"{'=' * 60}\n\n"
+        f"💰 总贡献汇总:\n"
+        f"  总贡献金额: {contribution['total_amount']:,.2f}\n"
+        f"  其中:\n"
+        f"    - 利息收入: {contribution['total_interest']:,.2f} ({contribution['interest_count']} 次)\n"
+        f"    - 完成订单: {contribution['total_completed']:,.2f}\n"
+        f"    - 违约完成: {contribution['total_breach_end']:,.2f}\n"
+        f"    - 本金减少: {contribution['total_principal_reduction']:,.2f}\n\n"
+        f"📋 订单统计:\n"
+        f"  订单数量: {order_count} 个\n"
+    )
 
-        await msg.edit_text(report)
+    if contribution['first_order_date']:
+        report += (
+            f"  首次订单: {contribution['first_order_date']}\n"
+            f"  最后订单: {contribution['last_order_date']}\n"
+        )
 
-    except Exception as e:
-        logger.error(f"查询客户总贡献时出错: {e}", exc_info=True)
-        await update.message.reply_text(f"❌ 查询失败: {str(e)}")
+    # 显示当前页订单明细
+    if orders_summary:
+        report += f"\n📝 订单明细 (第 {page}/{total_pages} 页):\n"
+        report += f"{'-' * 60}\n"
+
+        first_index = (page - 1) * CUSTOMER_ORDERS_PAGE_SIZE + 1
+        for i, order_info in enumerate(orders_summary, first_index):
+            order = order_info['order']
+            report += (
+                f"\n{i}. 订单: {order['order_id']}\n"
+                f"   日期: {order['date']}\n"
+                f"   状态: {order['state']}\n"
+                f"   金额: {order['amount']:,.2f}\n"
+                f"   贡献: {order_info['total_contribution']:,.2f}\n"
+                f"      - 利息: {order_info['interest']:,.2f}\n"
+                f"      - 完成: {order_info['completed']:,.2f}\n"
+                f"      - 违约完成: {order_info['breach_end']:,.2f}\n"
+            )
+
+    if total_pages <= 1:
+        return report, None
+
+    # 回调数据格式: customer_page_{客户类型}|{页码}|{起始日期}|{结束日期}
+    page_buttons = []
+    callback_suffix = f"{start_date or ''}|{end_date or ''}"
+    if page > 1:
+        page_buttons.append(InlineKeyboardButton(
+            "◀️ 上一页", callback_data=f"customer_page_{customer}|{page - 1}|{callback_suffix}"))
+    if page < total_pages:
+        page_buttons.append(InlineKeyboardButton(
+            "下一页 ▶️", callback_data=f"customer_page_{customer}|{page + 1}|{callback_suffix}"))
+    return report, InlineKeyboardMarkup([page_buttons])
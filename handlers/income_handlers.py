@@ -89,125 +89,137 @@ async def format_income_detail(record: dict) -> str:
     return detail
 
 
-async def generate_income_report(records: list, start_date: str, end_date: str,
+def _income_query_key(income_type, group_id, global_only, start_date, end_date) -> str:
+    """收入明细查询条件的标识，用于缓存续页令牌"""
+    return f"{income_type}|{group_id}|{global_only}|{start_date}|{end_date}"
+
+
+def _get_page_token(context, query_key: str, page: int) -> Optional[str]:
+    """读取指定页的续页令牌（只缓存用户最近一次查询的令牌）"""
+    if context is None:
+        return None
+    store = context.user_data.get('income_page_tokens')
+    if not store or store.get('key') != query_key:
+        return None
+    return store['tokens'].get(page)
+
+
+def _save_page_token(context, query_key: str, page: int, token: Optional[str]):
+    """保存指定页的续页令牌"""
+    if context is None or not token:
+        return
+    store = context.user_data.get('income_page_tokens')
+    if not store or store.get('key') != query_key:
+        store = {'key': query_key, 'tokens': {}}
+        context.user_data['income_page_tokens'] = store
+    store['tokens'][page] = token
+
+
+def _type_section_header(type_key: str, type_total: float, type_count: int) -> str:
+    """收入类型小节标题"""
+    type_name = INCOME_TYPES.get(type_key, type_key)
+    header = f"【{type_name}】总计: {type_total:,.2f} ({type_count}笔)\n"
+    header += f"{'─' * 50}\n"
+    header += f"{'时间':<8}  {'订单号':<25}  {'金额':>15}\n"
+    header += f"{'─' * 50}\n"
+    return header
+
+
+async def generate_income_report(start_date: str, end_date: str,
                                  title: str = "收入明细", page: int = 1,
-                                 items_per_page: int = 20, income_type: Optional[str] = None) -> tuple:
+                                 items_per_page: int = 20, income_type: Optional[str] = None,
+                                 group_id: Optional[str] = None, global_only: bool = False,
+                                 context: ContextTypes.DEFAULT_TYPE = None) -> tuple:
     """
     生成收入明细报表（支持分页）
 
+    每次只从数据库读取当前页的明细，总计由SQL汇总。
+    传入 context 时会缓存续页令牌，翻到下一页时使用键集分页。
+
     返回: (report_text, has_more_pages, total_pages, current_type)
     """
-    if not records:
-        return (f"💰 {title}\n\n{start_date} 至 {end_date}\n\n❌ 无记录", False, 0, None)
-
-    # 如果指定了类型，只显示该类型的记录
-    if income_type:
-        records = [r for r in records if r['type'] == income_type]
-
-    # 按类型分组
-    by_type = {}
-    for record in records:
-        type_name = record['type']
-        if type_name not in by_type:
-            by_type[type_name] = []
-        by_type[type_name].append(record)
-
-    # 计算总计（处理 None 值）
-    total_amount = sum(r.get('amount', 0) or 0 for r in records)
-
-    # 生成报表文本
     report = f"💰 {title}\n"
     report += f"{'═' * 30}\n"
     report += f"📅 {start_date} 至 {end_date}\n"
     report += f"{'═' * 30}\n\n"
 
-    # 按类型显示顺序：订单完成、违约完成、本金减少、利息收入
-    type_order = ['completed', 'breach_end',
-                  'principal_reduction', 'interest', 'adjustment']
-
-    # 如果指定了类型，只显示该类型
-    if income_type:
-        type_order = [income_type] if income_type in type_order else []
-
     has_more_pages = False
     total_pages = 1
     current_type = None
 
     # 如果指定了类型，只显示该类型并支持分页
-    if income_type and income_type in by_type:
-        type_key = income_type
-        type_name = INCOME_TYPES.get(type_key, type_key)
-        type_records = by_type[type_key]
-
-        # 按录入时间正序排序（最早录入的在前）
-        type_records.sort(key=lambda x: x.get('created_at', '') or '')
+    if income_type:
+        query_key = _income_query_key(
+            income_type, group_id, global_only, start_date, end_date)
+        result = await db_operations.get_income_records_page(
+            start_date, end_date, type=income_type,
+            group_id=group_id, global_only=global_only,
+            limit=items_per_page,
+            page_token=_get_page_token(context, query_key, page),
+            offset=(page - 1) * items_per_page
+        )
+        type_count = result['total_count']
+        if type_count == 0:
+            return (f"💰 {title}\n\n{start_date} 至 {end_date}\n\n❌ 无记录", False, 0, None)
 
-        type_total = sum(r.get('amount', 0) or 0 for r in type_records)
-        type_count = len(type_records)
+        _save_page_token(context, query_key, page + 1, result['next_token'])
+        display_records = result['records']
+        total_amount = result['total_amount']
 
-        report += f"【{type_name}】总计: {type_total:,.2f} ({type_count}笔)\n"
-        report += f"{'─' * 50}\n"
-        report += f"{'时间':<8}  {'订单号':<25}  {'金额':>15}\n"
-        report += f"{'─' * 50}\n"
+        report += _type_section_header(income_type, total_amount, type_count)
 
         # 分页处理
         if type_count > items_per_page:
             total_pages = (type_count + items_per_page - 1) // items_per_page
             start_idx = (page - 1) * items_per_page
             end_idx = start_idx + items_per_page
-            display_records = type_records[start_idx:end_idx]
             has_more_pages = end_idx < type_count
 
             report += f"📄 第 {page}/{total_pages} 页 (显示 {start_idx + 1}-{min(end_idx, type_count)}/{type_count} 条)\n"
-        else:
-            display_records = type_records
-            has_more_pages = False
 
-        # 显示明细（全部显示）
         for i, record in enumerate(display_records, 1):
             detail = await format_income_detail(record)
             global_idx = (page - 1) * items_per_page + \
                 i if type_count > items_per_page else i
             report += f"{global_idx}. {detail}\n"
 
-        current_type = type_key
+        current_type = income_type
         report += "\n"
     else:
-        # 显示所有类型，每个类型如果记录太多，只显示第一页并提供分页按钮
-        for type_key in type_order:
-            if type_key not in by_type:
-                continue
+        # 显示所有类型，每个类型如果记录太多，只显示第一页
+        previews = await db_operations.get_income_type_previews(
+            start_date, end_date, group_id=group_id, global_only=global_only,
+            limit_per_type=items_per_page
+        )
+        if not previews:
+            return (f"💰 {title}\n\n{start_date} 至 {end_date}\n\n❌ 无记录", False, 0, None)
 
-            type_name = INCOME_TYPES.get(type_key, type_key)
-            type_records = by_type[type_key]
+        total_amount = sum(p['amount'] or 0 for p in previews.values())
 
-            # 按录入时间正序排序（最早录入的在前）
-            type_records.sort(key=lambda x: x.get('created_at', '') or '')
+        # 按类型显示顺序：订单完成、违约完成、本金减少、利息收入
+        type_order = ['completed', 'breach_end',
+                      'principal_reduction', 'interest', 'adjustment']
 
-            type_total = sum(r.get('amount', 0) or 0 for r in type_records)
-            type_count = len(type_records)
+        for type_key in type_order:
+            if type_key not in previews:
+                continue
 
-            report += f"【{type_name}】总计: {type_total:,.2f} ({type_count}笔)\n"
-            report += f"{'─' * 50}\n"
-            report += f"{'时间':<8}  {'订单号':<25}  {'金额':>15}\n"
-            report += f"{'─' * 50}\n"
+            preview = previews[type_key]
+            type_count = preview['count']
+            report += _type_section_header(
+                type_key, preview['amount'] or 0, type_count)
 
-            # 如果记录太多，只显示第一页
             if type_count > items_per_page:
-                display_records = type_records[:items_per_page]
                 report += f"📄 显示前 {items_per_page}/{type_count} 条\n"
-            else:
-                display_records = type_records
 
-            # 显示明细（全部显示）
-            for i, record in enumerate(display_records, 1):
+            for i, record in enumerate(preview['records'], 1):
                 detail = await format_income_detail(record)
                 report += f"{i}. {detail}\n"
 
             report += "\n"
 
             # 如果当前类型记录最多，设置为当前类型（用于分页）
-            if not current_type or type_count > len(by_type.get(current_type, [])):
+            if not current_type or type_count > previews[current_type]['count']:
                 current_type = type_key
 
     report += f"{'═' * 30}\n"
@@ -227,10 +239,9 @@ async def show_income_detail(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     date = get_daily_period_date()
-    records = await db_operations.get_income_records(date, date)
 
     report, has_more, total_pages, current_type = await generate_income_report(
-        records, date, date, f"今日收入明细 ({date})", page=1
+        date, date, f"今日收入明细 ({date})", page=1, context=context
     )
 
     keyboard = []
@@ -292,11 +303,9 @@ async def handle_income_query_input(update: Update, context: ContextTypes.DEFAUL
         datetime.strptime(start_date, "%Y-%m-%d")
         datetime.strptime(end_date, "%Y-%m-%d")
 
-        records = await db_operations.get_income_records(start_date, end_date)
-
         report, has_more, total_pages, current_type = await generate_income_report(
-            records, start_date, end_date,
-            f"收入明细 ({start_date} 至 {end_date})", page=1
+            start_date, end_date,
+            f"收入明细 ({start_date} 至 {end_date})", page=1, context=context
         )
 
         keyboard = []
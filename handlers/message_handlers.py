@@ -4,11 +4,12 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import db_operations
+from records import SEARCH_ORDER_COLUMNS
 from utils.chat_helpers import is_group_chat
 from utils.order_helpers import try_create_order_from_title, update_order_state_from_title
 from utils.date_helpers import get_daily_period_date
 from utils.message_helpers import display_search_results_helper
-from utils.stats_helpers import update_all_stats, update_liquid_capital
+from utils.broadcast_queue import enqueue_broadcast
 from constants import USER_STATES
 
 logger = logging.getLogger(__name__)
@@ -312,61 +313,25 @@ async def _handle_breach_end_amount(update: Update, context: ContextTypes.DEFAUL
             context.user_data['state'] = None
             return
 
-        # 执行完成逻辑
-        await db_operations.update_order_state(chat_id, 'breach_end')
-        group_id = order['group_id']
-
-        # 先记录收入明细（源数据），再更新统计数据，确保数据一致性
-        from utils.date_helpers import get_daily_period_date
+        # 执行完成逻辑：订单状态、收入明细、统计数据和操作历史（用于撤销）在一个事务中写入
+        from utils.order_state_machine import transition_order
         user_id = update.effective_user.id if update.effective_user else None
         try:
-            # 1. 先记录收入明细（如果失败，不更新统计数据）
-            await db_operations.record_income(
-                date=get_daily_period_date(),
-                type='breach_end',
-                amount=amount,
-                group_id=group_id,
-                order_id=order['order_id'],
-                order_date=order['date'],
-                customer=order['customer'],
-                weekday_group=order['weekday_group'],
-                note="违约完成",
-                created_by=user_id
-            )
+            result = await transition_order(order, 'breach_end', user_id=user_id, amount=amount)
         except Exception as e:
-            logger.error(f"记录违约完成收入明细失败: {e}", exc_info=True)
-            msg = f"❌ 记录收入明细失败，请稍后重试或联系管理员。错误: {str(e)}"
+            logger.error(f"违约完成失败: {e}", exc_info=True)
+            msg = f"❌ 违约完成失败，未做任何修改，请稍后重试。错误: {str(e)}"
             await update.message.reply_text(msg)
             return
 
-        # 2. 收入明细记录成功后，再更新统计数据
-        try:
-            # 违约完成订单增加，金额增加
-            await update_all_stats('breach_end', amount, 1, group_id)
-            # 更新流动资金
-            await update_liquid_capital(amount)
-        except Exception as e:
-            logger.error(f"更新违约完成统计数据失败: {e}", exc_info=True)
-            # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
-            msg = f"❌ 更新统计失败，但收入明细已记录。请使用 /fix_statistics 修复统计数据。错误: {str(e)}"
+        if result is None:
+            msg = "❌ Order state changed or not found"
             await update.message.reply_text(msg)
+            context.user_data['state'] = None
             return
 
-        # 记录操作历史（用于撤销）
         if user_id:
             from handlers.undo_handlers import reset_undo_count
-            await db_operations.record_operation(
-                user_id=user_id,
-                operation_type='order_breach_end',
-                operation_data={
-                    'chat_id': chat_id,
-                    'order_id': order['order_id'],
-                    'group_id': group_id,
-                    'amount': amount,
-                    'date': get_daily_period_date()
-                },
-                chat_id=chat_id
-            )
             reset_undo_count(context, user_id)
 
         msg_en = f"✅ Breach Order Ended\nAmount: {amount:.2f}"
@@ -578,7 +543,8 @@ async def _handle_search_input(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("❌ Cannot recognize search criteria", parse_mode='Markdown')
             return
 
-        orders = await db_operations.search_orders_advanced(criteria)
+        orders = await db_operations.search_orders_advanced(
+            criteria, columns=SEARCH_ORDER_COLUMNS)
 
         if not orders:
             await update.message.reply_text("❌ No matching orders found")
@@ -627,7 +593,8 @@ async def _handle_search_amount_input(update: Update, context: ContextTypes.DEFA
 
         # 获取所有有效订单（normal和overdue状态）
         criteria = {}
-        all_valid_orders = await db_operations.search_orders_advanced(criteria)
+        all_valid_orders = await db_operations.search_orders_advanced(
+            criteria, columns=SEARCH_ORDER_COLUMNS)
 
         if not all_valid_orders:
             try:
@@ -784,10 +751,12 @@ async def _handle_report_search(update: Update, context: ContextTypes.DEFAULT_TY
         # 执行查找：如果用户指定了状态，查找所有状态的订单；否则默认只查找有效订单
         if 'state' in criteria and criteria['state']:
             # 用户指定了状态，可以查找所有状态（包括完成、违约完成等）
-            orders = await db_operations.search_orders_advanced_all_states(criteria)
+            orders = await db_operations.search_orders_advanced_all_states(
+                criteria, columns=SEARCH_ORDER_COLUMNS)
         else:
             # 用户未指定状态，默认只查找有效订单（normal和overdue）
-            orders = await db_operations.search_orders_advanced(criteria)
+            orders = await db_operations.search_orders_advanced(
+                criteria, columns=SEARCH_ORDER_COLUMNS)
 
         if not orders:
             await update.message.reply_text("❌ 未找到匹配的订单")
@@ -1119,22 +1088,19 @@ async def _handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE,
         context.user_data['state'] = None
         return
 
-    success_count = 0
-    fail_count = 0
-
-    await update.message.reply_text(f"⏳ Sending message to {len(locked_groups)} groups...")
-
-    for chat_id in locked_groups:
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=text)
-            success_count += 1
-        except Exception as e:
-            logger.error(f"群发失败 {chat_id}: {e}")
-            fail_count += 1
+    progress_message = await update.message.reply_text(
+        f"⏳ Sending message to {len(locked_groups)} groups...")
 
-    await update.message.reply_text(
-        f"✅ Broadcast Completed\n"
-        f"Success: {success_count}\n"
-        f"Failed: {fail_count}"
-    )
+    # 后台发送，进度和结果报告由群发任务队列更新到本聊天
+    job_id = await enqueue_broadcast(
+        locked_groups, text, created_by=update.effective_user.id,
+        notify_chat_id=update.effective_chat.id,
+        progress_message_id=progress_message.message_id)
+    if job_id is None:
+        await progress_message.edit_text("❌ Failed to queue broadcast")
+    else:
+        # 进度消息交给后台任务编辑，这里另发一条提示，避免覆盖进度
+        await update.message.reply_text(
+            f"📥 Broadcast #{job_id} queued, progress is shown above.\n"
+            f"Use /broadcast_jobs {job_id} to check status.")
     context.user_data['state'] = None
@@ -4,8 +4,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import db_operations
 from utils.chat_helpers import is_group_chat
-from utils.stats_helpers import update_all_stats, update_liquid_capital
-from utils.date_helpers import get_daily_period_date
+from utils.order_state_machine import transition_order
 from decorators import authorized_required, group_chat_only
 
 logger = logging.getLogger(__name__)
@@ -40,31 +39,16 @@ async def set_normal(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await reply_func(message)
             return
 
-        old_state = order['state']
-        if not await db_operations.update_order_state(chat_id, 'normal'):
-            message = "❌ Failed: DB Error"
+        # 订单状态和操作历史（用于撤销）在一个事务中写入
+        user_id = update.effective_user.id if update.effective_user else None
+        if not await transition_order(order, 'normal', user_id=user_id):
+            message = "❌ Failed: Order state changed."
             await reply_func(message)
             return
 
-        # 记录操作历史（用于撤销）
-        user_id = update.effective_user.id if update.effective_user else None
-        if user_id:
+        if user_id and context:
             from handlers.undo_handlers import reset_undo_count
-            await db_operations.record_operation(
-                user_id=user_id,
-                operation_type='order_state_change',
-                operation_data={
-                    'chat_id': chat_id,
-                    'order_id': order['order_id'],
-                    'old_state': old_state,
-                    'new_state': 'normal',
-                    'group_id': order['group_id'],
-                    'amount': order['amount']
-                },
-                chat_id=chat_id
-            )
-            if context:
-                reset_undo_count(context, user_id)
+            reset_undo_count(context, user_id)
 
         if is_group_chat(update):
             await reply_func(f"✅ Status Updated: normal\nOrder ID: {order['order_id']}")
@@ -103,31 +87,16 @@ async def set_overdue(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await reply_func(message)
             return
 
-        old_state = order['state']
-        if not await db_operations.update_order_state(chat_id, 'overdue'):
-            message = "❌ Failed: DB Error"
+        # 订单状态和操作历史（用于撤销）在一个事务中写入
+        user_id = update.effective_user.id if update.effective_user else None
+        if not await transition_order(order, 'overdue', user_id=user_id):
+            message = "❌ Failed: Order state changed."
             await reply_func(message)
             return
 
-        # 记录操作历史（用于撤销）
-        user_id = update.effective_user.id if update.effective_user else None
-        if user_id:
+        if user_id and context:
             from handlers.undo_handlers import reset_undo_count
-            await db_operations.record_operation(
-                user_id=user_id,
-                operation_type='order_state_change',
-                operation_data={
-                    'chat_id': chat_id,
-                    'order_id': order['order_id'],
-                    'old_state': old_state,
-                    'new_state': 'overdue',
-                    'group_id': order['group_id'],
-                    'amount': order['amount']
-                },
-                chat_id=chat_id
-            )
-            if context:
-                reset_undo_count(context, user_id)
+            reset_undo_count(context, user_id)
 
         if is_group_chat(update):
             await reply_func(f"✅ Status Updated: overdue\nOrder ID: {order['order_id']}")
@@ -165,66 +134,25 @@ async def set_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await reply_func(message)
         return
 
-    old_state = order['state']
-    await db_operations.update_order_state(chat_id, 'end')
-    group_id = order['group_id']
-    amount = order['amount']
-
-    # 统一获取日期，确保统计更新和收入记录使用相同的日期
-    date = get_daily_period_date()
-
-    # 先记录收入明细（源数据），再更新统计数据，确保数据一致性
+    # 订单状态、收入明细、统计数据和操作历史（用于撤销）在一个事务中写入
     user_id = update.effective_user.id if update.effective_user else None
     try:
-        # 1. 先记录收入明细（如果失败，不更新统计数据）
-        await db_operations.record_income(
-            date=date,
-            type='completed',
-            amount=amount,
-            group_id=group_id,
-            order_id=order['order_id'],
-            order_date=order['date'],
-            customer=order['customer'],
-            weekday_group=order['weekday_group'],
-            note="订单完成",
-            created_by=user_id
-        )
+        result = await transition_order(order, 'end', user_id=user_id)
     except Exception as e:
-        logger.error(f"记录订单完成收入明细失败: {e}", exc_info=True)
-        message = f"❌ 记录收入明细失败，请稍后重试或联系管理员。错误: {str(e)}"
+        logger.error(f"订单完成失败: {e}", exc_info=True)
+        message = f"❌ 订单完成失败，未做任何修改，请稍后重试。错误: {str(e)}"
         await reply_func(message)
         return
 
-    # 2. 收入明细记录成功后，再更新统计数据
-    try:
-        await update_all_stats('valid', -amount, -1, group_id)
-        await update_all_stats('completed', amount, 1, group_id)
-        await update_liquid_capital(amount)
-    except Exception as e:
-        logger.error(f"更新订单完成统计数据失败: {e}", exc_info=True)
-        # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
-        message = f"❌ 更新统计失败，但收入明细已记录。请使用 /fix_statistics 修复统计数据。错误: {str(e)}"
+    if result is None:
+        message = "❌ Failed: Order state changed."
         await reply_func(message)
         return
 
-    # 记录操作历史（用于撤销）
-    if user_id:
+    amount = result['amount']
+    if user_id and context:
         from handlers.undo_handlers import reset_undo_count
-        await db_operations.record_operation(
-            user_id=user_id,
-            operation_type='order_completed',
-            operation_data={
-                'chat_id': chat_id,
-                'order_id': order['order_id'],
-                'group_id': group_id,
-                'amount': amount,
-                'old_state': old_state,
-                'date': get_daily_period_date()
-            },
-            chat_id=chat_id
-        )
-        if context:
-            reset_undo_count(context, user_id)
+        reset_undo_count(context, user_id)
 
     if is_group_chat(update):
         await reply_func(f"✅ Order Completed\nAmount: {amount:.2f}")
@@ -257,37 +185,17 @@ async def set_breach(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await reply_func(message)
             return
 
-        old_state = order['state']
-        if not await db_operations.update_order_state(chat_id, 'breach'):
-            message = "❌ Failed: DB Error"
+        # 订单状态、统计迁移和操作历史（用于撤销）在一个事务中写入
+        user_id = update.effective_user.id if update.effective_user else None
+        if not await transition_order(order, 'breach', user_id=user_id):
+            message = "❌ Failed: Order state changed."
             await reply_func(message)
             return
 
-        group_id = order['group_id']
         amount = order['amount']
-
-        await update_all_stats('valid', -amount, -1, group_id)
-        await update_all_stats('breach', amount, 1, group_id)
-
-        # 记录操作历史（用于撤销）
-        user_id = update.effective_user.id if update.effective_user else None
-        if user_id:
+        if user_id and context:
             from handlers.undo_handlers import reset_undo_count
-            await db_operations.record_operation(
-                user_id=user_id,
-                operation_type='order_state_change',
-                operation_data={
-                    'chat_id': chat_id,
-                    'order_id': order['order_id'],
-                    'old_state': old_state,
-                    'new_state': 'breach',
-                    'group_id': group_id,
-                    'amount': amount
-                },
-                chat_id=chat_id
-            )
-            if context:
-                reset_undo_count(context, user_id)
+            reset_undo_count(context, user_id)
 
         if is_group_chat(update):
             await reply_func(f"✅ Marked as Breach\nAmount: {amount:.2f}")
@@ -334,58 +242,21 @@ async def set_breach_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await reply_func("❌ Amount must be positive.")
                 return
 
-            await db_operations.update_order_state(chat_id, 'breach_end')
-            group_id = order['group_id']
-
-            # 统一获取日期，确保统计更新和收入记录使用相同的日期
-            date = get_daily_period_date()
-
-            # 先记录收入明细（源数据），再更新统计数据，确保数据一致性
+            # 订单状态、收入明细、统计数据和操作历史（用于撤销）在一个事务中写入
             user_id = update.effective_user.id if update.effective_user else None
             try:
-                # 1. 先记录收入明细（如果失败，不更新统计数据）
-                await db_operations.record_income(
-                    date=date,
-                    type='breach_end',
-                    amount=amount,
-                    group_id=group_id,
-                    order_id=order['order_id'],
-                    order_date=order['date'],
-                    customer=order['customer'],
-                    weekday_group=order['weekday_group'],
-                    note="违约完成",
-                    created_by=user_id
-                )
+                result = await transition_order(order, 'breach_end', user_id=user_id, amount=amount)
             except Exception as e:
-                logger.error(f"记录违约完成收入明细失败: {e}", exc_info=True)
-                await reply_func(f"❌ 记录收入明细失败，请稍后重试或联系管理员。错误: {str(e)}")
+                logger.error(f"违约完成失败: {e}", exc_info=True)
+                await reply_func(f"❌ 违约完成失败，未做任何修改，请稍后重试。错误: {str(e)}")
                 return
 
-            # 2. 收入明细记录成功后，再更新统计数据
-            try:
-                await update_all_stats('breach_end', amount, 1, group_id)
-                await update_liquid_capital(amount)
-            except Exception as e:
-                logger.error(f"更新违约完成统计数据失败: {e}", exc_info=True)
-                # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
-                await reply_func(f"❌ 更新统计失败，但收入明细已记录。请使用 /fix_statistics 修复统计数据。错误: {str(e)}")
+            if result is None:
+                await reply_func("❌ Failed: Order state changed.")
                 return
 
-            # 记录操作历史（用于撤销）
             if user_id:
                 from handlers.undo_handlers import reset_undo_count
-                await db_operations.record_operation(
-                    user_id=user_id,
-                    operation_type='order_breach_end',
-                    operation_data={
-                        'chat_id': chat_id,
-                        'order_id': order['order_id'],
-                        'group_id': group_id,
-                        'amount': amount,
-                        'date': get_daily_period_date()
-                    },
-                    chat_id=chat_id
-                )
                 reset_undo_count(context, user_id)
 
             msg_en = f"✅ Breach Order Ended\nAmount: {amount:.2f}"
@@ -3,6 +3,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import db_operations
+from records import SEARCH_ORDER_COLUMNS
 from utils.message_helpers import display_search_results_helper
 from decorators import error_handler, authorized_required, private_chat_only
 
@@ -98,7 +99,8 @@ async def search_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"Unknown search type: {search_type}")
             return
 
-        orders = await db_operations.search_orders_advanced(criteria)
+        orders = await db_operations.search_orders_advanced(
+            criteria, columns=SEARCH_ORDER_COLUMNS)
         await display_search_results_helper(update, context, orders)
 
     except Exception as e:
@@ -1,9 +1,10 @@
 """撤销操作处理器"""
 import logging
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 import db_operations
-from utils.stats_helpers import update_all_stats, update_liquid_capital
+from utils.stats_helpers import StatsDelta
 from utils.date_helpers import get_daily_period_date
 from utils.chat_helpers import is_group_chat
 from decorators import error_handler, authorized_required
@@ -91,28 +92,28 @@ async def undo_last_operation(update: Update, context: ContextTypes.DEFAULT_TYPE
         group_name = update.effective_chat.title
     
     try:
-        # 根据操作类型执行撤销
-        success = False
+        # 根据操作类型生成撤销计划
+        plan = None
         undo_message = ""
         undo_message_en = ""
 
         if operation_type == 'interest':
             # 撤销利息收入
-            success = await _undo_interest(operation_data)
+            plan = _plan_undo_interest(operation_data)
             amount = operation_data.get('amount', 0)
             undo_message = f"✅ 已撤销利息收入 {amount:.2f}"
             undo_message_en = f"✅ Undone interest income {amount:.2f}"
 
         elif operation_type == 'principal_reduction':
             # 撤销本金减少
-            success = await _undo_principal_reduction(operation_data)
+            plan = _plan_undo_principal_reduction(operation_data)
             amount = operation_data.get('amount', 0)
             undo_message = f"✅ 已撤销本金减少 {amount:.2f}"
             undo_message_en = f"✅ Undone principal reduction {amount:.2f}"
 
         elif operation_type == 'expense':
             # 撤销开销记录
-            success = await _undo_expense(operation_data)
+            plan = _plan_undo_expense(operation_data)
             amount = operation_data.get('amount', 0)
             expense_type = operation_data.get('type')
             if expense_type == 'company':
@@ -124,26 +125,26 @@ async def undo_last_operation(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         elif operation_type == 'order_completed':
             # 撤销订单完成
-            success = await _undo_order_completed(operation_data)
+            plan = _plan_undo_order_completed(operation_data)
             undo_message = f"✅ 已撤销订单完成操作"
             undo_message_en = f"✅ Undone order completion"
 
         elif operation_type == 'order_breach_end':
             # 撤销违约完成
-            success = await _undo_order_breach_end(operation_data)
+            plan = _plan_undo_order_breach_end(operation_data)
             undo_message = f"✅ 已撤销违约完成操作"
             undo_message_en = f"✅ Undone breach order completion"
 
         elif operation_type == 'order_created':
             # 撤销订单创建
-            success = await _undo_order_created(operation_data)
+            plan = _plan_undo_order_created(operation_data)
             order_id = operation_data.get('order_id', 'N/A')
             undo_message = f"✅ 已撤销订单创建：{order_id}"
             undo_message_en = f"✅ Undone order creation: {order_id}"
 
         elif operation_type == 'order_state_change':
             # 撤销订单状态变更
-            success = await _undo_order_state_change(operation_data)
+            plan = _plan_undo_order_state_change(operation_data)
             old_state = operation_data.get('old_state', 'N/A')
             new_state = operation_data.get('new_state', 'N/A')
             undo_message = f"✅ 已撤销订单状态变更：{new_state} → {old_state}"
@@ -156,10 +157,18 @@ async def undo_last_operation(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await update.message.reply_text(f"❌ 不支持撤销此类型的操作: {operation_type}")
             return
 
-        if success:
-            # 标记操作为已撤销
-            await db_operations.mark_operation_undone(operation_id)
+        # 回滚订单、明细、统计并标记操作已撤销，在一个事务中完成
+        result = await db_operations.undo_operation(operation_id, plan) if plan else False
+        success = result is True
+
+        if result is None:
+            if is_group:
+                await update.message.reply_text("❌ This operation has already been undone.")
+            else:
+                await update.message.reply_text("❌ 该操作已被撤销")
+            return
 
+        if success:
             # 增加连续撤销次数
             context.user_data['undo_count'] = undo_count + 1
 
@@ -207,226 +216,149 @@ async def undo_last_operation(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text(f"❌ 撤销操作时出错: {str(e)}")
 
 
-async def _undo_interest(operation_data: dict) -> bool:
-    """撤销利息收入"""
-    try:
-        amount = operation_data.get('amount', 0)
-        group_id = operation_data.get('group_id')
-        date = operation_data.get('date', get_daily_period_date())
-
-        # 1. 减少利息收入
-        await update_all_stats('interest', -amount, 0, group_id)
-
-        # 2. 减少流动资金
-        await update_liquid_capital(-amount)
-
-        # 3. 删除收入记录（如果有）
-        income_id = operation_data.get('income_record_id')
-        if income_id:
-            # 注意：这里需要添加删除收入记录的函数，暂时跳过
-            pass
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销利息收入失败: {e}")
-        return False
-
-
-async def _undo_principal_reduction(operation_data: dict) -> bool:
-    """撤销本金减少"""
-    try:
-        amount = operation_data.get('amount', 0)
-        group_id = operation_data.get('group_id')
-        chat_id = operation_data.get('chat_id')
-        old_amount = operation_data.get('old_amount')
-        order_id = operation_data.get('order_id')
-
-        if not chat_id or not old_amount:
-            logger.error("撤销本金减少：缺少必要参数")
-            return False
-
-        # 1. 恢复订单金额
-        await db_operations.update_order_amount(chat_id, old_amount)
-
-        # 2. 恢复有效金额
-        await update_all_stats('valid', amount, 0, group_id)
-
-        # 3. 减少完成金额
-        await update_all_stats('completed', -amount, 0, group_id)
-
-        # 4. 减少流动资金
-        await update_liquid_capital(-amount)
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销本金减少失败: {e}")
-        return False
-
-
-async def _undo_expense(operation_data: dict) -> bool:
-    """撤销开销记录"""
-    try:
-        amount = operation_data.get('amount', 0)
-        expense_type = operation_data.get('type')
-        expense_id = operation_data.get('expense_record_id')
-        date = operation_data.get('date', get_daily_period_date())
-
-        if not expense_id:
-            logger.error("撤销开销：缺少开销记录ID")
-            return False
-
-        # 1. 恢复日结数据
-        field = 'company_expenses' if expense_type == 'company' else 'other_expenses'
-        await db_operations.update_daily_data(date, field, -amount, None)
-
-        # 2. 恢复流动资金
-        await db_operations.update_financial_data('liquid_funds', amount)
-
-        # 3. 恢复日结流量
-        await db_operations.update_daily_data(date, 'liquid_flow', amount, None)
-
-        # 4. 删除开销记录
-        await db_operations.delete_expense_record(expense_id)
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销开销失败: {e}")
-        return False
-
-
-async def _undo_order_completed(operation_data: dict) -> bool:
-    """撤销订单完成"""
-    try:
-        chat_id = operation_data.get('chat_id')
-        group_id = operation_data.get('group_id')
-        amount = operation_data.get('amount', 0)
-        old_state = operation_data.get('old_state')  # 完成前的状态
-
-        if not chat_id or not old_state:
-            logger.error("撤销订单完成：缺少必要参数")
-            return False
-
-        # 1. 恢复订单状态
-        await db_operations.update_order_state(chat_id, old_state)
-
-        # 2. 回滚统计：减少完成，恢复有效
-        await update_all_stats('valid', amount, 1, group_id)
-        await update_all_stats('completed', -amount, -1, group_id)
-
-        # 3. 减少流动资金
-        await update_liquid_capital(-amount)
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销订单完成失败: {e}")
-        return False
-
-
-async def _undo_order_breach_end(operation_data: dict) -> bool:
-    """撤销违约完成"""
-    try:
-        amount = operation_data.get('amount', 0)
-        group_id = operation_data.get('group_id')
-        chat_id = operation_data.get('chat_id')
-        order_id = operation_data.get('order_id')
-        date_str = operation_data.get('date', get_daily_period_date())
-
-        if not chat_id or not order_id:
-            logger.error("撤销违约完成：缺少必要参数")
-            return False
-
-        # 1. 恢复订单状态为breach
-        await db_operations.update_order_state(chat_id, 'breach')
-
-        # 2. 减少违约完成统计
-        await update_all_stats('breach_end', -amount, -1, group_id)
-
-        # 3. 减少流动资金
-        await update_liquid_capital(-amount)
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销违约完成失败: {e}")
-        return False
-
-
-async def _undo_order_created(operation_data: dict) -> bool:
-    """撤销订单创建"""
-    try:
-        order_id = operation_data.get('order_id')
-        chat_id = operation_data.get('chat_id')
-        group_id = operation_data.get('group_id')
-        amount = operation_data.get('amount', 0)
-        initial_state = operation_data.get('initial_state', 'normal')
-        is_historical = operation_data.get('is_historical', False)
-        customer = operation_data.get('customer')
-
-        if not chat_id or not order_id:
-            logger.error("撤销订单创建：缺少必要参数")
-            return False
-
-        # 1. 删除订单
-        await db_operations.delete_order_by_chat_id(chat_id)
-
-        # 2. 回滚统计
-        is_initial_breach = (initial_state == 'breach')
-        if is_initial_breach:
-            await update_all_stats('breach', -amount, -1, group_id)
-        else:
-            await update_all_stats('valid', -amount, -1, group_id)
-
-        # 3. 非历史订单需要恢复流动资金和客户统计
-        if not is_historical:
-            # 恢复流动资金
-            await update_liquid_capital(amount)
-            
-            # 恢复客户统计
-            client_field = 'new_clients' if customer == 'A' else 'old_clients'
-            await update_all_stats(client_field, -amount, -1, group_id)
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销订单创建失败: {e}")
-        return False
-
-
-async def _undo_order_state_change(operation_data: dict) -> bool:
-    """撤销订单状态变更"""
-    try:
-        chat_id = operation_data.get('chat_id')
-        old_state = operation_data.get('old_state')
-        new_state = operation_data.get('new_state')
-        group_id = operation_data.get('group_id')
-        amount = operation_data.get('amount', 0)
-
-        if not chat_id or not old_state:
-            logger.error("撤销订单状态变更：缺少必要参数")
-            return False
-
-        # 1. 恢复订单状态
-        await db_operations.update_order_state(chat_id, old_state)
-
-        # 2. 回滚统计变更
-        # 从new_state回滚到old_state
-        if old_state == 'normal' and new_state == 'overdue':
-            # 无统计变更，仅状态变化
-            pass
-        elif old_state == 'normal' and new_state == 'breach':
-            # 恢复：breach -> normal (有效)
-            await update_all_stats('breach', -amount, -1, group_id)
-            await update_all_stats('valid', amount, 1, group_id)
-        elif old_state == 'overdue' and new_state == 'breach':
-            # 恢复：breach -> overdue (有效)
-            await update_all_stats('breach', -amount, -1, group_id)
-            await update_all_stats('valid', amount, 1, group_id)
-        elif old_state == 'overdue' and new_state == 'normal':
-            # 无统计变更，仅状态变化
-            pass
-
-        return True
-    except Exception as e:
-        logger.error(f"撤销订单状态变更失败: {e}")
-        return False
+def _stats_plan(delta: StatsDelta, **plan) -> dict:
+    """把统计增量合并进撤销计划"""
+    plan.update(global_deltas=delta.global_deltas,
+                daily_deltas=delta.daily_deltas,
+                grouped_deltas=delta.grouped_deltas)
+    return plan
+
+
+def _plan_undo_interest(operation_data: dict) -> Optional[dict]:
+    """撤销利息收入：减少利息收入和流动资金，删除收入明细"""
+    amount = operation_data.get('amount', 0)
+    group_id = operation_data.get('group_id')
+
+    delta = StatsDelta(operation_data.get('date'))
+    delta.add('interest', -amount, 0, group_id)
+    delta.add_liquid_capital(-amount)
+    return _stats_plan(delta, delete_income_id=operation_data.get('income_record_id'))
+
+
+def _plan_undo_principal_reduction(operation_data: dict) -> Optional[dict]:
+    """撤销本金减少：恢复订单金额和有效金额，减少完成金额和流动资金，删除收入明细"""
+    amount = operation_data.get('amount', 0)
+    group_id = operation_data.get('group_id')
+    old_amount = operation_data.get('old_amount')
+    order_id = operation_data.get('order_id')
+
+    if not order_id or not old_amount:
+        logger.error("撤销本金减少：缺少必要参数")
+        return None
+
+    delta = StatsDelta(operation_data.get('date'))
+    delta.add('valid', amount, 0, group_id)
+    delta.add('completed', -amount, 0, group_id)
+    delta.add_liquid_capital(-amount)
+    return _stats_plan(delta,
+                       restore_amount={'order_id': order_id, 'amount': old_amount},
+                       delete_income_id=operation_data.get('income_record_id'))
+
+
+def _plan_undo_expense(operation_data: dict) -> Optional[dict]:
+    """撤销开销记录：恢复日结开销、流动资金和日结流量，删除开销记录"""
+    amount = operation_data.get('amount', 0)
+    expense_type = operation_data.get('type')
+    expense_id = operation_data.get('expense_record_id')
+    date = operation_data.get('date', get_daily_period_date())
+
+    if not expense_id:
+        logger.error("撤销开销：缺少开销记录ID")
+        return None
+
+    field = 'company_expenses' if expense_type == 'company' else 'other_expenses'
+    return {
+        'delete_expense_id': expense_id,
+        'global_deltas': {'liquid_funds': amount},
+        'daily_deltas': {(date, None): {field: -amount, 'liquid_flow': amount}},
+    }
+
+
+def _plan_undo_order_completed(operation_data: dict) -> Optional[dict]:
+    """撤销订单完成：恢复订单状态，完成统计退回有效统计，减少流动资金，删除收入明细"""
+    order_id = operation_data.get('order_id')
+    group_id = operation_data.get('group_id')
+    amount = operation_data.get('amount', 0)
+    old_state = operation_data.get('old_state')  # 完成前的状态
+
+    if not order_id or not old_state:
+        logger.error("撤销订单完成：缺少必要参数")
+        return None
+
+    delta = StatsDelta(operation_data.get('date'))
+    delta.add('valid', amount, 1, group_id)
+    delta.add('completed', -amount, -1, group_id)
+    delta.add_liquid_capital(-amount)
+    return _stats_plan(delta,
+                       restore_state={'order_id': order_id, 'from_state': 'end', 'to_state': old_state},
+                       delete_income_id=operation_data.get('income_record_id'))
+
+
+def _plan_undo_order_breach_end(operation_data: dict) -> Optional[dict]:
+    """撤销违约完成：恢复违约状态，减少违约完成统计和流动资金，删除收入明细"""
+    order_id = operation_data.get('order_id')
+    group_id = operation_data.get('group_id')
+    amount = operation_data.get('amount', 0)
+
+    if not order_id:
+        logger.error("撤销违约完成：缺少必要参数")
+        return None
+
+    delta = StatsDelta(operation_data.get('date'))
+    delta.add('breach_end', -amount, -1, group_id)
+    delta.add_liquid_capital(-amount)
+    return _stats_plan(delta,
+                       restore_state={'order_id': order_id, 'from_state': 'breach_end', 'to_state': 'breach'},
+                       delete_income_id=operation_data.get('income_record_id'))
+
+
+def _plan_undo_order_created(operation_data: dict) -> Optional[dict]:
+    """撤销订单创建：删除订单并回滚统计（非历史订单同时恢复流动资金和客户统计）"""
+    order_id = operation_data.get('order_id')
+    group_id = operation_data.get('group_id')
+    amount = operation_data.get('amount', 0)
+    initial_state = operation_data.get('initial_state', 'normal')
+    is_historical = operation_data.get('is_historical', False)
+    customer = operation_data.get('customer')
+
+    if not order_id:
+        logger.error("撤销订单创建：缺少必要参数")
+        return None
+
+    delta = StatsDelta()
+    if initial_state == 'breach':
+        delta.add('breach', -amount, -1, group_id)
+    else:
+        delta.add('valid', -amount, -1, group_id)
+
+    if not is_historical:
+        delta.add_liquid_capital(amount)
+        client_field = 'new_clients' if customer == 'A' else 'old_clients'
+        delta.add(client_field, -amount, -1, group_id)
+
+    return _stats_plan(delta, delete_order=order_id)
+
+
+def _plan_undo_order_state_change(operation_data: dict) -> Optional[dict]:
+    """撤销订单状态变更：恢复状态，违约统计退回有效统计"""
+    order_id = operation_data.get('order_id')
+    old_state = operation_data.get('old_state')
+    new_state = operation_data.get('new_state')
+    group_id = operation_data.get('group_id')
+    amount = operation_data.get('amount', 0)
+
+    if not order_id or not old_state or not new_state:
+        logger.error("撤销订单状态变更：缺少必要参数")
+        return None
+
+    delta = StatsDelta()
+    if old_state in ('normal', 'overdue') and new_state == 'breach':
+        delta.add('breach', -amount, -1, group_id)
+        delta.add('valid', amount, 1, group_id)
+    # normal <-> overdue 无统计变更，仅状态变化
+
+    return _stats_plan(delta,
+                       restore_state={'order_id': order_id, 'from_state': new_state, 'to_state': old_state})
 
 
 def reset_undo_count(context: ContextTypes.DEFAULT_TYPE, user_id: int):
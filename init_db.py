@@ -12,8 +12,219 @@ os.makedirs(DATA_DIR, exist_ok=True)
 DB_NAME = os.path.join(DATA_DIR, 'loan_bot.db')
 
 
+DAILY_SUM_COLUMNS = [
+    'new_clients', 'new_clients_amount',
+    'old_clients', 'old_clients_amount',
+    'interest', 'completed_orders', 'completed_amount',
+    'breach_orders', 'breach_amount',
+    'breach_end_orders', 'breach_end_amount',
+    'liquid_flow', 'company_expenses', 'other_expenses'
+]
+
+
+# 订单表索引：(索引名, 列)
+ORDER_INDEXES = [
+    # 按群组查当前有效订单、按群组修改订单
+    ('idx_orders_chat_state', 'chat_id, state'),
+    # 按归属ID + 状态查找，按日期排序
+    ('idx_orders_group_state_date', 'group_id, state, date'),
+    # 按状态查找（有效订单、完成/违约完成订单），按日期排序
+    ('idx_orders_state_date', 'state, date'),
+    # 按状态 + 更新时间查找当日完成/违约完成订单
+    ('idx_orders_state_updated', 'state, updated_at'),
+    # 按客户类型查找，按日期排序
+    ('idx_orders_customer_date', 'customer, date'),
+    # 按星期分组查找
+    ('idx_orders_weekday_state', 'weekday_group, state'),
+    # 按日期范围查找、全表按日期排序
+    ('idx_orders_date', 'date'),
+    # 按创建时间查找当日新增订单
+    ('idx_orders_created', 'created_at'),
+]
+
+
+def merge_duplicate_global_daily_rows(cursor):
+    """合并同一日期的多条全局日结行（group_id 为 NULL），保留 id 最小的一行"""
+    cursor.execute('''
+    SELECT date, MIN(id) FROM daily_data
+    WHERE group_id IS NULL
+    GROUP BY date
+    HAVING COUNT(*) > 1
+    ''')
+    duplicates = cursor.fetchall()
+    if not duplicates:
+        return
+
+    sums = ", ".join(f"SUM({col})" for col in DAILY_SUM_COLUMNS)
+    set_clause = ", ".join(f"{col} = ?" for col in DAILY_SUM_COLUMNS)
+    for date, keep_id in duplicates:
+        cursor.execute(
+            f"SELECT {sums} FROM daily_data WHERE date = ? AND group_id IS NULL", (date,))
+        totals = [value or 0 for value in cursor.fetchone()]
+        cursor.execute(
+            f"UPDATE daily_data SET {set_clause} WHERE id = ?", totals + [keep_id])
+        cursor.execute(
+            "DELETE FROM daily_data WHERE date = ? AND group_id IS NULL AND id != ?", (date, keep_id))
+    print(f"已合并 {len(duplicates)} 个日期的重复全局日结数据")
+
+
+def _monthly_upsert_sql(row: str, sign: str = '') -> str:
+    """生成把 daily_data 某一行（NEW/OLD）累加到 monthly_data 的UPSERT语句"""
+    values = ", ".join(f"{sign}IFNULL({row}.{col}, 0)" for col in DAILY_SUM_COLUMNS)
+    set_clause = ", ".join(f"{col} = {col} + excluded.{col}" for col in DAILY_SUM_COLUMNS)
+    return f'''
+        INSERT INTO monthly_data (month, group_id, {", ".join(DAILY_SUM_COLUMNS)})
+        VALUES (substr({row}.date, 1, 7), {row}.group_id, {values})
+        ON CONFLICT(month, IFNULL(group_id, '')) DO UPDATE SET {set_clause};'''
+
+
+def create_monthly_rollup(cursor):
+    """创建月度汇总表 monthly_data 及维护它的触发器
+
+    monthly_data 按 (月份, 归属ID) 保存 daily_data 各字段之和，由 daily_data 上的
+    触发器随每次插入、更新、删除同步维护，日期范围统计只需读取整月的汇总行
+    加上首尾不足一个月的日结行。表新建时从 daily_data 回填。
+    """
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='monthly_data'")
+    table_existed = cursor.fetchone() is not None
+
+    columns = ",\n        ".join(
+        f"{col} {'INTEGER' if col.endswith(('_clients', '_orders')) else 'REAL'} DEFAULT 0"
+        for col in DAILY_SUM_COLUMNS)
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS monthly_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        month TEXT NOT NULL,
+        group_id TEXT,
+        {columns}
+    )
+    ''')
+    # 全局汇总行 group_id 为 NULL，与 daily_data 一样使用表达式唯一索引
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_monthly_month_group_unique
+    ON monthly_data(month, IFNULL(group_id, ''))
+    ''')
+
+    changed = ", ".join(DAILY_SUM_COLUMNS + ['date', 'group_id'])
+    same_key = "substr(OLD.date, 1, 7) = substr(NEW.date, 1, 7) AND OLD.group_id IS NEW.group_id"
+    update_values = ", ".join(
+        f"IFNULL(NEW.{col}, 0) - IFNULL(OLD.{col}, 0)" for col in DAILY_SUM_COLUMNS)
+    update_set = ", ".join(f"{col} = {col} + excluded.{col}" for col in DAILY_SUM_COLUMNS)
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_daily_data_insert_monthly
+    AFTER INSERT ON daily_data
+    BEGIN{_monthly_upsert_sql('NEW')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_daily_data_update_monthly
+    AFTER UPDATE OF {changed} ON daily_data
+    WHEN {same_key}
+    BEGIN
+        INSERT INTO monthly_data (month, group_id, {", ".join(DAILY_SUM_COLUMNS)})
+        VALUES (substr(NEW.date, 1, 7), NEW.group_id, {update_values})
+        ON CONFLICT(month, IFNULL(group_id, '')) DO UPDATE SET {update_set};
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_daily_data_move_monthly
+    AFTER UPDATE OF {changed} ON daily_data
+    WHEN NOT ({same_key})
+    BEGIN{_monthly_upsert_sql('OLD', '-')}{_monthly_upsert_sql('NEW')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_daily_data_delete_monthly
+    AFTER DELETE ON daily_data
+    BEGIN{_monthly_upsert_sql('OLD', '-')}
+    END
+    ''')
+
+    if not table_existed:
+        rebuild_monthly_rollup(cursor)
+
+
+def rebuild_monthly_rollup(cursor) -> int:
+    """根据 daily_data 重新生成 monthly_data，返回生成的汇总行数"""
+    sums = ", ".join(f"IFNULL(SUM({col}), 0)" for col in DAILY_SUM_COLUMNS)
+    cursor.execute('DELETE FROM monthly_data')
+    cursor.execute(f'''
+    INSERT INTO monthly_data (month, group_id, {", ".join(DAILY_SUM_COLUMNS)})
+    SELECT substr(date, 1, 7), group_id, {sums}
+    FROM daily_data
+    GROUP BY substr(date, 1, 7), group_id
+    ''')
+    return cursor.rowcount
+
+
+def create_dirty_date_tracking(cursor):
+    """创建待核对日期表 stats_dirty_dates 及标记它的触发器
+
+    daily_data 或 income_records 发生写入时，触发器把涉及的日期记为待核对，
+    /check_mismatch 默认只核对这些日期，核对一致后清除。
+    表新建时把已有的全部日期记为待核对，第一次默认核对即为全量核对。
+    """
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='stats_dirty_dates'")
+    table_existed = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stats_dirty_dates (
+        date TEXT PRIMARY KEY,
+        marked_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    mark = '''
+        INSERT INTO stats_dirty_dates (date) VALUES ({row}.date)
+        ON CONFLICT(date) DO UPDATE SET marked_at = CURRENT_TIMESTAMP;'''
+    for table in ('daily_data', 'income_records'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_dirty
+        AFTER INSERT ON {table}
+        BEGIN{mark.format(row='NEW')}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_update_dirty
+        AFTER UPDATE ON {table}
+        BEGIN{mark.format(row='OLD')}{mark.format(row='NEW')}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_dirty
+        AFTER DELETE ON {table}
+        BEGIN{mark.format(row='OLD')}
+        END
+        ''')
+
+    if not table_existed:
+        cursor.execute('''
+        INSERT OR IGNORE INTO stats_dirty_dates (date)
+        SELECT date FROM daily_data
+        UNION
+        SELECT date FROM income_records
+        ''')
+
+
+# 统计计数器使用 INSERT ... ON CONFLICT ... RETURNING，需要 SQLite 3.35 及以上
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+
+def check_sqlite_version():
+    """检查 Python 链接的 SQLite 版本，过低时抛出 RuntimeError"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        required = '.'.join(map(str, MIN_SQLITE_VERSION))
+        raise RuntimeError(
+            f"SQLite 版本过低: 当前 {sqlite3.sqlite_version}，需要 {required} 及以上"
+            f"（统计计数器使用 UPSERT ... RETURNING）。"
+            f"请使用链接了较新 SQLite 的 Python（如官方 python:3.11 镜像）")
+
+
 def init_database():
     """初始化数据库，创建所有必要的表"""
+    check_sqlite_version()
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
 
@@ -143,6 +354,15 @@ def init_database():
             except sqlite3.OperationalError as e:
                 print(f"添加列 other_expenses 时出错（可能已存在）: {e}")
 
+    # UNIQUE(date, group_id) 不约束 group_id 为 NULL 的全局日结行
+    # 先合并重复的全局行，再建立表达式唯一索引，供 UPSERT 原子累加使用
+    merge_duplicate_global_daily_rows(cursor)
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_date_group_unique
+    ON daily_data(date, IFNULL(group_id, ''))
+    ''')
+    create_monthly_rollup(cursor)
+
     # 初始化财务数据（如果不存在）
     cursor.execute('SELECT COUNT(*) FROM financial_data')
     if cursor.fetchone()[0] == 0:
@@ -239,6 +459,43 @@ def init_database():
     )
     ''')
 
+    # 创建群发任务表（后台逐个执行，重启后继续未完成的任务）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'running', 'done')),
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_by INTEGER,
+        notify_chat_id INTEGER,
+        progress_message_id INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status, id)
+    ''')
+
+    # 创建群发接收方表（每个群组的发送状态）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        job_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sent', 'failed')),
+        error TEXT,
+        migrated_to INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (job_id, chat_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients(job_id, status)
+    ''')
+
     # 创建用户归属ID映射表（用于限制用户只能查看特定归属ID的报表）
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS user_group_mapping (
@@ -360,6 +617,45 @@ def init_database():
         # 索引可能已存在，忽略错误
         pass
 
+    # 创建收入汇总表（按日期、类型、归属ID、客户类型汇总，由 record_income 同步维护）
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='income_rollup'")
+    income_rollup_existed = cursor.fetchone() is not None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS income_rollup (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL,
+        group_id TEXT,
+        customer TEXT,
+        count INTEGER DEFAULT 0,
+        amount REAL DEFAULT 0,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_income_rollup_unique
+    ON income_rollup(date, type, IFNULL(group_id, ''), IFNULL(customer, ''))
+    ''')
+    if not income_rollup_existed:
+        cursor.execute('''
+        INSERT INTO income_rollup (date, type, group_id, customer, count, amount)
+        SELECT date, type, group_id, customer, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM income_records
+        GROUP BY date, type, group_id, customer
+        ''')
+
+    # 待核对日期（收入明细与日结统计的一致性检查）
+    create_dirty_date_tracking(cursor)
+
+    # 为订单表创建索引（与 db_operations 中的查询条件一一对应）
+    for index_name, columns in ORDER_INDEXES:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON orders({columns})")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_expense_date_type ON expense_records(date, type)
+    ''')
+
     conn.commit()
     conn.close()
     print(f"数据库 {DB_NAME} 初始化完成！")
@@ -8,7 +8,10 @@ from telegram.ext import (
     CallbackQueryHandler
 )
 import init_db
+import db_operations
 from config import BOT_TOKEN, ADMIN_IDS
+from utils.update_concurrency import ChatOrderedUpdateProcessor
+from utils.webhook_server import is_webhook_mode, run_webhook
 from handlers import (
     start,
     create_order,
@@ -22,6 +25,7 @@ from handlers import (
     update_weekday_groups,
     fix_statistics,
     fix_income_statistics,
+    rebuild_income_rollup,
     find_tail_orders,
     set_user_group_id,
     remove_user_group_id,
@@ -41,6 +45,7 @@ from handlers import (
     handle_new_chat_title,
     handle_text_input,
     broadcast_payment,
+    show_broadcast_jobs,
     show_gcash,
     show_paymaya,
     show_all_accounts,
@@ -50,6 +55,7 @@ from handlers import (
 )
 from callbacks import button_callback, handle_order_action_callback, handle_schedule_callback
 from utils.schedule_executor import setup_scheduled_broadcasts
+from utils.broadcast_queue import start_broadcast_worker, stop_broadcast_worker
 from decorators import error_handler, admin_required, authorized_required, private_chat_only, group_chat_only
 import os
 import sys
@@ -164,9 +170,37 @@ def main() -> None:
             print(f"Database init failed: {e}")
         return
 
+    # 检查 db_operations 中的SQL是否存在全表扫描（仅告警，不影响启动）
+    try:
+        from utils.db_helpers import audit_query_plans
+        audit = audit_query_plans(init_db.DB_NAME, db_operations.__file__,
+                                  vars(db_operations), db_operations.QUERY_PLAN_SAMPLES)
+        for scan in audit['full_scans']:
+            logger.warning(
+                f"全表扫描: {scan['function']} (db_operations.py:{scan['line']}) "
+                f"{scan['detail']} | {scan['sql']}")
+        for item in audit['errors']:
+            logger.warning(
+                f"查询计划分析失败: {item['function']} (db_operations.py:{item['line']}) {item['error']}")
+        for item in audit['unaudited']:
+            logger.info(
+                f"动态SQL未检查: {item['function']} (db_operations.py:{item['line']}) {item['sql']}")
+        logger.info(
+            f"查询计划检查完成: 已检查 {audit['checked']} 条（其中动态SQL {audit['rendered']} 条），"
+            f"未检查动态SQL {len(audit['unaudited'])} 条，"
+            f"全表扫描 {len(audit['full_scans'])} 条")
+    except Exception as e:
+        logger.warning(f"查询计划检查失败: {e}")
+
     try:
         # 创建Application并传入bot的token
-        application = Application.builder().token(BOT_TOKEN).build()
+        # 并发处理更新：不同群组并行，同一群组/同一用户的更新按顺序执行
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(ChatOrderedUpdateProcessor())
+            .build()
+        )
     except Exception as e:
         logger.error(f"创建应用时出错: {e}")
         print(f"\n❌ 创建应用时出错: {e}")
@@ -238,6 +272,8 @@ def main() -> None:
         "fix_statistics", private_chat_only(admin_required(fix_statistics))))
     application.add_handler(CommandHandler(
         "fix_income_statistics", private_chat_only(admin_required(fix_income_statistics))))
+    application.add_handler(CommandHandler(
+        "rebuild_income_rollup", private_chat_only(admin_required(rebuild_income_rollup))))
     application.add_handler(CommandHandler(
         "find_tail_orders", private_chat_only(admin_required(find_tail_orders))))
     application.add_handler(CommandHandler(
@@ -248,6 +284,8 @@ def main() -> None:
         "list_user_group_mappings", private_chat_only(admin_required(list_user_group_mappings))))
     application.add_handler(CommandHandler(
         "check_mismatch", private_chat_only(admin_required(check_mismatch))))
+    application.add_handler(CommandHandler(
+        "broadcast_jobs", private_chat_only(admin_required(show_broadcast_jobs))))
     application.add_handler(CommandHandler(
         "customer", private_chat_only(admin_required(customer_contribution))))
 
@@ -301,6 +339,8 @@ def main() -> None:
                 print("命令菜单已更新")
             except UnicodeEncodeError:
                 print("Commands menu updated")
+            # 加载授权用户和归属ID映射缓存
+            await db_operations.load_access_cache()
             # 初始化定时播报任务
             await setup_scheduled_broadcasts(application.bot)
             try:
@@ -314,14 +354,36 @@ def main() -> None:
                 print("日切报表任务已初始化")
             except UnicodeEncodeError:
                 print("Daily report task initialized")
+            # 初始化夜间数据核对任务
+            from utils.schedule_executor import setup_nightly_mismatch_check
+            await setup_nightly_mismatch_check(application.bot)
+            # 启动群发任务队列（继续上次未完成的群发）
+            await start_broadcast_worker(application.bot)
+
+        async def post_stop(application: Application):
+            # 在关闭 Bot 连接之前停止群发任务队列，未发送的群组下次启动继续
+            await stop_broadcast_worker()
+
+        async def post_shutdown(application: Application):
+            # 关闭数据库连接池
+            db_operations.close_connection_pool()
+            try:
+                print("数据库连接已关闭")
+            except UnicodeEncodeError:
+                print("Database connections closed")
 
         try:
             print("机器人已启动，等待消息...")
         except UnicodeEncodeError:
             print("Bot started, waiting for messages...")
         application.post_init = post_init
-        # 启动机器人
-        application.run_polling(drop_pending_updates=True)
+        application.post_stop = post_stop
+        application.post_shutdown = post_shutdown
+        # 启动机器人（BOT_RUN_MODE=webhook 时由 Telegram 推送更新，否则长轮询）
+        if is_webhook_mode():
+            run_webhook(application)
+        else:
+            application.run_polling(drop_pending_updates=True)
     except telegram_error.Conflict as e:
         print("\n" + "="*60)
         print("⚠️ 检测到多个机器人实例正在运行！")
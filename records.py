@@ -0,0 +1,130 @@
+"""数据库记录类型：用 __slots__ 存储查询结果行，代替 dict(row)
+
+记录对象保留 dict 风格的访问方式（record['amount']、record.get('amount')、
+dict(record)），现有处理器无需修改；同时每行不再分配一个哈希表，
+适合在 context.user_data 中保存大量查找结果。
+
+只查询部分列（列投影）时，未查询的列不会出现在 keys() 中，
+record.get() 返回默认值，record[...] 抛出 KeyError。
+"""
+from typing import Iterable, Optional, Sequence, Tuple
+
+_MISSING = object()
+
+
+class Record:
+    """轻量记录基类，子类通过 FIELDS 声明表的全部列"""
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            self[name] = value
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """sqlite3 行工厂：cursor.row_factory = OrderRecord.row_factory"""
+        record = cls.__new__(cls)
+        for column, value in zip(cursor.description, row):
+            # 忽略不属于该表的列（如窗口函数生成的序号）
+            if column[0] in cls.FIELDS:
+                object.__setattr__(record, column[0], value)
+        return record
+
+    @classmethod
+    def select_list(cls, columns: Optional[Sequence[str]] = None) -> str:
+        """生成 SELECT 列清单，columns 为空时返回全部列"""
+        if not columns:
+            return ', '.join(cls.FIELDS)
+        unknown = [c for c in columns if c not in cls.FIELDS]
+        if unknown:
+            raise ValueError(f"{cls.__name__} 没有这些列: {unknown}")
+        return ', '.join(columns)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            return object.__getattribute__(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(f"{type(self).__name__} 没有列: {key}")
+        object.__setattr__(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        return key in self.FIELDS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, _MISSING) if key in self.FIELDS else _MISSING
+        return default if value is _MISSING else value
+
+    def keys(self) -> Iterable[str]:
+        return [name for name in self.FIELDS if hasattr(self, name)]
+
+    def values(self):
+        return [getattr(self, name) for name in self.keys()]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def clone(self) -> 'Record':
+        """返回同类型的记录副本"""
+        record = type(self).__new__(type(self))
+        record.__setstate__(self.to_dict())
+        return record
+
+    def copy(self) -> dict:
+        """返回普通 dict 副本（可以添加额外的键）"""
+        return self.to_dict()
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class OrderRecord(Record):
+    """orders 表的一行"""
+    FIELDS = ('id', 'order_id', 'group_id', 'chat_id', 'date', 'weekday_group',
+              'customer', 'amount', 'state', 'created_at', 'updated_at')
+    __slots__ = FIELDS
+
+
+class IncomeRecord(Record):
+    """income_records 表的一行"""
+    FIELDS = ('id', 'date', 'type', 'amount', 'group_id', 'order_id', 'order_date',
+              'customer', 'weekday_group', 'note', 'created_by', 'created_at')
+    __slots__ = FIELDS
+
+
+class ExpenseRecord(Record):
+    """expense_records 表的一行"""
+    FIELDS = ('id', 'date', 'type', 'amount', 'note', 'created_at')
+    __slots__ = FIELDS
+
+
+# 查找结果保存在 user_data 中供群发、修改归属和按金额选单使用，只需要这些列
+SEARCH_ORDER_COLUMNS = ('order_id', 'chat_id', 'group_id',
+                        'weekday_group', 'amount', 'state')
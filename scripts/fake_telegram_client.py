@@ -0,0 +1,90 @@
+"""模拟 Telegram 向本地 Webhook 服务推送更新（本地测试 Webhook 模式）
+
+用法:
+    # 终端1：以 Webhook 模式启动机器人（不设置 WEBHOOK_URL 则不会向 Telegram 注册）
+    BOT_RUN_MODE=webhook WEBHOOK_SECRET_TOKEN=test-secret python main.py
+
+    # 终端2：推送一条群消息更新
+    WEBHOOK_SECRET_TOKEN=test-secret python scripts/fake_telegram_client.py --chat-id -100123 --user-id 123456 --text "+1000"
+
+    # 只检查健康状态
+    python scripts/fake_telegram_client.py --health
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def build_text_update(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    """构造一条文本消息更新（字段与 Telegram Bot API 一致）"""
+    is_private = chat_id == user_id
+    chat = {'id': chat_id, 'type': 'private' if is_private else 'supergroup'}
+    if not is_private:
+        chat['title'] = 'Webhook Test Group'
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': chat,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Tester'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def post_update(url: str, secret: str, update: dict) -> int:
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), method='POST',
+        headers={'Content-Type': 'application/json',
+                 'X-Telegram-Bot-Api-Secret-Token': secret})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def get_health(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def main():
+    port = os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080'))
+    parser = argparse.ArgumentParser(description='向本地 Webhook 服务推送模拟更新')
+    parser.add_argument('--base-url', default=f'http://127.0.0.1:{port}')
+    parser.add_argument('--path', default=os.getenv('WEBHOOK_PATH', '/telegram/webhook'))
+    parser.add_argument('--health-path', default=os.getenv('WEBHOOK_HEALTH_PATH', '/healthz'))
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET_TOKEN', ''))
+    parser.add_argument('--chat-id', type=int, default=123456)
+    parser.add_argument('--user-id', type=int, default=123456)
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--count', type=int, default=1, help='连续推送的更新数')
+    parser.add_argument('--health', action='store_true', help='只检查健康状态')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    if not args.health:
+        update_id = int(time.time() * 1000) % 2_000_000_000
+        for i in range(args.count):
+            update = build_text_update(update_id + i, args.chat_id, args.user_id, args.text)
+            status = post_update(base_url + '/' + args.path.lstrip('/'), args.secret, update)
+            print(f"update {update['update_id']}: HTTP {status}")
+            if status != 200:
+                sys.exit(1)
+
+    status, payload = get_health(base_url + '/' + args.health_path.lstrip('/'))
+    print(f"health: HTTP {status} {payload}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""权限缓存测试 - 整体加载不能覆盖加载期间提交的修改"""
+import asyncio
+
+
+def test_stale_load_does_not_reauthorize_removed_user(temp_db, monkeypatch):
+    """加载期间移除的授权用户，加载完成后仍是未授权"""
+    db = temp_db
+    load = db._load_access_data
+    raced = []
+
+    async def racing_load():
+        snapshot = await load()
+        if not raced:
+            # 快照已读出，此时另一个更新移除了该用户
+            raced.append(True)
+            await db.remove_authorized_user(42)
+        return snapshot
+
+    async def scenario():
+        await db.add_authorized_user(42)
+        db._access_cache.loaded = False
+        monkeypatch.setattr(db, '_load_access_data', racing_load)
+        authorized = await db.is_user_authorized(42)
+        return authorized, await db.get_authorized_users()
+
+    authorized, stored = asyncio.run(scenario())
+    assert raced
+    assert authorized is False
+    assert 42 not in stored
+
+
+def test_stale_load_does_not_drop_new_group_mapping(temp_db, monkeypatch):
+    """加载期间设置的归属ID映射不会被旧快照覆盖"""
+    db = temp_db
+    load = db._load_access_data
+    raced = []
+
+    async def racing_load():
+        snapshot = await load()
+        if not raced:
+            raced.append(True)
+            await db.set_user_group_id(7, 'S01')
+        return snapshot
+
+    async def scenario():
+        monkeypatch.setattr(db, '_load_access_data', racing_load)
+        await db.load_access_cache()
+        return await db.get_user_group_id(7)
+
+    assert asyncio.run(scenario()) == 'S01'
+    assert raced
+
+
+def test_mutations_update_loaded_cache(temp_db):
+    """增删授权用户后缓存与数据库一致"""
+    db = temp_db
+
+    async def scenario():
+        await db.load_access_cache()
+        await db.add_authorized_user(1)
+        await db.add_authorized_user(2)
+        await db.remove_authorized_user(1)
+        return (await db.is_user_authorized(1), await db.is_user_authorized(2),
+                sorted(await db.get_authorized_users()))
+
+    assert asyncio.run(scenario()) == (False, True, [2])
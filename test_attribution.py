@@ -0,0 +1,44 @@
+"""归属变更测试 - 订单归属和分组统计在一个事务中迁移"""
+import asyncio
+
+from utils.date_helpers import get_daily_period_date
+
+
+def _order(order_id: str, chat_id: int, group_id: str, amount: float, state: str) -> dict:
+    return {'order_id': order_id, 'group_id': group_id, 'chat_id': chat_id, 'date': '2024-01-01',
+            'group': '一', 'customer': 'A', 'amount': amount, 'state': state}
+
+
+def test_change_group_moves_orders_and_stats(temp_db):
+    """有效和违约统计迁移到新归属，已完成订单只改归属，迁移后统计仍与订单表一致"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        await db.create_order(_order('2401010001', -1, 'S01', 1000, 'normal'))
+        await db.create_order(_order('2401010002', -2, 'S01', 500, 'breach'))
+        await db.create_order(_order('2401010003', -3, 'S02', 300, 'end'))
+        await db.reconcile_order_stats()
+        # 先读一次，确认迁移后活跃订单缓存不会返回旧归属
+        await db.get_order_by_chat_id(-1)
+        financial_before = await db.get_financial_data()
+        result = await db.change_orders_group_id([-1, -2, -3, -9], 'S03', date)
+        return (result, financial_before, await db.get_financial_data(),
+                await db.get_grouped_data('S01'), await db.get_grouped_data('S03'),
+                await db.get_daily_data(date, 'S03'), await db.get_order_by_chat_id(-1),
+                await db.reconcile_order_stats(dry_run=True))
+
+    result, financial_before, financial, s01, s03, daily_s03, order, check = asyncio.run(scenario())
+    assert result['updated'] == 3
+    assert result['missing'] == [-9]
+    assert result['moved']['S01'] == {'orders': 2, 'valid_orders': 1, 'valid_amount': 1000,
+                                      'breach_orders': 1, 'breach_amount': 500}
+    assert result['moved']['S02']['orders'] == 1
+    assert (s01['valid_orders'], s01['valid_amount'], s01['breach_orders']) == (0, 0, 0)
+    assert (s03['valid_orders'], s03['valid_amount']) == (1, 1000)
+    assert (s03['breach_orders'], s03['breach_amount']) == (1, 500)
+    assert (daily_s03['breach_orders'], daily_s03['breach_amount']) == (1, 500)
+    assert {k: financial[k] for k in db.STATS_FIELDS} == \
+        {k: financial_before[k] for k in db.STATS_FIELDS}
+    assert order['group_id'] == 'S03'
+    assert check['groups'] == {} and check['global'] == {}
@@ -0,0 +1,59 @@
+"""群发引擎测试 - 限流重试、超级群组迁移和不可重试的错误"""
+import asyncio
+
+from telegram.error import ChatMigrated, Forbidden, RetryAfter
+
+from utils.broadcast_engine import BroadcastEngine, PerChatLimiter, TokenBucket
+
+
+class ScriptedBot:
+    """按群组预设错误序列的假机器人，错误用完后发送成功"""
+
+    def __init__(self, errors):
+        self.errors = {chat_id: list(seq) for chat_id, seq in errors.items()}
+        self.calls = []
+
+    async def send_message(self, chat_id, text):
+        self.calls.append(chat_id)
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+
+
+def _engine(bot, results=None, **kwargs):
+    async def on_result(chat_id, ok, error, migrated_to):
+        results.append((chat_id, ok, migrated_to))
+
+    return BroadcastEngine(bot, bucket=TokenBucket(1000), chat_limiter=PerChatLimiter(0),
+                           on_result=on_result if results is not None else None, **kwargs)
+
+
+def test_retry_after_migration_and_forbidden():
+    """RetryAfter 后重发成功，迁移后发往新群组，Forbidden 直接记为失败"""
+    bot = ScriptedBot({
+        -1: [RetryAfter(0)],
+        -2: [ChatMigrated(-200)],
+        -3: [Forbidden('bot was kicked')],
+    })
+    results = []
+
+    report = asyncio.run(_engine(bot, results, concurrency=2).send_all([-1, -2, -3, -1], 'hi'))
+
+    assert report.total == 3
+    assert report.sent == 2
+    assert list(report.failed) == [-3]
+    assert report.flood_waits == 1
+    assert report.migrated == {-2: -200}
+    assert sorted(bot.calls) == [-200, -3, -2, -1, -1]
+    assert sorted(results) == [(-3, False, None), (-2, True, -200), (-1, True, None)]
+
+
+def test_flood_wait_limit_marks_failed():
+    """同一群组连续限流超过上限时放弃并记为失败"""
+    bot = ScriptedBot({-1: [RetryAfter(0)] * 5})
+
+    report = asyncio.run(_engine(bot, max_flood_waits=2).send_all([-1], 'hi'))
+
+    assert report.sent == 0
+    assert report.failed[-1].startswith('RetryAfter')
+    assert bot.calls == [-1, -1, -1]
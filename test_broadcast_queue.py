@@ -0,0 +1,49 @@
+"""群发任务队列测试 - 重启后继续未完成的任务，只发送尚未发送的群组"""
+import asyncio
+
+from telegram.error import Forbidden
+
+from utils.broadcast_queue import _run_job
+
+
+class FakeBot:
+    """记录发送目标的假机器人，blocked 中的群组返回 Forbidden"""
+
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent_to = []
+
+    async def send_message(self, chat_id, text):
+        self.sent_to.append(chat_id)
+        if chat_id in self.blocked:
+            raise Forbidden('bot was kicked')
+
+
+def test_resumed_job_sends_only_pending_recipients(temp_db):
+    """中断前已记录结果的群组不会再次发送，任务完成后成功/失败数包含两次运行的结果"""
+    db = temp_db
+    bot = FakeBot(blocked={-4})
+
+    async def scenario():
+        job_id = await db.create_broadcast_job('hello', [-1, -2, -3, -4, -5])
+        # 模拟上次运行：发送了两个群组后机器人重启，任务停留在执行中
+        interrupted = await db.claim_next_broadcast_job()
+        await db.record_broadcast_result(job_id, -1, True)
+        await db.record_broadcast_result(job_id, -2, False, 'Forbidden')
+
+        job = await db.claim_next_broadcast_job()
+        pending = await db.get_pending_broadcast_recipients(job_id)
+        await _run_job(bot, job)
+        return (interrupted['id'], job, pending, await db.get_broadcast_job(job_id),
+                await db.get_pending_broadcast_recipients(job_id),
+                await db.claim_next_broadcast_job())
+
+    interrupted_id, job, pending, finished, remaining, next_job = asyncio.run(scenario())
+    assert job['id'] == interrupted_id
+    assert (job['sent'], job['failed']) == (1, 1)
+    assert pending == [-3, -4, -5]
+    assert sorted(bot.sent_to) == [-5, -4, -3]
+    assert finished['status'] == 'done'
+    assert (finished['sent'], finished['failed'], finished['total']) == (3, 2, 5)
+    assert remaining == []
+    assert next_job is None
@@ -0,0 +1,38 @@
+"""客户贡献报表测试 - 汇总和订单明细与数据库一致"""
+import asyncio
+
+from records import OrderRecord
+
+
+def _order(order_id: str, chat_id: int, date: str, amount: float) -> dict:
+    return {'order_id': order_id, 'group_id': 'S01', 'chat_id': chat_id, 'date': date,
+            'group': '一', 'customer': 'A', 'amount': amount, 'state': 'normal'}
+
+
+def test_contribution_report_orders_and_totals(temp_db):
+    """订单明细只包含订单列，收入按订单聚合"""
+    db = temp_db
+
+    async def scenario():
+        await db.create_order(_order('2401010001', -1, '2024-01-01', 1000))
+        await db.create_order(_order('2401020001', -2, '2024-01-02', 2000))
+        await db.record_income('2024-01-05', 'interest', 50, group_id='S01',
+                               order_id='2401010001', customer='A')
+        await db.record_income('2024-01-06', 'interest', 70, group_id='S01',
+                               order_id='2401010001', customer='A')
+        await db.record_income('2024-01-07', 'completed', 2000, group_id='S01',
+                               order_id='2401020001', customer='A')
+        return await db.get_customer_contribution_report('a')
+
+    report = asyncio.run(scenario())
+    assert report['order_count'] == 2
+    assert report['total_interest'] == 120
+    assert report['interest_count'] == 2
+    assert report['total_amount'] == 2120
+
+    first, second = report['orders']
+    assert set(first['order']) == set(OrderRecord.FIELDS)
+    assert first['order']['order_id'] == '2401020001'
+    assert (first['completed'], first['total_contribution']) == (2000, 2000)
+    assert second['order']['amount'] == 1000
+    assert (second['interest'], second['total_contribution']) == (120, 120)
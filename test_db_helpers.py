@@ -0,0 +1,71 @@
+"""查询计划检查测试 - f-string SQL 的渲染和全表扫描判定"""
+import sqlite3
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parent.absolute()
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from utils.db_helpers import audit_query_plans, collect_sql_statements
+
+SOURCE = '''
+FIELDS = ('amount', 'date')
+
+
+def search(conn, cursor, where_clause):
+    cursor.execute(f"SELECT {', '.join(FIELDS)} FROM orders WHERE {where_clause}")
+
+
+def unknown(conn, cursor, table):
+    cursor.execute(f"SELECT * FROM {table}")
+
+
+def pragma(conn, cursor, size):
+    cursor.execute(f"PRAGMA cache_size={size}")
+
+
+def scan(conn, cursor):
+    cursor.execute("SELECT * FROM orders WHERE customer = ?", ('x',))
+
+
+def cte(conn, cursor):
+    cursor.execute("""
+    WITH totals AS (SELECT date, SUM(amount) AS amount FROM orders WHERE date >= ? GROUP BY date),
+    days AS (SELECT DISTINCT date FROM totals)
+    SELECT k.date, t.amount FROM days k LEFT JOIN totals t ON t.date = k.date
+    """)
+'''
+
+
+def _write_fixture(tmp_path):
+    source = tmp_path / 'queries.py'
+    source.write_text(SOURCE, encoding='utf-8')
+    db_path = str(tmp_path / 'audit.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, customer TEXT, date TEXT, amount REAL)')
+    conn.execute('CREATE INDEX idx_orders_date ON orders(date)')
+    conn.close()
+    return str(source), db_path
+
+
+def test_fstrings_are_rendered_or_listed_as_unaudited(tmp_path):
+    """能渲染的 f-string 参与检查，不能渲染的列入未检查，PRAGMA 忽略"""
+    source, _ = _write_fixture(tmp_path)
+    statements, unaudited = collect_sql_statements(
+        source, {'FIELDS': ('amount', 'date')}, {'where_clause': 'date >= ?'})
+
+    rendered = [s for s in statements if s['rendered']]
+    assert [s['sql'] for s in rendered] == ['SELECT amount, date FROM orders WHERE date >= ?']
+    assert [u['function'] for u in unaudited] == ['unknown']
+
+
+def test_cte_scans_are_not_reported(tmp_path):
+    """CTE 的扫描不算全表扫描，真实的全表扫描仍然报告"""
+    source, db_path = _write_fixture(tmp_path)
+    audit = audit_query_plans(db_path, source, {'FIELDS': ('amount', 'date')},
+                              {'where_clause': 'date >= ?'})
+
+    assert audit['errors'] == []
+    assert audit['rendered'] == 1
+    assert [(s['function'], s['table']) for s in audit['full_scans']] == [('scan', 'orders')]
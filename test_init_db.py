@@ -0,0 +1,23 @@
+"""数据库初始化测试 - SQLite 版本检查"""
+import sqlite3
+
+import pytest
+
+import init_db
+
+
+def test_old_sqlite_is_rejected_before_touching_the_database(tmp_path, monkeypatch):
+    """SQLite 低于 3.35 时 init_database 直接报错，不创建数据库"""
+    db_path = tmp_path / 'loan_bot.db'
+    monkeypatch.setattr(init_db, 'DB_NAME', str(db_path))
+    monkeypatch.setattr(sqlite3, 'sqlite_version_info', (3, 31, 1))
+    monkeypatch.setattr(sqlite3, 'sqlite_version', '3.31.1')
+
+    with pytest.raises(RuntimeError, match='3.35'):
+        init_db.init_database()
+    assert not db_path.exists()
+
+
+def test_current_sqlite_is_supported():
+    """运行测试的 SQLite 满足最低版本"""
+    init_db.check_sqlite_version()
@@ -0,0 +1,64 @@
+"""月度汇总测试 - 触发器维护的 monthly_data 与日结数据逐字段一致"""
+import asyncio
+
+import pytest
+
+RANGES = [
+    ('2024-01-15', '2024-03-31'),
+    ('2024-02-01', '2024-02-29'),
+    ('2024-01-01', '2024-04-30'),
+    ('2024-02-10', '2024-02-20'),
+]
+
+
+def _raw_range_sums(db, start_date, end_date, group_id):
+    """直接对 daily_data 求和，作为比较基准"""
+    group_clause = "group_id = ?" if group_id else "group_id IS NULL"
+    sums = ", ".join(f"IFNULL(SUM({field}), 0) AS {field}" for field in db.DAILY_STATS_FIELDS)
+    conn = db.get_connection()
+    try:
+        row = conn.execute(
+            f"SELECT {sums} FROM daily_data WHERE date >= ? AND date <= ? AND {group_clause}",
+            [start_date, end_date] + ([group_id] if group_id else [])).fetchone()
+        return {field: row[field] for field in db.DAILY_STATS_FIELDS}
+    finally:
+        conn.close()
+
+
+def test_split_range_by_month():
+    """首尾不足一个月的部分按日查询，中间整月按月查询"""
+    from db_operations import _split_range_by_month
+
+    assert _split_range_by_month('2024-01-15', '2024-03-31') == \
+        ([('2024-01-15', '2024-01-31')], ('2024-02', '2024-03'))
+    assert _split_range_by_month('2024-02-01', '2024-02-29') == ([], ('2024-02', '2024-02'))
+    assert _split_range_by_month('2024-02-10', '2024-02-20') == ([('2024-02-10', '2024-02-20')], None)
+    assert _split_range_by_month('2024-01-31', '2024-03-01') == \
+        ([('2024-01-31', '2024-01-31'), ('2024-03-01', '2024-03-01')], ('2024-02', '2024-02'))
+
+
+@pytest.mark.parametrize('group_id', [None, 'S01'])
+def test_range_stats_match_daily_rows(temp_db, group_id):
+    """插入、累加、删除日结行后，按月汇总的范围统计与直接求和一致"""
+    db = temp_db
+    days = ['2024-01-20', '2024-02-05', '2024-02-28', '2024-03-10', '2024-04-02']
+
+    async def scenario():
+        for i, date in enumerate(days, start=1):
+            await db.apply_stats_deltas(
+                {}, {(date, group_id): {'interest': 10 * i, 'new_clients': 1,
+                                        'completed_amount': 100 * i}}, {})
+        # 同一行再次累加（负数）走更新触发器
+        await db.apply_stats_deltas({}, {('2024-02-05', group_id): {'interest': -5}}, {})
+        conn = db.get_connection()
+        try:
+            conn.execute("DELETE FROM daily_data WHERE date = '2024-03-10'")
+            conn.commit()
+        finally:
+            conn.close()
+        return {r: await db.get_stats_by_date_range(*r, group_id=group_id) for r in RANGES}
+
+    results = asyncio.run(scenario())
+    for date_range, stats in results.items():
+        assert stats == _raw_range_sums(db, *date_range, group_id), date_range
+    assert results[('2024-01-01', '2024-04-30')]['interest'] == 10 + 15 + 30 + 50
@@ -0,0 +1,105 @@
+"""订单创建测试 - 订单、统计和操作历史在一个事务中写入"""
+import asyncio
+import os
+
+# 导入处理器会加载 config，测试环境没有真实配置时使用占位值
+os.environ.setdefault('BOT_TOKEN', '123456:test-token')
+os.environ.setdefault('ADMIN_USER_IDS', '1')
+
+from handlers.undo_handlers import _plan_undo_order_created
+from utils.date_helpers import get_daily_period_date
+from utils.stats_helpers import StatsDelta
+
+CHAT_ID = -1001
+USER_ID = 7
+ORDER = {'order_id': '2401010001', 'group_id': 'S01', 'chat_id': CHAT_ID, 'date': '2024-01-01 12:00:00',
+         'group': '一', 'customer': 'A', 'amount': 1000, 'state': 'normal'}
+
+
+def _creation_delta(amount: float = 1000) -> StatsDelta:
+    delta = StatsDelta(get_daily_period_date())
+    delta.add('valid', amount, 1, 'S01')
+    delta.add_liquid_capital(-amount)
+    delta.add('new_clients', amount, 1, 'S01')
+    return delta
+
+
+def _operation() -> dict:
+    return {'user_id': USER_ID, 'operation_type': 'order_created', 'chat_id': CHAT_ID,
+            'operation_data': {'order_id': '2401010001', 'chat_id': CHAT_ID, 'group_id': 'S01',
+                               'amount': 1000, 'customer': 'A', 'initial_state': 'normal',
+                               'is_historical': False, 'date': ORDER['date']}}
+
+
+def test_create_order_is_one_write_and_undoable(temp_db, stats_snapshot):
+    """一次写事务完成订单、统计和操作历史，撤销后统计恢复原样"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        before = await stats_snapshot(date, 'S01')
+        writes = db.get_engine_stats()['writes']
+        delta = _creation_delta()
+        result = await db.create_order_with_stats(
+            ORDER, delta.global_deltas, delta.daily_deltas, delta.grouped_deltas,
+            operation=_operation())
+        write_count = db.get_engine_stats()['writes'] - writes
+        created = await stats_snapshot(date, 'S01')
+        order = await db.get_order_by_chat_id(CHAT_ID)
+        operation = await db.get_last_operation(USER_ID, CHAT_ID)
+        undone = await db.undo_operation(
+            operation['id'], _plan_undo_order_created(operation['operation_data']))
+        return (before, result, write_count, created, order, operation, undone,
+                await stats_snapshot(date, 'S01'), await db.get_order_by_order_id('2401010001'))
+
+    before, result, write_count, created, order, operation, undone, after, deleted = \
+        asyncio.run(scenario())
+    assert write_count == 1
+    assert result['operation_id'] == operation['id']
+    assert order['amount'] == 1000
+    assert created['grouped']['valid_amount'] - before['grouped']['valid_amount'] == 1000
+    assert created['financial']['liquid_funds'] - before['financial']['liquid_funds'] == -1000
+    assert created['daily_group']['new_clients'] == 1
+    assert undone is True
+    assert after == before
+    assert deleted is None
+
+
+def test_duplicate_order_writes_nothing(temp_db, stats_snapshot):
+    """订单已存在时返回 None，统计和操作历史都不写入"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        await db.create_order(ORDER)
+        before = await stats_snapshot(date, 'S01')
+        delta = _creation_delta()
+        result = await db.create_order_with_stats(
+            ORDER, delta.global_deltas, delta.daily_deltas, delta.grouped_deltas,
+            operation=_operation())
+        return result, before, await stats_snapshot(date, 'S01'), \
+            await db.get_last_operation(USER_ID, CHAT_ID)
+
+    result, before, after, operation = asyncio.run(scenario())
+    assert result is None
+    assert after == before
+    assert operation is None
+
+
+def test_stats_failure_rolls_back_the_order(temp_db, stats_snapshot):
+    """统计写入失败时订单也不会留下，返回 False"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        before = await stats_snapshot(date, 'S01')
+        result = await db.create_order_with_stats(
+            ORDER, {'no_such_field': 1}, {}, {}, operation=_operation())
+        return result, before, await stats_snapshot(date, 'S01'), \
+            await db.get_order_by_chat_id(CHAT_ID), await db.get_last_operation(USER_ID, CHAT_ID)
+
+    result, before, after, order, operation = asyncio.run(scenario())
+    assert result is False
+    assert after == before
+    assert order is None
+    assert operation is None
@@ -0,0 +1,112 @@
+"""订单状态机测试 - 状态、收入明细、统计和操作历史在一个事务中写入"""
+import asyncio
+
+import pytest
+
+from utils.date_helpers import get_daily_period_date
+from utils.order_state_machine import transition_order
+
+CHAT_ID = -1001
+USER_ID = 7
+
+
+async def _create_order(db, state: str = 'normal', amount: float = 1000):
+    await db.create_order({
+        'order_id': '2401010001', 'group_id': 'S01', 'chat_id': CHAT_ID, 'date': '2024-01-01',
+        'group': '一', 'customer': 'A', 'amount': amount, 'state': state})
+    return await db.get_order_by_chat_id(CHAT_ID)
+
+
+def test_end_transition_writes_state_income_stats_and_history(temp_db, stats_snapshot):
+    """完成订单：有效统计移入完成统计，记录完成收入、流动资金和操作历史"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        order = await _create_order(db)
+        before = await stats_snapshot(date, 'S01')
+        result = await transition_order(order, 'end', user_id=USER_ID)
+        return (before, result, await stats_snapshot(date, 'S01'),
+                await db.get_order_by_order_id('2401010001'),
+                await db.get_income_records(date, order_id='2401010001'),
+                await db.get_last_operation(USER_ID, CHAT_ID))
+
+    before, result, after, order, incomes, operation = asyncio.run(scenario())
+    assert order['state'] == 'end'
+    assert [(i['type'], i['amount']) for i in incomes] == [('completed', 1000)]
+    assert result['income_id'] == incomes[0]['id']
+
+    for scope in ('financial', 'grouped'):
+        assert after[scope]['valid_orders'] - before[scope]['valid_orders'] == -1
+        assert after[scope]['valid_amount'] - before[scope]['valid_amount'] == -1000
+        assert after[scope]['completed_orders'] - before[scope]['completed_orders'] == 1
+        assert after[scope]['completed_amount'] - before[scope]['completed_amount'] == 1000
+    assert after['financial']['liquid_funds'] - before['financial']['liquid_funds'] == 1000
+    assert after['daily']['completed_amount'] == 1000
+    assert after['daily']['liquid_flow'] == 1000
+    assert after['daily_group']['completed_orders'] == 1
+    assert after['income_rollup'] == [{'type': 'completed', 'count': 1, 'amount': 1000}]
+
+    assert operation['id'] == result['operation_id']
+    assert operation['operation_type'] == 'order_completed'
+    assert operation['operation_data']['income_record_id'] == result['income_id']
+
+
+def test_stale_from_state_changes_nothing(temp_db, stats_snapshot):
+    """订单状态已被其他操作修改时返回 None，不写入任何数据"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        stale = await _create_order(db)
+        await db.update_order_state(CHAT_ID, 'overdue')
+        before = await stats_snapshot(date, 'S01')
+        result = await transition_order(stale, 'end', user_id=USER_ID)
+        return (result, before, await stats_snapshot(date, 'S01'),
+                await db.get_order_by_order_id('2401010001'),
+                await db.get_income_records(date, order_id='2401010001'),
+                await db.get_last_operation(USER_ID, CHAT_ID))
+
+    result, before, after, order, incomes, operation = asyncio.run(scenario())
+    assert result is None
+    assert after == before
+    assert order['state'] == 'overdue'
+    assert incomes == []
+    assert operation is None
+
+
+def test_breach_then_breach_end(temp_db, stats_snapshot):
+    """违约后违约完成：有效 -> 违约，再按协商金额记录违约完成"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        order = await _create_order(db)
+        before = await stats_snapshot(date, 'S01')
+        await transition_order(order, 'breach', user_id=USER_ID)
+        breached = await db.get_order_by_order_id('2401010001')
+        await transition_order(breached, 'breach_end', user_id=USER_ID, amount=600)
+        return before, await stats_snapshot(date, 'S01'), await db.get_order_by_order_id('2401010001')
+
+    before, after, order = asyncio.run(scenario())
+    assert order['state'] == 'breach_end'
+    grouped_diff = {k: after['grouped'][k] - before['grouped'][k] for k in after['grouped']}
+    assert {k: v for k, v in grouped_diff.items() if v} == {
+        'valid_orders': -1, 'valid_amount': -1000,
+        'breach_orders': 1, 'breach_amount': 1000,
+        'breach_end_orders': 1, 'breach_end_amount': 600}
+    assert after['financial']['liquid_funds'] - before['financial']['liquid_funds'] == 600
+    assert after['income_rollup'] == [{'type': 'breach_end', 'count': 1, 'amount': 600}]
+
+
+def test_illegal_transition_is_rejected(temp_db):
+    """非法的状态变更抛出 ValueError"""
+    db = temp_db
+
+    async def scenario():
+        order = await _create_order(db, state='breach')
+        with pytest.raises(ValueError):
+            await transition_order(order, 'end', user_id=USER_ID)
+        return await db.get_order_by_order_id('2401010001')
+
+    assert asyncio.run(scenario())['state'] == 'breach'
@@ -0,0 +1,118 @@
+"""对账引擎测试 - 订单/收入对账、一致性核对和星期分组修正"""
+import asyncio
+
+
+def _order(order_id: str, chat_id: int, group_id: str, amount: float, state: str,
+           date: str = '2024-01-01', weekday_group: str = '一') -> dict:
+    return {'order_id': order_id, 'group_id': group_id, 'chat_id': chat_id, 'date': date,
+            'group': weekday_group, 'customer': 'A', 'amount': amount, 'state': state}
+
+
+def test_order_reconcile_dry_run_writes_nothing(temp_db):
+    """预览模式只返回差异，不提交任何写事务"""
+    db = temp_db
+
+    async def scenario():
+        await db.create_order(_order('2401010001', -1, 'S01', 1000, 'normal'))
+        await db.create_order(_order('2401010002', -2, 'S02', 500, 'breach'))
+        writes = db.get_engine_stats()['writes']
+        result = await db.reconcile_order_stats(dry_run=True)
+        return result, db.get_engine_stats()['writes'] - writes, await db.get_grouped_data('S01')
+
+    result, writes, grouped = asyncio.run(scenario())
+    assert writes == 0
+    assert result['dry_run'] is True
+    assert result['groups']['S01']['valid_amount']['diff'] == 1000
+    assert result['groups']['S02']['breach_orders']['diff'] == 1
+    assert result['global']['valid_orders']['actual'] == 1
+    assert grouped['valid_amount'] == 0
+
+
+def test_order_reconcile_applies_corrections(temp_db):
+    """修复后分组统计和全局统计与订单表一致，再次对账没有差异"""
+    db = temp_db
+
+    async def scenario():
+        await db.create_order(_order('2401010001', -1, 'S01', 1000, 'normal'))
+        await db.create_order(_order('2401010002', -2, 'S01', 300, 'overdue'))
+        await db.create_order(_order('2401010003', -3, 'S02', 500, 'breach'))
+        await db.update_grouped_data('S02', 'valid_orders', 4)
+        result = await db.reconcile_order_stats()
+        return (result, await db.get_grouped_data('S01'), await db.get_grouped_data('S02'),
+                await db.get_financial_data(), await db.reconcile_order_stats(dry_run=True))
+
+    result, s01, s02, financial, again = asyncio.run(scenario())
+    assert set(result['groups']) == {'S01', 'S02'}
+    assert (s01['valid_orders'], s01['valid_amount']) == (2, 1300)
+    assert (s02['valid_orders'], s02['breach_orders'], s02['breach_amount']) == (0, 1, 500)
+    assert (financial['valid_orders'], financial['valid_amount']) == (2, 1300)
+    assert again['groups'] == {} and again['global'] == {}
+
+
+def test_income_reconcile_dry_run_then_fix(temp_db):
+    """收入对账：预览不写入，修复后日结和全局统计等于收入明细"""
+    db = temp_db
+
+    async def scenario():
+        await db.record_income('2024-01-05', 'interest', 50, group_id='S01')
+        await db.record_income('2024-01-05', 'interest', 30, group_id='S02')
+        await db.record_income('2024-01-06', 'completed', 1000, group_id='S01')
+        writes = db.get_engine_stats()['writes']
+        preview = await db.reconcile_income_stats(dry_run=True)
+        preview_writes = db.get_engine_stats()['writes'] - writes
+        daily_before = await db.get_daily_data('2024-01-05')
+        fixed = await db.reconcile_income_stats()
+        return (preview, preview_writes, daily_before, fixed,
+                await db.get_daily_data('2024-01-05'), await db.get_daily_data('2024-01-05', 'S01'),
+                await db.get_financial_data(), await db.reconcile_income_stats(dry_run=True))
+
+    preview, preview_writes, daily_before, fixed, daily, daily_s01, financial, again = \
+        asyncio.run(scenario())
+    assert preview_writes == 0
+    assert daily_before['interest'] == 0
+    assert len(preview['daily']) == len(fixed['daily']) == 5
+    assert preview['global']['interest']['diff'] == 80
+    assert daily['interest'] == 80
+    assert daily_s01['interest'] == 50
+    assert (financial['interest'], financial['completed_amount'], financial['completed_orders']) == \
+        (80, 1000, 1)
+    assert again['daily'] == [] and again['global'] == {}
+
+
+def test_consistency_check_clears_only_consistent_dates(temp_db):
+    """不一致的日期保留在待核对表中，修复后核对一致才清除"""
+    db = temp_db
+
+    async def scenario():
+        await db.record_income('2024-01-05', 'interest', 50, group_id='S01')
+        first = await db.check_stats_consistency()
+        await db.reconcile_income_stats()
+        second = await db.check_stats_consistency()
+        third = await db.check_stats_consistency()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert [m['date'] for m in first['mismatches']] == ['2024-01-05']
+    assert first['cleared'] == 0
+    assert second['mismatches'] == [] and second['cleared'] == 1
+    assert third['checked_dates'] == 0
+
+
+def test_weekday_repair_dry_run_and_apply(temp_db):
+    """星期分组修正：预览不修改，执行后分组与订单日期一致"""
+    db = temp_db
+
+    async def scenario():
+        # 2024-01-01 是星期一
+        await db.create_order(_order('2401010001', -1, 'S01', 1000, 'normal', weekday_group='三'))
+        await db.create_order(_order('2401010002', -2, 'S01', 1000, 'normal'))
+        preview = await db.repair_weekday_groups(dry_run=True)
+        unchanged = await db.get_order_by_chat_id(-1)
+        result = await db.repair_weekday_groups()
+        return preview, unchanged, result, await db.get_order_by_chat_id(-1)
+
+    preview, unchanged, result, repaired = asyncio.run(scenario())
+    assert (preview['updated'], preview['unchanged'], preview['total']) == (1, 1, 2)
+    assert unchanged['weekday_group'] == '三'
+    assert result['updated'] == 1
+    assert repaired['weekday_group'] == '一'
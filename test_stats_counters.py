@@ -0,0 +1,41 @@
+"""统计计数测试 - UPSERT 增量在并发写入下不丢失更新"""
+import asyncio
+
+
+def test_concurrent_increments_are_not_lost(temp_db):
+    """并发提交的增量全部累加到全局、日结和分组统计，缓存读到最新值"""
+    db = temp_db
+    date = '2024-01-05'
+    runs = 50
+
+    async def scenario():
+        # 先读一次，让全局统计进入缓存（流动资金有初始值）
+        before = await db.get_financial_data()
+        await asyncio.gather(*(
+            db.apply_stats_deltas(
+                {'interest': 2, 'liquid_funds': 2},
+                {(date, None): {'interest': 2}, (date, 'S01'): {'interest': 2}},
+                {'S01': {'interest': 2}})
+            for _ in range(runs)))
+        return (before, await db.get_financial_data(), await db.get_daily_data(date),
+                await db.get_daily_data(date, 'S01'), await db.get_grouped_data('S01'))
+
+    before, financial, daily, daily_s01, grouped = asyncio.run(scenario())
+    assert financial['interest'] - before['interest'] == 2 * runs
+    assert financial['liquid_funds'] - before['liquid_funds'] == 2 * runs
+    assert daily['interest'] == daily_s01['interest'] == grouped['interest'] == 2 * runs
+
+
+def test_increments_create_missing_rows(temp_db):
+    """日结和分组行不存在时由 UPSERT 创建，负增量同样生效"""
+    db = temp_db
+
+    async def scenario():
+        await db.apply_stats_deltas({}, {('2024-01-06', 'S09'): {'new_clients': 1}},
+                                    {'S09': {'valid_orders': 1, 'valid_amount': 800}})
+        await db.apply_stats_deltas({}, {}, {'S09': {'valid_orders': -1, 'valid_amount': -800}})
+        return await db.get_daily_data('2024-01-06', 'S09'), await db.get_grouped_data('S09')
+
+    daily, grouped = asyncio.run(scenario())
+    assert daily['new_clients'] == 1
+    assert (grouped['valid_orders'], grouped['valid_amount']) == (0, 0)
@@ -0,0 +1,162 @@
+"""撤销测试 - 补偿事务恢复订单、收入明细和统计数据"""
+import asyncio
+import os
+
+# 导入处理器会加载 config，测试环境没有真实配置时使用占位值
+os.environ.setdefault('BOT_TOKEN', '123456:test-token')
+os.environ.setdefault('ADMIN_USER_IDS', '1')
+
+from handlers.undo_handlers import (
+    _plan_undo_interest,
+    _plan_undo_order_completed,
+    _plan_undo_order_state_change,
+)
+from utils.date_helpers import get_daily_period_date
+from utils.order_state_machine import transition_order
+from utils.stats_helpers import StatsDelta
+
+CHAT_ID = -1001
+USER_ID = 7
+
+
+async def _create_order(db):
+    await db.create_order({
+        'order_id': '2401010001', 'group_id': 'S01', 'chat_id': CHAT_ID, 'date': '2024-01-01',
+        'group': '一', 'customer': 'A', 'amount': 1000, 'state': 'normal'})
+    return await db.get_order_by_chat_id(CHAT_ID)
+
+
+def test_undo_end_transition_restores_everything(temp_db, stats_snapshot):
+    """撤销订单完成：状态、收入明细、收入汇总和各级统计恢复原样；再次撤销返回 None"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        order = await _create_order(db)
+        before = await stats_snapshot(date, 'S01')
+        await transition_order(order, 'end', user_id=USER_ID)
+        operation = await db.get_last_operation(USER_ID, CHAT_ID)
+        plan = _plan_undo_order_completed(operation['operation_data'])
+        first = await db.undo_operation(operation['id'], plan)
+        after = await stats_snapshot(date, 'S01')
+        second = await db.undo_operation(operation['id'], plan)
+        return (before, first, after, second, await stats_snapshot(date, 'S01'),
+                await db.get_order_by_chat_id(CHAT_ID),
+                await db.get_income_records(date, order_id='2401010001'),
+                await db.get_last_operation(USER_ID, CHAT_ID))
+
+    before, first, after, second, after_second, order, incomes, last = asyncio.run(scenario())
+    assert first is True
+    assert after == before
+    assert second is None
+    assert after_second == before
+    assert order['state'] == 'normal'
+    assert incomes == []
+    assert last is None
+
+
+def test_undo_fails_atomically_when_order_changed(temp_db, stats_snapshot):
+    """订单状态已被修改时撤销失败，整个事务回滚，操作仍可再次撤销"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        order = await _create_order(db)
+        await transition_order(order, 'breach', user_id=USER_ID)
+        operation = await db.get_last_operation(USER_ID, CHAT_ID)
+        # 违约后又被改成违约完成，撤销“违约”要求状态仍为 breach
+        await db.update_order_state(CHAT_ID, 'breach_end')
+        before = await stats_snapshot(date, 'S01')
+        plan = _plan_undo_order_state_change(operation['operation_data'])
+        result = await db.undo_operation(operation['id'], plan)
+        return (result, before, await stats_snapshot(date, 'S01'),
+                await db.get_order_by_order_id('2401010001'),
+                await db.get_operation_by_id(operation['id']))
+
+    result, before, after, order, operation = asyncio.run(scenario())
+    assert result is False
+    assert after == before
+    assert order['state'] == 'breach_end'
+    assert operation['is_undone'] == 0
+
+
+def test_undo_interest_deletes_income_and_stats(temp_db, stats_snapshot):
+    """撤销利息收入：删除收入明细并扣回利息和流动资金"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        before = await stats_snapshot(date, 'S01')
+        income_id = await db.record_income(date, 'interest', 80, group_id='S01',
+                                           order_id='2401010001', customer='A')
+        delta = StatsDelta(date)
+        delta.add('interest', 80, 0, 'S01')
+        delta.add_liquid_capital(80)
+        await delta.apply()
+        operation_id = await db.record_operation(USER_ID, 'interest', {
+            'amount': 80, 'group_id': 'S01', 'date': date, 'income_record_id': income_id,
+        }, CHAT_ID)
+        operation = await db.get_operation_by_id(operation_id)
+        result = await db.undo_operation(operation_id, _plan_undo_interest(operation['operation_data']))
+        return before, result, await stats_snapshot(date, 'S01'), \
+            await db.get_income_records(date, order_id='2401010001')
+
+    before, result, after, incomes = asyncio.run(scenario())
+    assert result is True
+    assert after == before
+    assert incomes == []
+
+
+def test_undo_last_income_of_day_leaves_no_rollup_row(temp_db):
+    """撤销当天最后一笔收入后汇总行被删除，收入总览没有笔数为 0 的类型"""
+    db = temp_db
+    date = '2024-03-01'
+
+    async def scenario():
+        operation_ids = []
+        for amount in (0.1, 0.2):
+            income_id = await db.record_income(date, 'interest', amount, group_id='S01')
+            delta = StatsDelta(date)
+            delta.add('interest', amount, 0, 'S01')
+            delta.add_liquid_capital(amount)
+            await delta.apply()
+            operation_ids.append(await db.record_operation(USER_ID, 'interest', {
+                'amount': amount, 'group_id': 'S01', 'date': date, 'income_record_id': income_id,
+            }, CHAT_ID))
+        for operation_id in operation_ids:
+            operation = await db.get_operation_by_id(operation_id)
+            assert await db.undo_operation(
+                operation_id, _plan_undo_interest(operation['operation_data'])) is True
+        return (await db.get_income_type_previews(date),
+                await db.get_income_rollup(date, group_by=('type',)),
+                await db.get_income_rollup(date, group_by=()))
+
+    previews, by_type, total = asyncio.run(scenario())
+    assert previews == {}
+    assert by_type == []
+    assert total == []
+
+
+def test_undo_fails_when_income_record_missing(temp_db, stats_snapshot):
+    """引用的收入明细已不存在时撤销失败，统计不被扣减，操作保持未撤销"""
+    db = temp_db
+    date = get_daily_period_date()
+
+    async def scenario():
+        delta = StatsDelta(date)
+        delta.add('interest', 80, 0, 'S01')
+        delta.add_liquid_capital(80)
+        await delta.apply()
+        operation_id = await db.record_operation(USER_ID, 'interest', {
+            'amount': 80, 'group_id': 'S01', 'date': date, 'income_record_id': 999,
+        }, CHAT_ID)
+        before = await stats_snapshot(date, 'S01')
+        operation = await db.get_operation_by_id(operation_id)
+        result = await db.undo_operation(operation_id, _plan_undo_interest(operation['operation_data']))
+        return result, before, await stats_snapshot(date, 'S01'), \
+            await db.get_operation_by_id(operation_id)
+
+    result, before, after, operation = asyncio.run(scenario())
+    assert result is False
+    assert after == before
+    assert operation['is_undone'] == 0
@@ -0,0 +1,75 @@
+"""更新并发处理测试 - 验证同一聊天、同一用户的更新按顺序执行"""
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+project_root = Path(__file__).parent.absolute()
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from telegram import Chat, Message, Update, User
+
+from utils.update_concurrency import ChatOrderedUpdateProcessor, update_lock_keys
+
+
+def _make_update(update_id: int, chat_id: int, user_id: int) -> Update:
+    chat_type = Chat.PRIVATE if chat_id == user_id else Chat.SUPERGROUP
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=chat_id, type=chat_type),
+        from_user=User(id=user_id, first_name='test', is_bot=False),
+        text='test',
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_private_update_takes_user_lock():
+    """私聊更新同时持有聊天锁和用户锁"""
+    assert update_lock_keys(_make_update(1, 5, 5)) == [('chat', 5), ('user', 5)]
+    assert update_lock_keys(_make_update(2, -100, 5)) == [('chat', -100), ('user', 5)]
+
+
+def _run_pair(first: Update, second: Update) -> list:
+    """先后提交两个更新，第一个更新阻塞到第二个被提交之后，返回执行事件顺序"""
+    events = []
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(max_concurrency=8)
+        await processor.initialize()
+        release = asyncio.Event()
+
+        async def slow():
+            events.append('first-start')
+            await release.wait()
+            events.append('first-end')
+
+        async def fast():
+            events.append('second')
+
+        first_task = asyncio.create_task(processor.do_process_update(first, slow()))
+        await asyncio.sleep(0)
+        second_task = asyncio.create_task(processor.do_process_update(second, fast()))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first_task, second_task)
+
+    asyncio.run(scenario())
+    return events
+
+
+def test_private_and_group_updates_of_one_user_are_serialized():
+    """同一用户的私聊更新和群组更新不会同时执行"""
+    events = _run_pair(_make_update(1, 5, 5), _make_update(2, -100, 5))
+    assert events == ['first-start', 'first-end', 'second']
+
+    events = _run_pair(_make_update(1, -100, 5), _make_update(2, 5, 5))
+    assert events == ['first-start', 'first-end', 'second']
+
+
+def test_different_users_in_different_chats_run_concurrently():
+    """不同聊天、不同用户的更新可以并行"""
+    events = _run_pair(_make_update(1, -100, 5), _make_update(2, -200, 6))
+    assert events == ['first-start', 'second', 'first-end']
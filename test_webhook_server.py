@@ -0,0 +1,137 @@
+"""Webhook 服务测试 - 用真实 TCP 连接验证请求解析、密钥校验和健康检查"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+project_root = Path(__file__).parent.absolute()
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from utils.webhook_server import WebhookServer
+
+SECRET = 'test-secret'
+UPDATE = json.dumps({'update_id': 1}).encode()
+
+
+async def _start_server():
+    application = SimpleNamespace(bot=None, running=True, update_queue=asyncio.Queue())
+    server = WebhookServer(application, SECRET, listen='127.0.0.1', port=0,
+                           path='/hook', health_path='/healthz', max_body_bytes=1024)
+    await server.start()
+    return server, application
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    """读取一个响应，返回 (状态码, 响应头, JSON 体)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    return status, headers, json.loads(body)
+
+
+def _post(body: bytes, secret: str = SECRET) -> bytes:
+    return (b'POST /hook HTTP/1.1\r\nHost: test\r\n'
+            b'X-Telegram-Bot-Api-Secret-Token: ' + secret.encode() + b'\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+
+
+def _post_chunked(chunks) -> bytes:
+    request = (b'POST /hook HTTP/1.1\r\nHost: test\r\n'
+               b'X-Telegram-Bot-Api-Secret-Token: ' + SECRET.encode() + b'\r\n'
+               b'Transfer-Encoding: chunked\r\n\r\n')
+    for chunk in chunks:
+        request += f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n'
+    return request + b'0\r\n\r\n'
+
+
+def _run(scenario):
+    async def main():
+        server, application = await _start_server()
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        try:
+            return await scenario(server, application, reader, writer)
+        finally:
+            writer.close()
+            await server.stop()
+    return asyncio.run(main())
+
+
+def test_content_length_update_is_queued():
+    """带 Content-Length 的更新进入 update_queue"""
+    async def scenario(server, application, reader, writer):
+        writer.write(_post(UPDATE))
+        status, _, payload = await _read_response(reader)
+        assert (status, payload) == (200, {'ok': True})
+        update = application.update_queue.get_nowait()
+        assert update.update_id == 1
+        assert server.updates_received == 1
+    _run(scenario)
+
+
+def test_chunked_update_is_queued_and_connection_stays_in_sync():
+    """chunked 请求体被完整读取，同一连接上的下一个请求仍能正确解析"""
+    async def scenario(server, application, reader, writer):
+        writer.write(_post_chunked([UPDATE[:5], UPDATE[5:]]))
+        status, headers, payload = await _read_response(reader)
+        assert (status, payload) == (200, {'ok': True})
+        assert headers['connection'] == 'keep-alive'
+
+        writer.write(b'GET /healthz HTTP/1.1\r\nHost: test\r\n\r\n')
+        status, _, payload = await _read_response(reader)
+        assert status == 200
+        assert payload['updates_received'] == 1
+        assert application.update_queue.qsize() == 1
+    _run(scenario)
+
+
+def test_unsupported_transfer_encoding_is_rejected_and_closed():
+    """不支持的 Transfer-Encoding 返回 501 并关闭连接"""
+    async def scenario(server, application, reader, writer):
+        writer.write(b'POST /hook HTTP/1.1\r\nHost: test\r\n'
+                     b'Transfer-Encoding: gzip\r\n\r\n')
+        status, headers, _ = await _read_response(reader)
+        assert status == 501
+        assert headers['connection'] == 'close'
+        assert await reader.read() == b''
+        assert application.update_queue.empty()
+    _run(scenario)
+
+
+def test_chunked_body_over_limit_is_rejected():
+    """chunked 请求体超过上限返回 413"""
+    async def scenario(server, application, reader, writer):
+        writer.write(_post_chunked([b'x' * 800, b'x' * 800]))
+        status, _, _ = await _read_response(reader)
+        assert status == 413
+        assert application.update_queue.empty()
+    _run(scenario)
+
+
+def test_wrong_secret_is_rejected():
+    """密钥不匹配返回 403，更新不入队"""
+    async def scenario(server, application, reader, writer):
+        writer.write(_post(UPDATE, secret='wrong'))
+        status, _, _ = await _read_response(reader)
+        assert status == 403
+        assert server.rejected == 1
+        assert application.update_queue.empty()
+    _run(scenario)
+
+
+def test_health_reports_stopped_application():
+    """应用未运行时健康检查返回 503"""
+    async def scenario(server, application, reader, writer):
+        application.running = False
+        writer.write(b'GET /healthz HTTP/1.1\r\nHost: test\r\n\r\n')
+        status, _, payload = await _read_response(reader)
+        assert status == 503
+        assert payload['ok'] is False
+    _run(scenario)
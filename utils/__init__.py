@@ -17,7 +17,7 @@ from .order_helpers import (
     update_order_state_from_title,
     try_create_order_from_title
 )
-from .stats_helpers import update_all_stats, update_liquid_capital
+from .stats_helpers import StatsDelta, update_all_stats, update_liquid_capital
 from .message_helpers import display_search_results_helper
 
 __all__ = [
@@ -30,6 +30,7 @@ __all__ = [
     'get_state_from_title',
     'update_order_state_from_title',
     'try_create_order_from_title',
+    'StatsDelta',
     'update_all_stats',
     'update_liquid_capital',
     'display_search_results_helper'
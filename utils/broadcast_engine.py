@@ -0,0 +1,260 @@
+"""群发引擎：限速、并发发送、失败重试
+
+Telegram 对机器人发消息有限制（全局约 30 条/秒，同一群组约 20 条/分钟），
+超出后返回 RetryAfter（flood control）。群发时：
+
+- 全局令牌桶控制总发送速率，收到 RetryAfter 时整个机器人暂停相应秒数
+- 同一群组两次发送之间至少间隔 BROADCAST_PER_CHAT_INTERVAL 秒（多个群发同时进行时生效）
+- 网络超时等临时错误按指数退避重试；无权限、群组不存在等永久错误不重试
+- 群组升级为超级群组（ChatMigrated）时改发到新的 chat_id
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# 同时发送的消息数
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+# 全局发送速率（条/秒），低于 Telegram 的 30 条/秒，给其他消息留余量
+BROADCAST_RATE_PER_SEC = float(os.getenv('BROADCAST_RATE_PER_SEC', '25'))
+# 同一群组两次发送的最小间隔（秒）
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '3'))
+# 临时错误（超时、网络错误）的最大重试次数
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+# 单条消息因 RetryAfter 等待的最大次数
+BROADCAST_MAX_FLOOD_WAITS = int(os.getenv('BROADCAST_MAX_FLOOD_WAITS', '5'))
+# 进度消息的刷新间隔（秒）
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '3'))
+
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """令牌桶限速器（等待者按先来先得获取令牌）"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        # 默认只允许 0.2 秒的突发，任意 1 秒内的发送数不会明显超过 rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate / 5)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def pause(self, seconds: float):
+        """暂停发放令牌（收到 RetryAfter 时调用）"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - max(self._updated, self._paused_until)) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PerChatLimiter:
+    """同一聊天两次发送之间保持最小间隔"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_allowed: Dict[Hashable, float] = {}
+
+    async def wait(self, chat_id: Hashable):
+        now = time.monotonic()
+        slot = max(now, self._next_allowed.get(chat_id, 0.0))
+        self._next_allowed[chat_id] = slot + self.interval
+        if len(self._next_allowed) > 1024:
+            self._next_allowed = {k: v for k, v in self._next_allowed.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# 同一个机器人的所有群发共用限速器
+_global_bucket = TokenBucket(BROADCAST_RATE_PER_SEC)
+_chat_limiter = PerChatLimiter(BROADCAST_PER_CHAT_INTERVAL)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        retry_after = retry_after.total_seconds()
+    return float(retry_after)
+
+
+class BroadcastReport:
+    """群发结果"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed: Dict[int, str] = {}
+        self.retries = 0
+        self.flood_waits = 0
+        self.migrated: Dict[int, int] = {}
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + len(self.failed)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class BroadcastEngine:
+    """并发群发同一条消息
+
+    Args:
+        bot: telegram.Bot
+        concurrency: 同时发送的消息数
+        on_result: 每个群组发送结束后回调 (chat_id, ok, error, migrated_to)，可用于持久化发送状态
+    """
+
+    def __init__(self, bot, concurrency: int = BROADCAST_CONCURRENCY,
+                 max_retries: int = BROADCAST_MAX_RETRIES,
+                 max_flood_waits: int = BROADCAST_MAX_FLOOD_WAITS,
+                 bucket: TokenBucket = _global_bucket,
+                 chat_limiter: PerChatLimiter = _chat_limiter,
+                 on_result: Optional[Callable[[int, bool, Optional[str], Optional[int]],
+                                              Awaitable[None]]] = None):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.max_flood_waits = max_flood_waits
+        self.bucket = bucket
+        self.chat_limiter = chat_limiter
+        self.on_result = on_result
+
+    async def send_all(self, chat_ids: Iterable[int], text: str,
+                       on_progress: Optional[Callable[[BroadcastReport], Awaitable[None]]] = None,
+                       progress_interval: float = BROADCAST_PROGRESS_INTERVAL) -> BroadcastReport:
+        """向所有群组发送消息，返回发送结果（重复的 chat_id 只发送一次）"""
+        targets = list(dict.fromkeys(chat_ids))
+        report = BroadcastReport(len(targets))
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in targets:
+            queue.put_nowait(chat_id)
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._deliver(chat_id, text, report)
+
+        progress_task = None
+        if on_progress is not None:
+            progress_task = asyncio.ensure_future(
+                self._report_progress(report, on_progress, progress_interval))
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(targets)))))
+        finally:
+            report.finished_at = time.monotonic()
+            if progress_task is not None:
+                progress_task.cancel()
+                try:
+                    await progress_task
+                except asyncio.CancelledError:
+                    pass
+                # 最后刷新一次，进度消息停在最终数字
+                try:
+                    await on_progress(report)
+                except Exception as e:
+                    logger.debug(f"更新群发进度失败: {e}")
+
+        logger.info(f"群发完成: 共 {report.total}，成功 {report.sent}，失败 {len(report.failed)}，"
+                    f"重试 {report.retries}，限流等待 {report.flood_waits}，耗时 {report.elapsed:.1f}s")
+        return report
+
+    async def _deliver(self, chat_id: int, text: str, report: BroadcastReport):
+        target = chat_id
+        attempts = 0
+        flood_waits = 0
+        error = None
+        while True:
+            await self.chat_limiter.wait(target)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=target, text=text)
+                error = None
+                break
+            except RetryAfter as e:
+                wait = _retry_after_seconds(e)
+                # flood control 对整个机器人生效，暂停所有发送
+                self.bucket.pause(wait)
+                report.flood_waits += 1
+                flood_waits += 1
+                error = f"RetryAfter {wait:.0f}s"
+                logger.warning(f"群发触发限流 {chat_id}，暂停 {wait:.0f}s")
+                if flood_waits > self.max_flood_waits:
+                    break
+            except ChatMigrated as e:
+                logger.info(f"群组 {chat_id} 已升级为超级群组 {e.new_chat_id}")
+                report.migrated[chat_id] = e.new_chat_id
+                error = f"ChatMigrated -> {e.new_chat_id}"
+                if target == e.new_chat_id:
+                    break
+                target = e.new_chat_id
+            except (Forbidden, BadRequest) as e:
+                # 机器人被移出群组、群组不存在等，重试无意义
+                error = f"{type(e).__name__}: {e.message}"
+                break
+            except NetworkError as e:
+                # 包括 TimedOut
+                attempts += 1
+                error = f"{type(e).__name__}: {e.message}"
+                if attempts > self.max_retries:
+                    break
+                report.retries += 1
+                delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** (attempts - 1))
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.error(f"群发失败 {chat_id}: {e}", exc_info=True)
+                break
+
+        if error is None:
+            report.sent += 1
+        else:
+            report.failed[chat_id] = error
+            logger.warning(f"群发失败 {chat_id}: {error}")
+        if self.on_result is not None:
+            await self.on_result(chat_id, error is None, error,
+                                 target if target != chat_id else None)
+
+    @staticmethod
+    async def _report_progress(report: BroadcastReport,
+                               on_progress: Callable[[BroadcastReport], Awaitable[None]],
+                               interval: float):
+        last_done = -1
+        while True:
+            await asyncio.sleep(interval)
+            if report.done == last_done:
+                continue
+            last_done = report.done
+            try:
+                await on_progress(report)
+            except Exception as e:
+                logger.debug(f"更新群发进度失败: {e}")
+
@@ -0,0 +1,175 @@
+"""群发任务队列
+
+群发任务和每个群组的发送状态保存在数据库中（broadcast_jobs / broadcast_recipients），
+由后台任务按提交顺序逐个执行，管理员提交后不需要等待发送完成。
+每个群组发送结束后立即记录结果；机器人重启后继续发送未完成任务中尚未发送的群组
+（重启时正在发送的少量消息可能会重复发送一次）。
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence
+import db_operations
+from utils.broadcast_engine import BroadcastEngine, BroadcastReport
+
+logger = logging.getLogger(__name__)
+
+# 没有任务时的轮询间隔（秒），提交新任务时会立即唤醒
+_IDLE_POLL_SECONDS = 60
+# 数据库出错后的重试间隔（秒）
+_ERROR_RETRY_SECONDS = 30
+
+_STATUS_LABELS = {
+    'pending': '⏳ 排队中',
+    'running': '📤 发送中',
+    'done': '✅ 已完成',
+}
+
+# 后台任务
+_worker_task: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+
+
+async def enqueue_broadcast(chat_ids: Sequence[int], message: str,
+                            created_by: Optional[int] = None,
+                            notify_chat_id: Optional[int] = None,
+                            progress_message_id: Optional[int] = None) -> Optional[int]:
+    """保存群发任务并唤醒后台任务，返回任务ID（保存失败返回 None）
+
+    Args:
+        notify_chat_id: 完成后接收结果报告的聊天
+        progress_message_id: notify_chat_id 中用于显示进度的消息
+    """
+    job_id = await db_operations.create_broadcast_job(
+        message, list(chat_ids), created_by=created_by,
+        notify_chat_id=notify_chat_id, progress_message_id=progress_message_id)
+    if not job_id:
+        return None
+    logger.info(f"群发任务 #{job_id} 已提交: {len(chat_ids)} 个群组")
+    if _wakeup is not None:
+        _wakeup.set()
+    return job_id
+
+
+async def start_broadcast_worker(bot):
+    """启动后台群发任务（启动时继续未完成的任务）"""
+    global _worker_task, _wakeup
+    if _worker_task is not None and not _worker_task.done():
+        return
+    _wakeup = asyncio.Event()
+    _worker_task = asyncio.ensure_future(_run_worker(bot))
+    logger.info("群发任务队列已启动")
+
+
+async def stop_broadcast_worker():
+    """停止后台群发任务（未发送的群组留在数据库中，下次启动继续）"""
+    global _worker_task
+    if _worker_task is None:
+        return
+    _worker_task.cancel()
+    try:
+        await _worker_task
+    except asyncio.CancelledError:
+        pass
+    _worker_task = None
+    logger.info("群发任务队列已停止")
+
+
+async def _run_worker(bot):
+    while True:
+        try:
+            job = await db_operations.claim_next_broadcast_job()
+        except Exception as e:
+            logger.error(f"读取群发任务失败: {e}", exc_info=True)
+            job = False
+        if job:
+            try:
+                await _run_job(bot, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"执行群发任务 #{job['id']} 出错: {e}", exc_info=True)
+                await asyncio.sleep(_ERROR_RETRY_SECONDS)
+            continue
+
+        # 没有任务（或数据库出错）时等待唤醒
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(
+                _wakeup.wait(), _IDLE_POLL_SECONDS if job is None else _ERROR_RETRY_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run_job(bot, job: Dict):
+    job_id = job['id']
+    chat_ids = await db_operations.get_pending_broadcast_recipients(job_id)
+    if chat_ids:
+        resumed = job['sent'] + job['failed']
+        if resumed:
+            logger.info(f"继续群发任务 #{job_id}: 已处理 {resumed}，剩余 {len(chat_ids)}")
+
+        async def persist_result(chat_id: int, ok: bool, error: Optional[str],
+                                 migrated_to: Optional[int]):
+            result = await db_operations.record_broadcast_result(
+                job_id, chat_id, ok, error, migrated_to)
+            if result is False:
+                logger.warning(f"群发任务 #{job_id} 未能记录 {chat_id} 的发送结果")
+
+        async def show_progress(report: BroadcastReport):
+            await bot.edit_message_text(
+                chat_id=job['notify_chat_id'], message_id=job['progress_message_id'],
+                text=_format_progress(job, report))
+
+        on_progress = show_progress if job['notify_chat_id'] and job['progress_message_id'] else None
+        engine = BroadcastEngine(bot, on_result=persist_result)
+        await engine.send_all(chat_ids, job['message'], on_progress=on_progress)
+
+    if not await db_operations.finish_broadcast_job(job_id):
+        # 仍有未记录结果的群组（如数据库写入失败），稍后重试
+        raise RuntimeError(f"群发任务 #{job_id} 仍有未完成的群组")
+
+    finished = await db_operations.get_broadcast_job(job_id)
+    logger.info(f"群发任务 #{job_id} 完成: 成功 {finished['sent']}，失败 {finished['failed']}")
+    if finished['notify_chat_id']:
+        failures = await db_operations.get_failed_broadcast_recipients(job_id)
+        try:
+            await bot.send_message(chat_id=finished['notify_chat_id'],
+                                   text=format_broadcast_job(finished, failures))
+        except Exception as e:
+            logger.warning(f"发送群发任务 #{job_id} 结果失败: {e}")
+
+
+def _format_progress(job: Dict, report: BroadcastReport) -> str:
+    done = job['sent'] + job['failed'] + report.done
+    return (
+        f"⏳ Broadcast #{job['id']}... {done}/{job['total']}\n"
+        f"Success: {job['sent'] + report.sent}\n"
+        f"Failed: {job['failed'] + len(report.failed)}"
+    )
+
+
+def format_broadcast_job(job: Dict, failures: Optional[List[Dict]] = None,
+                         max_length: int = 4000) -> str:
+    """格式化群发任务状态（传入 failures 时列出失败的群组及原因，超长时截断）"""
+    lines = [
+        f"📢 群发任务 #{job['id']} {_STATUS_LABELS.get(job['status'], job['status'])}",
+        f"进度: {job['sent'] + job['failed']}/{job['total']}"
+        f"（成功 {job['sent']}，失败 {job['failed']}）",
+        f"创建: {job['created_at']}",
+    ]
+    if job['finished_at']:
+        lines.append(f"完成: {job['finished_at']}")
+    preview = job['message'].replace('\n', ' ')
+    lines.append(f"内容: {preview[:60]}{'...' if len(preview) > 60 else ''}")
+    if failures:
+        lines.append("")
+        lines.append("失败群组:")
+        length = sum(len(line) + 1 for line in lines)
+        for i, failure in enumerate(failures):
+            line = f"{failure['chat_id']}: {failure['error']}"
+            if length + len(line) + 1 > max_length - 40:
+                lines.append(f"... 另有 {len(failures) - i} 个")
+                break
+            lines.append(line)
+            length += len(line) + 1
+    return "\n".join(lines)
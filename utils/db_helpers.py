@@ -1,7 +1,10 @@
 """数据库相关工具函数"""
 import os
+import re
+import ast
 import sqlite3
 import logging
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -61,3 +64,176 @@ def is_database_empty(db_path: str) -> bool:
         logger.debug(f"检查数据库状态时出错: {e}")
         return False
 
+
+# 数据量很小的配置表/汇总表，全表扫描可以接受，不计入告警
+SMALL_TABLES = {
+    'financial_data', 'grouped_data', 'authorized_users',
+    'user_group_mapping', 'payment_accounts', 'scheduled_broadcasts'
+}
+
+_SQL_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+# CTE 和 FROM 子查询在计划中显示为 CO-ROUTINE / MATERIALIZE，扫描它们不是全表扫描
+_DERIVED_PATTERN = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+_ALIAS_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+_SQL_KEYWORDS = {'WHERE', 'ON', 'USING', 'LEFT', 'INNER', 'CROSS', 'JOIN', 'GROUP',
+                 'ORDER', 'LIMIT', 'SET', 'WHEN', 'UNION', 'AS'}
+
+
+def _render_fstring(node: ast.JoinedStr, namespace: Dict) -> Optional[str]:
+    """用模块命名空间和示例值渲染 f-string SQL，无法求值时返回 None"""
+    parts = []
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            parts.append(str(value.value))
+            continue
+        if value.conversion != -1 or value.format_spec is not None:
+            return None
+        try:
+            code = compile(ast.Expression(value.value), '<sql>', 'eval')
+            parts.append(str(eval(code, dict(namespace))))
+        except Exception:
+            return None
+    return ''.join(parts)
+
+
+def collect_sql_statements(source_path: str, namespace: Optional[Dict] = None,
+                           samples: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    从源码中收集 cursor.execute / executemany 使用的SQL语句
+
+    f-string 拼接的SQL用 namespace（模块全局变量）和 samples（局部变量的示例值，
+    如 where_clause）渲染后参与检查；仍无法渲染的列入未检查列表。
+
+    Args:
+        source_path: Python源文件路径（如 db_operations.py）
+        namespace: 渲染 f-string 时可用的全局变量
+        samples: 渲染 f-string 时局部变量的示例值
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: ([{'function', 'line', 'sql', 'rendered'}],
+                                        [{'function', 'line', 'sql'} 未检查的动态SQL])
+    """
+    with open(source_path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    tree = ast.parse(source)
+    render_namespace = {**(namespace or {}), **(samples or {})}
+
+    statements = []
+    unaudited = []
+    # 只遍历顶层函数，避免嵌套函数被重复统计
+    for func in tree.body:
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ('execute', 'executemany')
+                    and node.args):
+                continue
+            sql_node = node.args[0]
+            if isinstance(sql_node, ast.Constant) and isinstance(sql_node.value, str):
+                sql = ' '.join(sql_node.value.split())
+                if sql.upper().startswith(_SQL_PREFIXES):
+                    statements.append({
+                        'function': func.name,
+                        'line': node.lineno,
+                        'sql': sql,
+                        'rendered': False
+                    })
+            elif isinstance(sql_node, ast.JoinedStr):
+                template = ' '.join((ast.get_source_segment(source, sql_node) or '').split())
+                first = sql_node.values[0] if sql_node.values else None
+                head = first.value if isinstance(first, ast.Constant) else ''
+                if not ' '.join(head.split()).upper().startswith(_SQL_PREFIXES):
+                    # PRAGMA 等非查询语句
+                    continue
+                sql = _render_fstring(sql_node, render_namespace)
+                if sql is None:
+                    unaudited.append({'function': func.name, 'line': node.lineno,
+                                      'sql': template})
+                    continue
+                statements.append({
+                    'function': func.name,
+                    'line': node.lineno,
+                    'sql': ' '.join(sql.split()),
+                    'rendered': True
+                })
+            else:
+                # 变量或函数调用生成的SQL
+                unaudited.append({'function': func.name, 'line': node.lineno,
+                                  'sql': ' '.join((ast.get_source_segment(source, sql_node) or '').split())})
+    return statements, unaudited
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """从 FROM/JOIN 子句中提取 别名 -> 表名"""
+    aliases = {}
+    for table, alias in _ALIAS_PATTERN.findall(sql):
+        if alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def audit_query_plans(db_path: str, source_path: str, namespace: Optional[Dict] = None,
+                      samples: Optional[Dict] = None) -> Dict:
+    """
+    对源码中的每条SQL执行 EXPLAIN QUERY PLAN，找出全表扫描
+
+    Args:
+        db_path: 数据库文件路径
+        source_path: 要检查的Python源文件路径
+        namespace: 渲染 f-string SQL 时可用的全局变量（通常是 vars(模块)）
+        samples: 渲染 f-string SQL 时局部变量的示例值
+
+    Returns:
+        Dict: {'checked': 检查的语句数, 'rendered': 其中由 f-string 渲染的语句数,
+               'unaudited': 无法渲染的动态语句, 'errors': 无法分析的语句,
+               'full_scans': 全表扫描列表}
+    """
+    statements, unaudited = collect_sql_statements(source_path, namespace, samples)
+    result = {
+        'checked': 0,
+        'rendered': 0,
+        'unaudited': unaudited,
+        'errors': [],
+        'full_scans': []
+    }
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        for stmt in statements:
+            sql = stmt['sql']
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}",
+                               [None] * sql.count('?'))
+                plan = cursor.fetchall()
+            except sqlite3.Error as e:
+                result['errors'].append({**stmt, 'error': str(e)})
+                continue
+
+            result['checked'] += 1
+            if stmt['rendered']:
+                result['rendered'] += 1
+            derived = set()
+            for row in plan:
+                match = _DERIVED_PATTERN.match(row[-1])
+                if match:
+                    derived.add(match.group(1))
+            aliases = _table_aliases(sql)
+            for row in plan:
+                detail = row[-1]
+                match = _SCAN_PATTERN.match(detail)
+                # "SCAN x USING INDEX" 是索引扫描，不算全表扫描
+                if not match or 'USING' in match.group(2):
+                    continue
+                table = aliases.get(match.group(1), match.group(1))
+                if table in derived or table in SMALL_TABLES:
+                    continue
+                result['full_scans'].append(
+                    {**stmt, 'table': table, 'detail': detail})
+    finally:
+        conn.close()
+
+    return result
@@ -219,21 +219,21 @@ async def export_orders_to_excel(orders: List[Dict], completed_orders: List[Dict
     import asyncio
     import tempfile
     
-    # 为每个订单获取利息记录
+    # 一次性获取所有订单的利息记录
+    try:
+        interests_by_order = await db_operations.get_interests_by_order_ids(
+            [order.get('order_id') for order in orders])
+    except Exception as e:
+        logger.error(f"批量获取订单利息记录失败: {e}")
+        interests_by_order = {}
+
     orders_with_interests = []
     for order in orders:
         order_id = order.get('order_id')
         if order_id:
-            try:
-                interests = await db_operations.get_all_interest_by_order_id(order_id)
-                order_copy = order.copy()
-                order_copy['interests'] = interests
-                orders_with_interests.append(order_copy)
-            except Exception as e:
-                logger.error(f"获取订单 {order_id} 的利息记录失败: {e}")
-                order_copy = order.copy()
-                order_copy['interests'] = []
-                orders_with_interests.append(order_copy)
+            order_copy = dict(order)
+            order_copy['interests'] = interests_by_order.get(order_id, [])
+            orders_with_interests.append(order_copy)
         else:
             orders_with_interests.append(order)
     
@@ -6,9 +6,9 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import db_operations
 from constants import HISTORICAL_THRESHOLD_DATE, WEEKDAY_GROUP
-from utils.stats_helpers import update_all_stats, update_liquid_capital
+from utils.stats_helpers import StatsDelta
+from utils.order_state_machine import transition_order
 from utils.chat_helpers import is_group_chat, get_current_group, get_weekday_group_from_date, reply_in_group
-from utils.date_helpers import get_daily_period_date
 from utils.message_builders import build_order_creation_message
 
 logger = logging.getLogger(__name__)
@@ -131,9 +131,6 @@ async def update_order_state_from_title(update: Update, context: ContextTypes.DE
     if current_state == target_state:
         return
 
-    chat_id = order['chat_id']
-    group_id = order['group_id']
-    amount = order['amount']
     order_id = order['order_id']
 
     try:
@@ -172,105 +169,27 @@ async def update_order_state_from_title(update: Update, context: ContextTypes.DE
             logger.info(f"订单 {order_id} 禁止通过群名自动变更为 breach_end（只能通过命令手动完成）")
             return
 
-        # 更新数据库状态
-        if await db_operations.update_order_state(chat_id, target_state):
-
-            # 处理统计数据迁移
-            if is_current_valid and is_target_breach:
-                # Valid -> Breach
-                await update_all_stats('valid', -amount, -1, group_id)
-                await update_all_stats('breach', amount, 1, group_id)
-                await reply_in_group(update, f"🔄 State Changed: {target_state} (Auto)\nStats moved to Breach.")
-
-            elif is_current_valid and is_target_end:
-                # Valid -> End (完成订单)
-                # 先记录收入明细（源数据），再更新统计数据，确保数据一致性
-                from utils.date_helpers import get_daily_period_date
-                user_id = update.effective_user.id if update.effective_user else 0
-                date = get_daily_period_date()
-                
-                try:
-                    # 1. 先记录收入明细（如果失败，不更新统计数据）
-                    await db_operations.record_income(
-                        date=date,
-                        type='completed',
-                        amount=amount,
-                        group_id=group_id,
-                        order_id=order_id,
-                        order_date=order['date'],
-                        customer=order['customer'],
-                        weekday_group=order['weekday_group'],
-                        note="订单完成（自动）",
-                        created_by=user_id
-                    )
-                except Exception as e:
-                    logger.error(f"记录订单完成收入明细失败（自动完成）: {e}", exc_info=True)
-                    await reply_in_group(update, f"❌ 记录收入明细失败，订单状态已更新但未记录收入。错误: {str(e)}")
-                    return
-                
-                # 2. 收入明细记录成功后，再更新统计数据
-                try:
-                    await update_all_stats('valid', -amount, -1, group_id)
-                    await update_all_stats('completed', amount, 1, group_id)
-                    # 完成订单需要增加流动资金
-                    from utils.stats_helpers import update_liquid_capital
-                    await update_liquid_capital(amount)
-                    await reply_in_group(update, f"✅ Order Completed: {target_state} (Auto)\nStats moved to Completed.")
-                except Exception as e:
-                    logger.error(f"更新订单完成统计数据失败（自动完成）: {e}", exc_info=True)
-                    # 统计数据更新失败，但收入明细已记录，需要手动修复或重新计算
-                    await reply_in_group(update, f"❌ 更新统计失败，但收入明细已记录。请使用 /fix_statistics 修复统计数据。错误: {str(e)}")
-                    return
-
-            else:
-                # Normal <-> Overdue (都在 Valid 池中，仅状态变更)
-                await reply_in_group(update, f"🔄 State Changed: {target_state} (Auto)")
-
-            # 记录操作历史（用于撤销）
-            # 获取触发操作的用户ID（修改群名的员工）
-            # 如果获取不到，使用 0 表示系统自动操作
-            user_id = update.effective_user.id if update.effective_user else 0
-
-            try:
-                # 根据状态变更类型确定操作类型
-                operation_type = None
-                operation_data = {
-                    'chat_id': chat_id,
-                    'order_id': order_id,
-                    'old_state': current_state,
-                    'new_state': target_state,
-                    'group_id': group_id,
-                    'amount': amount,
-                    'trigger': 'auto_from_title'  # 标记为自动触发
-                }
-
-                if target_state == 'end':
-                    # 完成订单
-                    operation_type = 'order_completed'
-                    operation_data['date'] = get_daily_period_date()
-                elif target_state == 'breach_end':
-                    # 违约完成（虽然正常情况下不应该通过群名触发，但保留逻辑）
-                    operation_type = 'order_breach_end'
-                    operation_data['date'] = get_daily_period_date()
-                    operation_data['amount'] = amount  # 违约完成金额
-                else:
-                    # 普通状态变更（normal/overdue/breach）
-                    operation_type = 'order_state_change'
-
-                # 记录操作历史
-                await db_operations.record_operation(
-                    user_id=user_id,
-                    operation_type=operation_type,
-                    operation_data=operation_data,
-                    chat_id=chat_id
-                )
+        # 订单状态、收入明细、统计数据和操作历史（用于撤销）在一个事务中写入
+        # 操作历史记录修改群名的员工，获取不到时使用 0 表示系统自动操作
+        user_id = update.effective_user.id if update.effective_user else 0
+        result = await transition_order(
+            order, target_state, user_id=user_id,
+            note="订单完成（自动）" if is_target_end else None,
+            trigger='auto_from_title')
+        if result is None:
+            logger.info(f"订单 {order_id} 状态已被其他操作修改，跳过自动变更 {current_state} -> {target_state}")
+            return
 
-                logger.info(
-                    f"已记录自动状态变更操作历史: order_id={order_id}, {current_state} -> {target_state}, user_id={user_id}")
+        if is_current_valid and is_target_breach:
+            await reply_in_group(update, f"🔄 State Changed: {target_state} (Auto)\nStats moved to Breach.")
+        elif is_current_valid and is_target_end:
+            await reply_in_group(update, f"✅ Order Completed: {target_state} (Auto)\nStats moved to Completed.")
+        else:
+            # Normal <-> Overdue (都在 Valid 池中，仅状态变更)
+            await reply_in_group(update, f"🔄 State Changed: {target_state} (Auto)")
 
-            except Exception as e:
-                # 记录操作历史失败不影响主流程，只记录日志
-                logger.error(f"记录自动状态变更操作历史失败: {e}", exc_info=True)
+        logger.info(
+            f"已记录自动状态变更操作历史: order_id={order_id}, {current_state} -> {target_state}, user_id={user_id}")
 
     except Exception as e:
         logger.error(f"Auto update state failed: {e}", exc_info=True)
@@ -365,37 +284,67 @@ async def try_create_order_from_title(update: Update, context: ContextTypes.DEFA
         'state': initial_state
     }
 
-    # 6. 创建订单
-    if not await db_operations.create_order(new_order):
-        if manual_trigger:
-            await update.message.reply_text("❌ Failed to create order. Order ID might duplicate.")
-        return
-
-    # 7. 更新统计
+    # 6. 计算统计变动
     # 根据初始状态决定计入 Valid 还是 Breach
     is_initial_breach = (initial_state == 'breach')
 
-    # 更新订单统计
+    delta = StatsDelta()
     # 历史违约订单：只更新全局和分组统计，不更新日结统计
     if is_initial_breach:
-        if is_historical:
-            # 历史违约订单：跳过日结更新
-            await update_all_stats('breach', amount, 1, group_id, skip_daily=True)
-        else:
-            # 非历史违约订单：正常更新（包括日结）
-            await update_all_stats('breach', amount, 1, group_id)
+        # 历史违约订单跳过日结更新，非历史违约订单正常更新（包括日结）
+        delta.add('breach', amount, 1, group_id, skip_daily=is_historical)
     else:
-        await update_all_stats('valid', amount, 1, group_id)
+        delta.add('valid', amount, 1, group_id)
 
     # 非历史订单才扣款和更新客户统计
     if not is_historical:
         # 扣除流动资金
-        await update_liquid_capital(-amount)
+        delta.add_liquid_capital(-amount)
 
         # 客户统计
         client_field = 'new_clients' if customer == 'A' else 'old_clients'
-        await update_all_stats(client_field, amount, 1, group_id)
+        delta.add(client_field, amount, 1, group_id)
 
+    # 操作历史（用于撤销）
+    user_id = update.effective_user.id if update.effective_user else None
+    operation = None
+    if user_id:
+        operation = {
+            'user_id': user_id,
+            'operation_type': 'order_created',
+            'operation_data': {
+                'order_id': order_id,
+                'chat_id': chat_id,
+                'group_id': group_id,
+                'amount': amount,
+                'customer': customer,
+                'initial_state': initial_state,
+                'is_historical': is_historical,
+                'date': created_at
+            },
+            'chat_id': chat_id,
+        }
+
+    # 7. 创建订单（订单、统计和操作历史在一个事务中写入）
+    result = await db_operations.create_order_with_stats(
+        new_order, delta.global_deltas, delta.daily_deltas, delta.grouped_deltas,
+        operation=operation)
+    if result is None:
+        if manual_trigger:
+            await update.message.reply_text("❌ Failed to create order. Order ID might duplicate.")
+        return
+    if result is False:
+        logger.error(f"Failed to create order {order_id}, transaction rolled back")
+        if manual_trigger or is_group_chat(update):
+            await update.message.reply_text("❌ Failed to create order. Nothing was saved, please try again.")
+        return
+
+    if user_id and context:
+        # 重置撤销计数
+        from handlers.undo_handlers import reset_undo_count
+        reset_undo_count(context, user_id)
+
+    if not is_historical:
         # 自动播报下一期还款（基于订单日期计算下个周期）
         await send_auto_broadcast(update, context, chat_id, amount, created_at)
     else:
@@ -415,29 +364,6 @@ async def try_create_order_from_title(update: Update, context: ContextTypes.DEFA
     )
     await update.message.reply_text(msg)
 
-    # 记录操作历史（用于撤销）
-    user_id = update.effective_user.id if update.effective_user else None
-    if user_id:
-        from handlers.undo_handlers import reset_undo_count
-        await db_operations.record_operation(
-            user_id=user_id,
-            operation_type='order_created',
-            operation_data={
-                'order_id': order_id,
-                'chat_id': chat_id,
-                'group_id': group_id,
-                'amount': amount,
-                'customer': customer,
-                'initial_state': initial_state,
-                'is_historical': is_historical,
-                'date': created_at
-            },
-            chat_id=chat_id
-        )
-        # 重置撤销计数
-        if context:
-            reset_undo_count(context, user_id)
-
 
 async def send_auto_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, amount: float, order_date: str = None):
     """订单创建后自动播报下一期还款"""
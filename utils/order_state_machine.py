@@ -0,0 +1,151 @@
+"""订单状态机
+
+集中定义订单的合法状态变更，以及每种变更对应的统计迁移、收入明细和撤销记录。
+每次变更通过 db_operations.apply_order_transition 在一个事务中写入
+（订单状态、收入明细、全局/日结/分组统计、操作历史），不会出现
+状态已改而收入或统计未更新的中间状态。
+"""
+import logging
+from typing import Dict, Optional
+import db_operations
+from utils.stats_helpers import StatsDelta
+from utils.date_helpers import get_daily_period_date
+
+logger = logging.getLogger(__name__)
+
+# 合法状态变更 -> 操作历史类型（撤销时按类型回滚）
+# Normal <-> Overdue: 仅状态变更（都在 Valid 统计下）
+# Normal/Overdue -> Breach: 移动统计 (Valid -> Breach)
+# Normal/Overdue -> End: 移动统计 (Valid -> Completed)，记录完成收入，增加流动资金
+# Breach -> Breach_End: 增加违约完成统计，记录违约完成收入，增加流动资金
+TRANSITIONS = {
+    ('normal', 'overdue'): 'order_state_change',
+    ('overdue', 'normal'): 'order_state_change',
+    ('normal', 'breach'): 'order_state_change',
+    ('overdue', 'breach'): 'order_state_change',
+    ('normal', 'end'): 'order_completed',
+    ('overdue', 'end'): 'order_completed',
+    ('breach', 'breach_end'): 'order_breach_end',
+}
+
+# 需要记录收入明细的目标状态 -> (收入类型, 默认备注)
+_INCOME_STATES = {
+    'end': ('completed', "订单完成"),
+    'breach_end': ('breach_end', "违约完成"),
+}
+
+
+def is_legal_transition(old_state: str, new_state: str) -> bool:
+    """判断状态变更是否合法"""
+    return (old_state, new_state) in TRANSITIONS
+
+
+def _build_stats_delta(old_state: str, new_state: str, order_amount: float,
+                       amount: float, group_id: str, date: str) -> StatsDelta:
+    """按状态变更生成统计增量"""
+    delta = StatsDelta(date)
+    if new_state == 'breach':
+        delta.add('valid', -order_amount, -1, group_id)
+        delta.add('breach', order_amount, 1, group_id)
+    elif new_state == 'end':
+        delta.add('valid', -order_amount, -1, group_id)
+        delta.add('completed', amount, 1, group_id)
+        delta.add_liquid_capital(amount)
+    elif new_state == 'breach_end':
+        delta.add('breach_end', amount, 1, group_id)
+        delta.add_liquid_capital(amount)
+    return delta
+
+
+async def transition_order(order, new_state: str, user_id: Optional[int] = None,
+                           amount: Optional[float] = None, note: Optional[str] = None,
+                           trigger: Optional[str] = None) -> Optional[Dict]:
+    """执行订单状态变更（一个事务）
+
+    Args:
+        order: 当前订单（以其 state 作为变更前状态，数据库中状态不一致时不做修改）
+        new_state: 目标状态
+        user_id: 操作人，为 None 时不记录操作历史（自动操作传 0）
+        amount: 违约完成金额；其他变更使用订单金额
+        note: 收入明细备注，默认按目标状态生成
+        trigger: 触发来源（如 'auto_from_title'），写入操作历史
+
+    Returns:
+        {'old_state', 'new_state', 'amount', 'date', 'income_id', 'operation_id'}；
+        订单状态已被其他操作修改时返回 None
+
+    Raises:
+        ValueError: 非法的状态变更
+        RuntimeError: 数据库写入失败（事务已回滚，不会部分写入）
+    """
+    old_state = order['state']
+    operation_type = TRANSITIONS.get((old_state, new_state))
+    if operation_type is None:
+        raise ValueError(f"非法的订单状态变更: {old_state} -> {new_state}")
+
+    chat_id = order['chat_id']
+    group_id = order['group_id']
+    order_amount = order['amount']
+    if amount is None:
+        amount = order_amount
+
+    # 统一获取日期，确保统计更新、收入记录和操作历史使用相同的日期
+    date = get_daily_period_date()
+    delta = _build_stats_delta(old_state, new_state, order_amount, amount, group_id, date)
+
+    income = None
+    if new_state in _INCOME_STATES:
+        income_type, default_note = _INCOME_STATES[new_state]
+        income = {
+            'date': date,
+            'type': income_type,
+            'amount': amount,
+            'group_id': group_id,
+            'order_id': order['order_id'],
+            'order_date': order['date'],
+            'customer': order['customer'],
+            'weekday_group': order['weekday_group'],
+            'note': note or default_note,
+            'created_by': user_id,
+        }
+
+    operation = None
+    if user_id is not None:
+        operation_data = {
+            'chat_id': chat_id,
+            'order_id': order['order_id'],
+            'old_state': old_state,
+            'new_state': new_state,
+            'group_id': group_id,
+            'amount': amount,
+        }
+        if income:
+            operation_data['date'] = date
+        if trigger:
+            operation_data['trigger'] = trigger
+        operation = {
+            'user_id': user_id,
+            'operation_type': operation_type,
+            'operation_data': operation_data,
+            'chat_id': chat_id,
+        }
+
+    result = await db_operations.apply_order_transition(
+        chat_id, old_state, new_state,
+        delta.global_deltas, delta.daily_deltas, delta.grouped_deltas,
+        income=income, operation=operation)
+    if result is False:
+        raise RuntimeError("订单状态变更失败，事务已回滚")
+    if result is None:
+        logger.info(f"订单 {order['order_id']} 状态已被修改，跳过变更 {old_state} -> {new_state}")
+        return None
+
+    logger.info(f"订单 {order['order_id']} 状态变更: {old_state} -> {new_state}, amount={amount}")
+    return {
+        'old_state': old_state,
+        'new_state': new_state,
+        'amount': amount,
+        'date': date,
+        'income_id': result['income_id'],
+        'operation_id': result['operation_id'],
+    }
@@ -38,13 +38,12 @@ async def generate_order_table(orders: List[Dict], daily_interest: float = 0) ->
     table += f"{'时间':<12}  {'订单号':<15}  {'金额':>12}  {'状态':<6}\n"
     table += "─────────────────────────────────────────\n"
     
+    # 一次性获取所有订单的利息记录
+    interests_by_order = await db_operations.get_interests_by_order_ids(
+        [order.get('order_id') for order in orders])
+
     for order in orders:
-        order_id = order.get('order_id')
-        # 获取该订单的所有利息记录
-        if order_id:
-            interests = await db_operations.get_all_interest_by_order_id(order_id)
-        else:
-            interests = []
+        interests = interests_by_order.get(order.get('order_id'), [])
         row = await format_order_table_row(order, interests)
         table += row + "\n"
     
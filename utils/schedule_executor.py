@@ -40,8 +40,10 @@ async def setup_scheduled_broadcasts(bot):
         scheduler = AsyncIOScheduler()
         scheduler.start()
     
-    # 清除所有现有任务
-    scheduler.remove_all_jobs()
+    # 清除现有的播报任务（日切报表、夜间核对等其他任务保留）
+    for job in scheduler.get_jobs():
+        if job.id.startswith('broadcast_'):
+            job.remove()
     
     # 获取所有激活的定时播报
     broadcasts = await db_operations.get_active_scheduled_broadcasts()
@@ -139,3 +141,50 @@ async def setup_daily_report(bot):
     except Exception as e:
         logger.error(f"设置日切报表任务失败: {e}", exc_info=True)
 
+
+async def run_nightly_mismatch_check(bot):
+    """夜间核对：只核对上次检查后有变动的日期，发现不一致时通知管理员"""
+    try:
+        from config import ADMIN_IDS
+        from handlers.command_handlers import format_consistency_report
+
+        result = await db_operations.check_stats_consistency()
+        if result is False:
+            logger.error("夜间数据核对失败：数据库错误")
+            return
+
+        logger.info(
+            f"夜间数据核对完成: 核对 {result['checked_dates']} 天, "
+            f"不一致 {len(result['mismatches'])} 天, 清除 {result['cleared']} 天")
+        if not result['mismatches']:
+            return
+
+        report = format_consistency_report(result)
+        for admin_id in ADMIN_IDS:
+            try:
+                await bot.send_message(chat_id=admin_id, text=report[:4096])
+            except Exception as e:
+                logger.error(f"发送夜间核对报告给管理员 {admin_id} 失败: {e}", exc_info=True)
+    except Exception as e:
+        logger.error(f"夜间数据核对失败: {e}", exc_info=True)
+
+
+async def setup_nightly_mismatch_check(bot):
+    """设置夜间数据核对任务（每天03:30执行）"""
+    global scheduler
+
+    if scheduler is None:
+        scheduler = AsyncIOScheduler()
+        scheduler.start()
+
+    try:
+        scheduler.add_job(
+            run_nightly_mismatch_check,
+            trigger=CronTrigger(hour=3, minute=30, timezone=BEIJING_TZ),
+            args=[bot],
+            id="nightly_mismatch_check",
+            replace_existing=True
+        )
+        logger.info("已设置夜间数据核对任务: 每天 03:30 执行")
+    except Exception as e:
+        logger.error(f"设置夜间数据核对任务失败: {e}", exc_info=True)
@@ -0,0 +1,179 @@
+"""更新并发处理：不同群组并行，同一群组/同一用户严格按顺序
+
+PTB 默认逐条处理更新，一个慢的导出或报表会让所有群组的消息排队。
+ChatOrderedUpdateProcessor 让更新并发处理，但同一聊天（订单群）的更新、
+同一用户的多步对话（context.user_data 中的状态）仍按到达顺序逐条执行。
+
+更新先按到达顺序排进聊天锁和用户锁的等待队列，拿到锁之后才占用执行名额，
+等待同一群组的更新不会占满执行名额而拖慢其他群组。
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Hashable, List, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# 同时执行的更新数上限
+UPDATE_MAX_CONCURRENCY = int(os.getenv('UPDATE_MAX_CONCURRENCY', '32'))
+# 已接收但未处理完的更新数上限（超出后 PTB 暂停分发，可能打乱同一聊天的顺序，应远大于执行上限）
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '4096'))
+# 等锁超过该时间（毫秒）记录警告日志
+UPDATE_LOCK_SLOW_MS = int(os.getenv('UPDATE_LOCK_SLOW_MS', '2000'))
+
+
+class _KeyedLock:
+    __slots__ = ('lock', 'refs')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class KeyedLockManager:
+    """按键（聊天、用户）分配的异步锁，带等待时间统计
+
+    asyncio.Lock 按先来先得唤醒等待者，同一个键上的更新按调用 acquire 的顺序执行。
+    没有持有者和等待者的锁会被释放，不会随聊天数量无限增长。
+    """
+
+    def __init__(self, slow_ms: int = UPDATE_LOCK_SLOW_MS):
+        self.slow_ms = slow_ms
+        self._locks: Dict[Hashable, _KeyedLock] = {}
+        self.acquisitions = 0
+        self.contended = 0
+        self.slow_waits = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+
+    @asynccontextmanager
+    async def hold(self, keys: List[Hashable]):
+        """按顺序获取多个键的锁（调用方需保证所有调用使用相同的键顺序）"""
+        entries = []
+        for key in keys:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = _KeyedLock()
+            entry.refs += 1
+            entries.append((key, entry))
+
+        acquired = []
+        try:
+            for key, entry in entries:
+                await self._acquire(key, entry)
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in reversed(acquired):
+                entry.lock.release()
+            for key, entry in entries:
+                entry.refs -= 1
+                if entry.refs == 0:
+                    self._locks.pop(key, None)
+
+    async def _acquire(self, key: Hashable, entry: _KeyedLock):
+        self.acquisitions += 1
+        if not entry.lock.locked():
+            await entry.lock.acquire()
+            return
+
+        self.contended += 1
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.monotonic()
+        try:
+            await entry.lock.acquire()
+        finally:
+            self.waiting -= 1
+        waited_ms = (time.monotonic() - started) * 1000
+        self.wait_ms_total += waited_ms
+        self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+        if waited_ms >= self.slow_ms:
+            self.slow_waits += 1
+            logger.warning(f"更新等待锁 {key} 耗时 {waited_ms:.0f}ms")
+
+    def stats(self) -> Dict:
+        """获取锁等待统计信息"""
+        return {
+            'active_keys': len(self._locks),
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'slow_waits': self.slow_waits,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'avg_wait_ms': round(self.wait_ms_total / self.contended, 2) if self.contended else 0.0,
+            'max_wait_ms': round(self.max_wait_ms, 2),
+        }
+
+
+def update_lock_keys(update: object) -> List[Hashable]:
+    """更新需要持有的锁：先聊天后用户（固定顺序，避免死锁）"""
+    if not isinstance(update, Update):
+        return []
+    keys = []
+    chat = update.effective_chat
+    user = update.effective_user
+    if chat:
+        keys.append(('chat', chat.id))
+    # 私聊也要持有用户锁：同一用户在群组和私聊中的更新共用 context.user_data
+    if user:
+        keys.append(('user', user.id))
+    return keys
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """并发处理更新，同一聊天、同一用户的更新按顺序执行"""
+
+    def __init__(self, max_concurrency: int = UPDATE_MAX_CONCURRENCY,
+                 max_pending: int = UPDATE_MAX_PENDING):
+        super().__init__(max(max_pending, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.locks = KeyedLockManager()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.processed = 0
+        self.running = 0
+        self.max_running = 0
+        self.slot_waits = 0
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def shutdown(self) -> None:
+        logger.info(f"更新处理统计: {self.stats()}")
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        started = False
+        try:
+            async with self.locks.hold(update_lock_keys(update)):
+                if self._slots.locked():
+                    self.slot_waits += 1
+                async with self._slots:
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                    started = True
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+        finally:
+            # 等锁期间被取消（如停止机器人）时关闭未执行的协程，避免 "never awaited" 警告
+            if not started and asyncio.iscoroutine(coroutine):
+                coroutine.close()
+
+    def stats(self) -> Dict:
+        """获取更新处理统计信息（执行名额和锁等待）"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'processed': self.processed,
+            'running': self.running,
+            'max_running': self.max_running,
+            'slot_waits': self.slot_waits,
+            'locks': self.locks.stats(),
+        }
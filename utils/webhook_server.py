@@ -0,0 +1,319 @@
+"""Webhook 运行模式
+
+设置 BOT_RUN_MODE=webhook 时，机器人不再长轮询，而是启动一个内置的 HTTP 服务
+接收 Telegram 推送的更新（不依赖额外的 Web 框架）：
+
+- POST {WEBHOOK_PATH}：支持 Content-Length 和 chunked 请求体，校验 X-Telegram-Bot-Api-Secret-Token 后把更新放入 update_queue
+- GET/HEAD {WEBHOOK_HEALTH_PATH}：健康检查，返回 JSON 状态（供负载均衡探活）
+
+部署在负载均衡/反向代理之后时由代理终止 TLS，服务本身监听 HTTP；
+直接对外时可通过 WEBHOOK_TLS_CERT / WEBHOOK_TLS_KEY 启用 HTTPS。
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import ssl
+import time
+from typing import Dict, Optional, Tuple
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# 运行模式：polling（默认）或 webhook
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling').strip().lower()
+# 对外的 Webhook 地址（如 https://xxx.zeabur.app），为空时不向 Telegram 注册（本地测试）
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = '/' + os.getenv('WEBHOOK_PATH', '/telegram/webhook').lstrip('/')
+WEBHOOK_HEALTH_PATH = '/' + os.getenv('WEBHOOK_HEALTH_PATH', '/healthz').lstrip('/')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+# Zeabur 等平台通过 PORT 指定监听端口
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+# Telegram 推送时携带的密钥（1-256 位字母、数字、_、-），为空时每次启动随机生成
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+# 直接对外提供 HTTPS 时的证书和私钥路径（TLS 由代理终止时留空）
+WEBHOOK_TLS_CERT = os.getenv('WEBHOOK_TLS_CERT', '')
+WEBHOOK_TLS_KEY = os.getenv('WEBHOOK_TLS_KEY', '')
+# Telegram 同时推送的最大连接数（1-100）
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# 单个请求体的最大字节数
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv('WEBHOOK_MAX_BODY_BYTES', str(1024 * 1024)))
+
+_SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+_MAX_HEADER_BYTES = 16 * 1024
+_KEEPALIVE_TIMEOUT = 75
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large', 501: 'Not Implemented',
+            503: 'Service Unavailable'}
+
+
+def is_webhook_mode() -> bool:
+    """是否以 Webhook 模式运行"""
+    return BOT_RUN_MODE == 'webhook'
+
+
+class WebhookServer:
+    """接收 Telegram 推送的最小 HTTP/1.1 服务（支持 keep-alive）"""
+
+    def __init__(self, application: Application, secret_token: str,
+                 listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, health_path: str = WEBHOOK_HEALTH_PATH,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 max_body_bytes: int = WEBHOOK_MAX_BODY_BYTES):
+        self.application = application
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.health_path = health_path
+        self.ssl_context = ssl_context
+        self.max_body_bytes = max_body_bytes
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.started_at = time.monotonic()
+        self.updates_received = 0
+        self.rejected = 0
+        self.last_update_at: Optional[float] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.listen, self.port,
+            ssl=self.ssl_context, limit=_MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        scheme = 'https' if self.ssl_context else 'http'
+        logger.info(f"Webhook 服务已启动: {scheme}://{self.listen}:{self.port}{self.path}，"
+                    f"健康检查 {self.health_path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body, error = request
+                if error:
+                    status, payload = error, {'ok': False}
+                else:
+                    status, payload = await self._dispatch(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and not error
+                self._write_response(writer, status, payload, head=(method == 'HEAD'),
+                                     keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"处理 Webhook 连接出错: {e}", exc_info=True)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader
+                            ) -> Optional[Tuple[str, str, Dict[str, str], bytes, Optional[int]]]:
+        """读取一个请求，连接关闭时返回 None"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), _KEEPALIVE_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            return None
+        except asyncio.LimitOverrunError:
+            return 'GET', '', {}, b'', 400
+
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3:
+            return 'GET', '', {}, b'', 400
+        method, target, _ = parts
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        path = target.split('?', 1)[0]
+        transfer_encoding = headers.get('transfer-encoding')
+        if transfer_encoding is not None:
+            # 只支持 chunked；同时带 Content-Length 的请求有歧义，直接拒绝
+            if transfer_encoding.lower() != 'chunked':
+                return method, path, headers, b'', 501
+            if 'content-length' in headers:
+                return method, path, headers, b'', 400
+            body, error = await self._read_chunked_body(reader)
+            return method, path, headers, body, error
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            return method, path, headers, b'', 400
+        if length < 0:
+            return method, path, headers, b'', 400
+        if length > self.max_body_bytes:
+            return method, path, headers, b'', 413
+        body = await asyncio.wait_for(reader.readexactly(length), _KEEPALIVE_TIMEOUT) if length else b''
+        return method, path, headers, body, None
+
+    async def _read_chunked_body(self, reader: asyncio.StreamReader) -> Tuple[bytes, Optional[int]]:
+        """读取 chunked 编码的请求体，返回 (请求体, 错误状态码)"""
+        try:
+            return await self._read_chunks(reader)
+        except asyncio.LimitOverrunError:
+            return b'', 400
+
+    async def _read_chunks(self, reader: asyncio.StreamReader) -> Tuple[bytes, Optional[int]]:
+        chunks = []
+        total = 0
+        while True:
+            line = await asyncio.wait_for(reader.readuntil(b'\r\n'), _KEEPALIVE_TIMEOUT)
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                return b'', 400
+            if size < 0:
+                return b'', 400
+            if size == 0:
+                break
+            total += size
+            if total > self.max_body_bytes:
+                return b'', 413
+            data = await asyncio.wait_for(reader.readexactly(size + 2), _KEEPALIVE_TIMEOUT)
+            if data[-2:] != b'\r\n':
+                return b'', 400
+            chunks.append(data[:-2])
+        # 跳过 trailer，直到空行
+        while True:
+            line = await asyncio.wait_for(reader.readuntil(b'\r\n'), _KEEPALIVE_TIMEOUT)
+            if line == b'\r\n':
+                break
+        return b''.join(chunks), None
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str],
+                        body: bytes) -> Tuple[int, Dict]:
+        if path == self.health_path:
+            if method not in ('GET', 'HEAD'):
+                return 405, {'ok': False}
+            return self._health()
+
+        if path != self.path:
+            return 404, {'ok': False}
+        if method != 'POST':
+            return 405, {'ok': False}
+
+        token = headers.get(_SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            logger.warning("拒绝 Webhook 请求：密钥不匹配")
+            return 403, {'ok': False}
+
+        try:
+            data = json.loads(body)
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"无法解析 Webhook 更新: {e}")
+            return 400, {'ok': False}
+        if update is None:
+            return 400, {'ok': False}
+
+        await self.application.update_queue.put(update)
+        self.updates_received += 1
+        self.last_update_at = time.monotonic()
+        return 200, {'ok': True}
+
+    def _health(self) -> Tuple[int, Dict]:
+        running = self.application.running
+        now = time.monotonic()
+        payload = {
+            'ok': running,
+            'mode': 'webhook',
+            'uptime_s': round(now - self.started_at),
+            'updates_received': self.updates_received,
+            'rejected': self.rejected,
+            'update_queue': self.application.update_queue.qsize(),
+            'last_update_age_s': round(now - self.last_update_at) if self.last_update_at else None,
+        }
+        return (200 if running else 503), payload
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload: Dict,
+                        head: bool = False, keep_alive: bool = True):
+        body = json.dumps(payload).encode()
+        lines = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        if not head:
+            writer.write(body)
+
+
+def _build_ssl_context() -> Optional[ssl.SSLContext]:
+    if not WEBHOOK_TLS_CERT:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(WEBHOOK_TLS_CERT, WEBHOOK_TLS_KEY or None)
+    return context
+
+
+async def _serve(application: Application):
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    if not WEBHOOK_SECRET_TOKEN and not WEBHOOK_URL:
+        logger.warning("未设置 WEBHOOK_SECRET_TOKEN，本地测试客户端无法通过密钥校验")
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows 不支持 add_signal_handler，依赖 KeyboardInterrupt 退出
+            pass
+
+    server = WebhookServer(application, secret_token, ssl_context=_build_ssl_context())
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            logger.info(f"已向 Telegram 注册 Webhook: {WEBHOOK_URL}{WEBHOOK_PATH}")
+        else:
+            logger.warning("未设置 WEBHOOK_URL，跳过 Webhook 注册（仅用于本地测试）")
+
+        await application.start()
+        await server.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            if application.running:
+                await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application: Application):
+    """以 Webhook 模式运行机器人（阻塞直到收到 SIGINT/SIGTERM）"""
+    # 与 run_polling 一样使用默认事件循环（Application 的队列在创建时已绑定该循环）
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_serve(application))